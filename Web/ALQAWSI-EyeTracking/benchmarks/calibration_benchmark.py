@@ -0,0 +1,124 @@
+"""
+Compares Calibration.find_best_threshold with the original 19-pass sweep.
+
+It reports how long each one takes, and the mismatches between the two on
+the given crops; tests/test_calibration.py checks them on random crops.
+
+Usage:
+    python benchmarks/calibration_benchmark.py [folder of grayscale eye crops]
+"""
+import os  # To handle file paths
+import sys  # To read the command line arguments
+import time  # To measure the duration of each implementation
+import cv2  # For image loading and drawing
+import numpy as np  # For numerical operations
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.calibration import Calibration  # noqa: E402
+
+
+def reference_best_threshold(eye_frame):
+    """The original implementation: one full image processing per threshold.
+
+    It is inlined rather than calling Pupil and Calibration, which now share
+    the optimized code.
+
+    Args:
+        eye_frame (numpy.ndarray): The image of the eye to analyze
+    """
+    average_iris_size = 0.48
+    kernel = np.ones((3, 3), np.uint8)
+    trials = {}
+    for threshold in range(5, 100, 5):
+        iris_frame = cv2.bilateralFilter(eye_frame, 10, 15, 15)
+        iris_frame = cv2.erode(iris_frame, kernel, iterations=3)
+        iris_frame = cv2.threshold(iris_frame, threshold, 255, cv2.THRESH_BINARY)[1][5:-5, 5:-5]
+        nb_pixels = iris_frame.size
+        trials[threshold] = (nb_pixels - cv2.countNonZero(iris_frame)) / nb_pixels
+    best_threshold, iris_size = min(trials.items(), key=(lambda p: abs(p[1] - average_iris_size)))
+    return best_threshold
+
+
+def synthetic_eye_crops(count, seed=0, noise_only=0.0):
+    """Draws grayscale eye crops with a dark iris and pupil at a known position.
+
+    The eye is white around its outline, like Eye._isolate leaves it. This is
+    the one generator of eye crops of the benchmarks and of the tests.
+
+    Args:
+        count (int): Number of crops to draw
+        seed (int): Seed of the random generator
+        noise_only (float): Fraction of the crops that are pure noise, with no eye
+
+    Returns:
+        list: (crop, (x, y)) pairs, with the true center of the pupil (None for pure noise)
+    """
+    rng = np.random.RandomState(seed)
+    crops = []
+    for _ in range(count):
+        width, height = rng.randint(30, 70), rng.randint(18, 36)
+        if rng.rand() < noise_only:
+            crops.append((rng.randint(0, 256, (height, width)).astype(np.uint8), None))
+            continue
+
+        crop = np.full((height, width), 255, np.uint8)
+        cv2.ellipse(crop, (width // 2, height // 2), (width // 2 - 5, height // 2 - 5), 0, 0, 360,
+                    int(rng.randint(150, 230)), -1)
+
+        # Draw at 16x precision so the true center isn't rounded to a pixel
+        center = (rng.uniform(width * 0.35, width * 0.65), rng.uniform(height * 0.4, height * 0.6))
+        fixed = (int(center[0] * 16), int(center[1] * 16))
+        radius = rng.randint(max(height // 4, 5), max(height // 2, 6))
+        cv2.circle(crop, fixed, radius * 16, int(rng.randint(40, 110)), -1, cv2.LINE_AA, 4)  # Iris
+        cv2.circle(crop, fixed, radius * 8, int(rng.randint(5, 40)), -1, cv2.LINE_AA, 4)  # Pupil
+
+        noise = rng.normal(0, rng.uniform(2, 12), crop.shape)
+        crops.append((np.clip(crop + noise, 0, 255).astype(np.uint8), center))
+    return crops
+
+
+def load_eye_crops(folder):
+    """Loads every image or .npy array of a folder as a grayscale eye crop.
+
+    Args:
+        folder (str): Folder containing the recorded eye crops
+    """
+    crops = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.endswith(".npy"):
+            crops.append(np.load(path).astype(np.uint8))
+        else:
+            crop = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if crop is not None:
+                crops.append(crop)
+    return crops
+
+
+def main():
+    if len(sys.argv) > 1:
+        crops = load_eye_crops(sys.argv[1])
+    else:
+        crops = [crop for crop, _ in synthetic_eye_crops(500, noise_only=0.2)]
+
+    start = time.perf_counter()
+    expected = [reference_best_threshold(crop) for crop in crops]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = [Calibration.find_best_threshold(crop) for crop in crops]
+    single_pass_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, found) if a != b)
+    print("Eye crops:          {}".format(len(crops)))
+    print("Mismatches:         {}".format(mismatches))
+    print("Sweep (19 passes):  {:.2f} ms/crop".format(1000 * reference_time / len(crops)))
+    print("Single pass:        {:.2f} ms/crop".format(1000 * single_pass_time / len(crops)))
+    print("Speedup:            {:.1f}x".format(reference_time / single_pass_time))
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
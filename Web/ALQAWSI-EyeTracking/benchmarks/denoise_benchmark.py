@@ -0,0 +1,95 @@
+"""
+Benchmarks the denoise filters of the pupil detection, one crop at a time
+and in batches.
+
+For each filter of gaze_tracking.pupil.DENOISERS it reports the error of the
+pupil positions (against the true centers of synthetic crops, or against the
+bilateral filter on recorded crops), the time per crop with Pupil, and the
+speedup of PupilBatch on all the crops at once (offline) and on the two eyes
+of a frame (live). The batch positions are checked against Pupil's.
+
+Usage:
+    python benchmarks/denoise_benchmark.py [folder of grayscale eye crops] [--method weighted_centroid]
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import sys  # To import the package
+import time  # To measure the durations
+import cv2  # For the number of threads
+import numpy as np  # For numerical operations
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from calibration_benchmark import load_eye_crops, synthetic_eye_crops  # noqa: E402
+from gaze_tracking.calibration import Calibration  # noqa: E402
+from gaze_tracking.locators import LOCATORS  # noqa: E402
+from gaze_tracking.pupil import DENOISERS, Pupil, PupilBatch  # noqa: E402
+from pupil_benchmark import errors  # noqa: E402
+
+
+def best_time(function, repeat=3):
+    """Gives the shortest duration of a few runs of the function"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def single_positions(crops, thresholds, method, denoise):
+    """Locates the pupils one crop at a time"""
+    positions = []
+    for crop, threshold in zip(crops, thresholds):
+        pupil = Pupil(crop, threshold, method, True, denoise)
+        positions.append(None if pupil.x is None else (pupil.x, pupil.y))
+    return positions
+
+
+def live_batches(crops, thresholds, method, denoise):
+    """Locates the pupils two crops at a time, like the two eyes of each frame"""
+    positions = []
+    for start in range(0, len(crops), 2):
+        positions.extend(PupilBatch(crops[start:start + 2], thresholds[start:start + 2], method, True,
+                                    denoise).positions)
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the denoise filters and the batched pupil detection.")
+    parser.add_argument("crops", nargs="?", help="Folder of recorded eye crops (default: synthetic crops)")
+    parser.add_argument("--count", type=int, default=1000, help="Number of synthetic crops")
+    parser.add_argument("--method", default="contours", choices=sorted(LOCATORS), help="Pupil localisation")
+    args = parser.parse_args()
+
+    if args.crops:
+        crops, truth = load_eye_crops(args.crops), None
+    else:
+        drawn = synthetic_eye_crops(args.count)
+        crops, truth = [crop for crop, _ in drawn], [center for _, center in drawn]
+
+    thresholds = {denoise: [Calibration.find_best_threshold(crop, denoise=denoise) for crop in crops]
+                  for denoise in DENOISERS}
+    reference = single_positions(crops, thresholds["bilateral"], args.method, "bilateral")
+    print("{} crops, {} method, {} OpenCV threads".format(len(crops), args.method, cv2.getNumThreads()))
+
+    print("\n{:<16} {:>12} {:>12} {:>12} {:>9} {:>9} {:>8} {:>8}".format(
+        "filter", "err (truth)", "p90 (truth)", "vs bilateral", "failures", "us/crop", "offline", "live"))
+    for denoise in DENOISERS:
+        chosen = thresholds[denoise]
+        positions = single_positions(crops, chosen, args.method, denoise)
+        assert PupilBatch(crops, chosen, args.method, True, denoise).positions == positions
+        assert live_batches(crops, chosen, args.method, denoise) == positions
+
+        seconds = best_time(lambda: single_positions(crops, chosen, args.method, denoise))
+        offline = best_time(lambda: PupilBatch(crops, chosen, args.method, True, denoise))
+        live = best_time(lambda: live_batches(crops, chosen, args.method, denoise))
+        to_bilateral, failures = errors(positions, reference)
+        to_truth = errors(positions, truth)[0] if truth else [float("nan")]
+        print("{:<16} {:>12.2f} {:>12.2f} {:>12.2f} {:>9} {:>9.1f} {:>7.2f}x {:>7.2f}x".format(
+            denoise, np.mean(to_truth), np.percentile(to_truth, 90), np.mean(to_bilateral), failures,
+            seconds / len(crops) * 1e6, seconds / offline, seconds / live))
+
+
+if __name__ == "__main__":
+    main()
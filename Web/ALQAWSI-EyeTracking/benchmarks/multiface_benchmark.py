@@ -0,0 +1,58 @@
+"""
+Compares MultiGazeTracking on a shared camera with one GazeTracking per person.
+
+The frames of a recorded single-person session are tiled side by side to
+build frames with N faces. MultiGazeTracking analyzes the tiled frames, while
+N separate trackers each analyze the original frames, as if every student
+had their own camera.
+
+Usage:
+    python benchmarks/multiface_benchmark.py session.mp4 [--faces 1 2 4] [--threads 4]
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import sys  # To import the package
+import time  # To measure the throughput
+import numpy as np  # To tile the frames
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.batch import iter_frames  # noqa: E402
+from gaze_tracking.gaze_tracking import GazeTracking  # noqa: E402
+from gaze_tracking.multi import MultiGazeTracking  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the multi-face analysis.")
+    parser.add_argument("video", help="Recorded session with one person")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 2, 4], help="Numbers of faces to test")
+    parser.add_argument("--threads", type=int, default=None, help="Threads of MultiGazeTracking")
+    parser.add_argument("--count", type=int, default=200, help="Number of frames")
+    args = parser.parse_args()
+
+    frames = [frame for _, _, frame in iter_frames(args.video, 0, args.count)]
+    print("{:>6} {:>16} {:>16} {:>9} {:>14}".format("faces", "separate fps", "shared fps", "speedup",
+                                                    "faces found"))
+
+    for count in args.faces:
+        trackers = [GazeTracking(history_size=0) for _ in range(count)]
+        start = time.perf_counter()
+        for frame in frames:
+            for tracker in trackers:
+                tracker.refresh(frame)
+        separate = len(frames) / (time.perf_counter() - start)
+
+        tiled = [np.hstack([frame] * count) for frame in frames]
+        found = 0
+        with MultiGazeTracking(threads=args.threads) as multi:
+            start = time.perf_counter()
+            for frame in tiled:
+                found += len(multi.refresh(frame))
+            shared = len(tiled) / (time.perf_counter() - start)
+
+        print("{:>6} {:>16.1f} {:>16.1f} {:>8.2f}x {:>14.2f}".format(
+            count, separate, shared, shared / separate, found / len(tiled)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Reproducible benchmark of the gaze pipeline.
+
+It runs the analysis on the same frames at several resolutions and reports
+the latency percentiles of each stage (from gaze_tracking.profiler) and the
+throughput. The frames are recorded ones (a video or a folder of images) or,
+by default, synthetic faces drawn from a fixed seed.
+
+Two suites are run:
+    eyes   Eye isolation, calibration and pupil detection from fixed landmarks
+    full   GazeTracking.refresh(), with face detection and landmarks (needs dlib and its model)
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--frames video.mp4] [--json results.json]
+    python benchmarks/pipeline_benchmark.py --baseline results.json --tolerance 0.2
+"""
+import argparse  # To read the command line arguments
+import json  # For the results and the baseline
+import os  # To handle file paths
+import sys  # To exit with an error on regressions
+import time  # To measure the throughput
+import cv2  # For drawing, reading and resizing the frames
+import numpy as np  # For numerical operations
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.calibration import Calibration  # noqa: E402
+from gaze_tracking.eye import Eye, EyeBuffer  # noqa: E402
+from gaze_tracking.profiler import PROFILER  # noqa: E402
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+BASE_SIZE = (640, 480)  # Size at which the synthetic faces are drawn
+
+
+def synthetic_face(seed):
+    """Draws a grayscale face with open eyes, and gives its 68 landmarks.
+
+    Only the eye landmarks (36 to 47) follow the drawing, the other points
+    stay at the center of the face.
+
+    Args:
+        seed (int): Seed of the random generator
+    """
+    rng = np.random.RandomState(seed)
+    width, height = BASE_SIZE
+    frame = np.full((height, width), 90, np.uint8)
+    center = (width // 2 + rng.randint(-20, 20), height // 2 + rng.randint(-20, 20))
+    cv2.ellipse(frame, center, (130, 170), 0, 0, 360, 170, -1)
+
+    landmarks = np.tile(np.array(center, np.int32), (68, 1))
+    for side, first in ((-1, 36), (1, 42)):
+        eye_center = (center[0] + side * 55, center[1] - 40)
+        cv2.ellipse(frame, eye_center, (28, 13), 0, 0, 360, 230, -1)
+        pupil = (eye_center[0] + rng.randint(-10, 10), eye_center[1] + rng.randint(-3, 3))
+        cv2.circle(frame, pupil, 9, 50, -1)
+        cv2.circle(frame, pupil, 4, 15, -1)
+
+        # Corner, two upper points, corner, two lower points, like dlib
+        for index, (dx, dy) in enumerate([(-28, 0), (-10, -12), (10, -12), (28, 0), (10, 12), (-10, 12)]):
+            landmarks[first + index] = (eye_center[0] + dx, eye_center[1] + dy)
+
+    noise = rng.normal(0, 6, frame.shape)
+    frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+    return frame, landmarks
+
+
+def load_frames(source, limit):
+    """Reads the frames of a video or a folder of images, as BGR images"""
+    if os.path.isdir(source):
+        names = sorted(os.listdir(source))[:limit]
+        frames = [cv2.imread(os.path.join(source, name)) for name in names]
+        return [frame for frame in frames if frame is not None]
+
+    frames = []
+    video = cv2.VideoCapture(source)
+    while len(frames) < limit:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frames.append(frame)
+    video.release()
+    return frames
+
+
+def resize(frame, size):
+    """Resizes a frame to the given (width, height)"""
+    return cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+
+
+def run_suite(name, resolution, count, step):
+    """Runs step() count times with the profiler enabled.
+
+    Returns:
+        dict: The throughput and the per-stage summary of the profiler
+    """
+    PROFILER.reset()
+    PROFILER.enable()
+    start = time.perf_counter()
+    for index in range(count):
+        step(index)
+    elapsed = time.perf_counter() - start
+    PROFILER.disable()
+
+    summary = PROFILER.summary()
+    print("\n[{} {}] {} frames, {:.1f} fps".format(name, resolution, count, count / elapsed))
+    print(PROFILER.format_summary())
+    return {"fps": count / elapsed, "stages": summary["stages"], "counters": summary["counters"]}
+
+
+def eyes_suite(resolution, size, frames):
+    """Benchmarks the eye and pupil stages on synthetic faces, without dlib"""
+    scale = size[0] / BASE_SIZE[0]
+    faces = []
+    for frame, landmarks in frames:
+        faces.append((resize(frame, size), np.round(landmarks * scale).astype(np.int32)))
+
+    calibration = Calibration()
+    buffers = (EyeBuffer(), EyeBuffer())
+
+    def step(index):
+        frame, landmarks = faces[index % len(faces)]
+        Eye.pair(frame, landmarks, calibration, buffers)
+        PROFILER.end_frame()
+
+    return run_suite("eyes", resolution, len(faces) * 5, step)
+
+
+def full_suite(resolution, size, frames, tracker_options):
+    """Benchmarks GazeTracking.refresh() on BGR frames"""
+    from gaze_tracking.gaze_tracking import GazeTracking
+
+    gaze = GazeTracking(**tracker_options)
+    resized = [resize(frame, size) for frame in frames]
+
+    def step(index):
+        gaze.refresh(resized[index % len(resized)])
+
+    return run_suite("full", resolution, len(resized), step)
+
+
+def compare(results, baseline, tolerance):
+    """Lists the stages whose median latency grew more than the tolerance"""
+    regressions = []
+    for key, result in results.items():
+        for stage, timing in result["stages"].items():
+            reference = baseline.get(key, {}).get("stages", {}).get(stage)
+            if reference and timing["p50_ms"] > reference["p50_ms"] * (1 + tolerance):
+                regressions.append("{} {}: p50 {:.3f} ms (baseline {:.3f} ms)".format(
+                    key, stage, timing["p50_ms"], reference["p50_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gaze pipeline.")
+    parser.add_argument("--frames", help="Video or folder of recorded frames (default: synthetic faces)")
+    parser.add_argument("--count", type=int, default=100, help="Number of frames per resolution")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--suites", nargs="+", default=["eyes", "full"], choices=["eyes", "full"])
+    parser.add_argument("--redetect-interval", type=int, default=1, help="GazeTracking option")
+    parser.add_argument("--detection-scale", type=float, default=1.0, help="GazeTracking option")
+    parser.add_argument("--json", help="Save the results in this file")
+    parser.add_argument("--baseline", help="Compare with the results saved in this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed growth of the median latency")
+    args = parser.parse_args()
+
+    synthetic = [synthetic_face(seed) for seed in range(args.count)]
+    if args.frames:
+        recorded = load_frames(args.frames, args.count)
+    else:
+        recorded = [cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR) for frame, _ in synthetic]
+    tracker_options = {"redetect_interval": args.redetect_interval, "detection_scale": args.detection_scale}
+
+    results = {}
+    for resolution in args.resolutions:
+        size = RESOLUTIONS[resolution]
+        if "eyes" in args.suites:
+            results["eyes " + resolution] = eyes_suite(resolution, size, synthetic)
+        if "full" in args.suites:
+            results["full " + resolution] = full_suite(resolution, size, recorded, tracker_options)
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
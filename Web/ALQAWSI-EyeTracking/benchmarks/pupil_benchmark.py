@@ -0,0 +1,90 @@
+"""
+Compares the pupil localisation strategies of gaze_tracking.locators.
+
+On synthetic eye crops, where the true pupil center is known, it reports
+the error and the failures of each strategy. On recorded eye crops, it
+reports how far each strategy lands from the original contour method.
+In both cases it reports the time per crop.
+
+Usage:
+    python benchmarks/pupil_benchmark.py [folder of grayscale eye crops] [--threshold 40]
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import sys  # To import the package
+import time  # To measure the duration of each strategy
+import cv2  # For binarizing the crops
+import numpy as np  # For numerical operations
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from calibration_benchmark import load_eye_crops, synthetic_eye_crops  # noqa: E402
+from gaze_tracking.calibration import Calibration  # noqa: E402
+from gaze_tracking.locators import LOCATORS  # noqa: E402
+from gaze_tracking.pupil import Pupil  # noqa: E402
+
+
+def prepare(crops, threshold):
+    """Denoises and binarizes every crop, like Pupil.detect_iris() does.
+
+    Returns:
+        list: (denoised, iris_frame, threshold) for every crop
+    """
+    prepared = []
+    for crop in crops:
+        crop_threshold = threshold if threshold else Calibration.find_best_threshold(crop)
+        denoised = Pupil.denoise(crop)
+        iris_frame = cv2.threshold(denoised, crop_threshold, 255, cv2.THRESH_BINARY)[1]
+        prepared.append((denoised, iris_frame, crop_threshold))
+    return prepared
+
+
+def run(prepared, method, subpixel):
+    """Locates the pupil of every prepared crop with a strategy.
+
+    Returns:
+        tuple: The positions (None when not found) and the seconds per crop spent in the strategy
+    """
+    locate = LOCATORS[method]
+    start = time.perf_counter()
+    positions = [locate(denoised, iris_frame, threshold, subpixel) for denoised, iris_frame, threshold in prepared]
+    return positions, (time.perf_counter() - start) / len(prepared)
+
+
+def errors(positions, references):
+    """Gives the distances to the references, and the number of failures"""
+    distances = [np.hypot(p[0] - r[0], p[1] - r[1]) for p, r in zip(positions, references)
+                 if p is not None and r is not None]
+    return distances, sum(1 for p in positions if p is None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pupil localisation strategies.")
+    parser.add_argument("crops", nargs="?", help="Folder of recorded eye crops (default: synthetic crops)")
+    parser.add_argument("--count", type=int, default=1000, help="Number of synthetic crops")
+    parser.add_argument("--threshold", type=int, default=0, help="Binarization threshold (0 to calibrate each crop)")
+    args = parser.parse_args()
+
+    if args.crops:
+        prepared = prepare(load_eye_crops(args.crops), args.threshold)
+        references, reference_name = run(prepared, "contours", True)[0], "contours"
+    else:
+        drawn = synthetic_eye_crops(args.count)
+        prepared = prepare([crop for crop, _ in drawn], args.threshold)
+        references, reference_name = [center for _, center in drawn], "truth"
+
+    print("{} crops, errors in pixels against {}".format(len(prepared), reference_name))
+    print("{:<22} {:>8} {:>10} {:>10} {:>9} {:>9}".format("method", "subpixel", "mean err", "p90 err",
+                                                          "failures", "ms/crop"))
+    for method in sorted(LOCATORS):
+        for subpixel in (False, True):
+            positions, seconds = run(prepared, method, subpixel)
+            distances, failures = errors(positions, references)
+            mean = np.mean(distances) if distances else float("nan")
+            p90 = np.percentile(distances, 90) if distances else float("nan")
+            print("{:<22} {:>8} {:>10.2f} {:>10.2f} {:>9} {:>9.3f}".format(
+                method, "yes" if subpixel else "no", mean, p90, failures, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
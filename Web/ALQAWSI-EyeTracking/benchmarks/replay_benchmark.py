@@ -0,0 +1,68 @@
+"""
+Benchmark of the scoring of a recorded session.
+
+A session of synthetic faces is analyzed once (eye isolation, calibration
+and pupils, without dlib) and recorded. Then it is scored again with the
+default thresholds, both frame by frame with GazeSample.from_eyes, as the
+live analysis does, and all at once with Replay.score().
+
+Usage:
+    python benchmarks/replay_benchmark.py [--frames 9000]
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import sys  # To import the package
+import tempfile  # For the recording
+import time  # For the timings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.calibration import Calibration  # noqa: E402
+from gaze_tracking.eye import Eye  # noqa: E402
+from gaze_tracking.recording import LandmarkRecorder, Replay  # noqa: E402
+from gaze_tracking.sample import GazeSample  # noqa: E402
+from pipeline_benchmark import synthetic_face  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the replay of a recording.")
+    parser.add_argument("--frames", type=int, default=9000, help="Frames of the session (9000 is 5 minutes)")
+    parser.add_argument("--faces", type=int, default=100, help="Different synthetic faces in the session")
+    args = parser.parse_args()
+
+    faces = [synthetic_face(seed) for seed in range(args.faces)]
+    calibration = Calibration()
+    eyes = []
+    start = time.perf_counter()
+    for index in range(args.frames):
+        frame, landmarks = faces[index % len(faces)]
+        eyes.append((landmarks, Eye.pair(frame, landmarks, calibration)))
+    analysis = time.perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(), "session.gazerec")
+    start = time.perf_counter()
+    with LandmarkRecorder(path) as recorder:
+        for index, (landmarks, (eye_left, eye_right)) in enumerate(eyes):
+            recorder.record(index / 30, landmarks, eye_left, eye_right)
+    recording = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for index, (_, (eye_left, eye_right)) in enumerate(eyes):
+        GazeSample.from_eyes(eye_left, eye_right, index / 30)
+    per_frame = time.perf_counter() - start
+
+    start = time.perf_counter()
+    replay = Replay(path)
+    Replay.summary(replay.score())
+    vectorized = time.perf_counter() - start
+
+    print("{} frames, recording of {:.1f} KB".format(args.frames, os.path.getsize(path) / 1024))
+    print("eyes and pupils (no dlib)  {:>10.1f} ms".format(analysis * 1000))
+    print("recording                  {:>10.1f} ms".format(recording * 1000))
+    print("scoring frame by frame     {:>10.1f} ms".format(per_frame * 1000))
+    print("replay scoring             {:>10.1f} ms ({:.0f}x)".format(vectorized * 1000, per_frame / vectorized))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Checks that the motion scheduler doesn't miss blink and gaze direction events.
+
+The same recorded video is analyzed twice: once on every frame, once with
+the motion scheduler. The blink onsets and the changes of direction found
+on every frame are the reference; an event counts as missed if the
+scheduled run doesn't have the same event within a few frames. It also
+reports the effective analysis rate and the speed of both runs.
+
+Usage:
+    python benchmarks/scheduler_benchmark.py session.mp4 [--motion-threshold 3] [--latency-budget 0.02]
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import sys  # To import the package and exit with an error
+import time  # To measure the speed of both runs
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.batch import iter_frames  # noqa: E402
+from gaze_tracking.gaze_tracking import GazeTracking  # noqa: E402
+
+
+def events(samples):
+    """Lists the blink onsets and the direction changes of a run, as (frame, kind) pairs"""
+    found = []
+    previous = None
+    for index, sample in enumerate(samples):
+        if previous is not None:
+            if sample.blinking and not previous.blinking:
+                found.append((index, "blink"))
+            if sample.direction is not previous.direction:
+                found.append((index, sample.direction.name))
+        previous = sample
+    return found
+
+
+def missed(reference, scheduled, tolerance):
+    """Lists the reference events without a matching scheduled event within tolerance frames"""
+    by_kind = {}
+    for index, kind in scheduled:
+        by_kind.setdefault(kind, []).append(index)
+    return [(index, kind) for index, kind in reference
+            if not any(abs(index - other) <= tolerance for other in by_kind.get(kind, []))]
+
+
+def run(path, options):
+    """Analyzes every frame of a video, and gives the samples and the frames per second"""
+    gaze = GazeTracking(**options)
+    start = time.perf_counter()
+    samples = [gaze.refresh(frame, timestamp) for _, timestamp, frame in iter_frames(path)]
+    elapsed = time.perf_counter() - start
+    return gaze, samples, len(samples) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the motion scheduler with a full analysis.")
+    parser.add_argument("videos", nargs="+", help="Recorded sessions")
+    parser.add_argument("--motion-threshold", type=float, default=3.0, help="Scheduler motion threshold")
+    parser.add_argument("--latency-budget", type=float, default=None, help="Scheduler latency budget in seconds")
+    parser.add_argument("--tolerance", type=int, default=2, help="Frames an event may be late or early")
+    args = parser.parse_args()
+
+    total_missed = 0
+    for path in args.videos:
+        _, reference, full_fps = run(path, {})
+        gaze, scheduled, scheduled_fps = run(path, {"motion_threshold": args.motion_threshold,
+                                                    "latency_budget": args.latency_budget})
+
+        expected = events(reference)
+        lost = missed(expected, events(scheduled), args.tolerance)
+        total_missed += len(lost)
+
+        print("{}: {} frames, analysis rate {:.0%}, {:.1f} fps -> {:.1f} fps".format(
+            path, len(reference), gaze.analysis_rate(), full_fps, scheduled_fps))
+        print("  events: {}, missed: {} {}".format(len(expected), len(lost), lost[:10] if lost else ""))
+
+    return 1 if total_missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Measures the cold start time and the memory of N trackers in one process,
+and of N forked workers.
+
+Each measure runs in a new Python process. The "separate" mode loads one
+detector and one predictor per tracker, like GazeTracking did before the
+model registry, and imports OpenCV and dlib with the package like it did;
+the "shared" mode uses gaze_tracking.models and the lazy imports.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--trackers 8] [--workers 4]
+"""
+import argparse  # To read the command line arguments
+import json  # To get the results of the child processes
+import os  # To handle file paths
+import subprocess  # To measure each mode in a new process
+import sys  # For the Python executable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CHILD = r'''
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+
+def memory():
+    """Resident and proportional set sizes of this process, in MB (Linux)"""
+    sizes = {{}}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                sizes[name] = int(value.split()[0]) / 1024
+    return sizes
+
+start = time.perf_counter()
+import gaze_tracking
+if {mode!r} == "separate":
+    # Like the package before the registry, which imported OpenCV and dlib with it
+    import dlib
+    from gaze_tracking import GazeTracking
+import_time = time.perf_counter() - start
+
+from gaze_tracking import models
+if {mode!r} == "separate":
+    def face_detector():
+        return dlib.get_frontal_face_detector()
+    def landmark_predictor(model_path=models.MODEL_PATH):
+        return dlib.shape_predictor(model_path)
+    models.face_detector, models.landmark_predictor = face_detector, landmark_predictor
+
+start = time.perf_counter()
+from gaze_tracking import GazeTracking  # Lazy in the shared mode: OpenCV is imported with the first tracker
+trackers = [GazeTracking() for _ in range({trackers})]
+create_time = time.perf_counter() - start
+result = {{"import_s": import_time, "create_s": create_time, "memory": memory()}}
+
+if {workers}:
+    # Fork workers that each create their own tracker, and report their memory
+    read_end, write_end = os.pipe()
+    children = []
+    for _ in range({workers}):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            start = time.perf_counter()
+            GazeTracking()
+            report = {{"create_s": time.perf_counter() - start, "memory": memory()}}
+            os.write(write_end, (json.dumps(report) + "\n").encode())
+            os._exit(0)
+        children.append(pid)
+    os.close(write_end)
+    for pid in children:
+        os.waitpid(pid, 0)
+    with os.fdopen(read_end) as reports:
+        result["workers"] = [json.loads(line) for line in reports]
+
+print(json.dumps(result))
+'''
+
+
+def measure(mode, trackers, workers):
+    """Runs one measure in a new process and gives its results"""
+    code = CHILD.format(root=ROOT, mode=mode, trackers=trackers, workers=workers)
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup of GazeTracking.")
+    parser.add_argument("--trackers", type=int, default=8, help="Trackers created in one process")
+    parser.add_argument("--workers", type=int, default=4, help="Forked workers, each with one tracker")
+    args = parser.parse_args()
+
+    for mode in ("separate", "shared"):
+        result = measure(mode, args.trackers, args.workers)
+        print("[{}] import {:.3f} s, {} trackers in {:.2f} s, RSS {:.0f} MB".format(
+            mode, result["import_s"], args.trackers, result["create_s"], result["memory"]["Rss"]))
+
+        workers = result.get("workers", [])
+        if workers:
+            create = max(worker["create_s"] for worker in workers)
+            pss = sum(worker["memory"]["Pss"] for worker in workers)
+            print("[{}] {} forked workers: slowest start {:.2f} s, total PSS {:.0f} MB".format(
+                mode, len(workers), create, pss))
+
+
+if __name__ == "__main__":
+    main()
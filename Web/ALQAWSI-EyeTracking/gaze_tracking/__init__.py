@@ -0,0 +1,38 @@
+"""
+Gaze tracking with a webcam.
+
+The classes are imported on first access, so that importing the package
+stays cheap: OpenCV is imported with the first class, and dlib and its
+models are only loaded when the first GazeTracking is created.
+"""
+import importlib  # To import the submodules on first access
+
+# Public names, and the submodule defining each of them
+_EXPORTS = {
+    "GazeTracking": "gaze_tracking",
+    "MultiGazeTracking": "multi",
+    "GazeSample": "sample",
+    "Direction": "sample",
+    "GazeHistory": "history",
+    "LandmarkRecorder": "recording",
+    "Replay": "recording",
+    "Calibration": "calibration",
+    "Eye": "eye",
+    "Pupil": "pupil",
+    "PupilBatch": "pupil",
+    "PROFILER": "profiler",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    globals()[name] = value  # The next accesses don't go through __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
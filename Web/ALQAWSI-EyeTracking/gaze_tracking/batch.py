@@ -0,0 +1,326 @@
+"""
+Offline analysis of recorded videos.
+
+The frames of each video are split into chunks, and the chunks are analyzed
+in parallel, with one GazeTracking per worker process. The results of every
+frame are saved in a compressed columnar file (.npz), one array per column.
+
+Usage:
+    python -m gaze_tracking.batch session1.mp4 session2.mp4 -o results/ -j 4
+"""
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import argparse  # To read the command line arguments
+import collections  # To find the videos with the same name
+import hashlib  # To tell apart the results of videos with the same name
+import multiprocessing  # To know how the worker processes are started
+import os  # To handle file paths and the number of cores
+import time  # To measure the throughput
+from concurrent.futures import ProcessPoolExecutor  # To analyze chunks in parallel
+import cv2  # For reading the videos
+import numpy as np  # For the columnar results
+from . import models  # Importing the shared dlib models from the same package
+from .gaze_tracking import GazeTracking  # Importing the GazeTracking class from the same package
+from .locators import LOCATORS  # Importing the pupil localisation strategies from the same package
+from .pupil import DENOISERS  # Importing the eye frame filters from the same package
+
+CHUNK_SIZE = 1500  # Number of frames analyzed by a worker in one task
+WARMUP_FRAMES = 20  # Frames analyzed before a chunk to calibrate the tracker, like Calibration.nb_frames
+
+# Columns of the results and their types
+COLUMNS = (
+    ("frame", np.int32),  # Index of the frame in the video
+    ("timestamp", np.float32),  # Position of the frame in the video, in seconds
+    ("left_x", np.float32),  # Coordinates of the left pupil (NaN if not located)
+    ("left_y", np.float32),
+    ("right_x", np.float32),  # Coordinates of the right pupil (NaN if not located)
+    ("right_y", np.float32),
+    ("horizontal", np.float32),  # Horizontal ratio of the gaze (NaN if not located)
+    ("vertical", np.float32),  # Vertical ratio of the gaze (NaN if not located)
+    ("blinking", np.int8),  # 1 if blinking, 0 if not, -1 if the pupils were not located
+)
+
+_tracker = None  # The GazeTracking of the worker process
+
+
+def iter_frames(path, start=0, stop=None):
+    """Reads the frames of a video one by one.
+
+    Seeking in a compressed video can land on another frame than the one
+    asked for, so the position reported after the seek is checked, and the
+    frames are skipped one by one from the beginning when it is wrong.
+
+    Args:
+        path (str): Path of the video
+        start (int): Index of the first frame
+        stop (int): Index after the last frame (None to read until the end)
+
+    Yields:
+        tuple: The index of the frame, its timestamp in seconds and the frame
+    """
+    video = cv2.VideoCapture(path)
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS) or 30.0  # Some containers don't know their frame rate
+        if start:
+            video.set(cv2.CAP_PROP_POS_FRAMES, start)
+            if int(video.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+                video.release()
+                video = cv2.VideoCapture(path)
+                for _ in range(start):
+                    if not video.grab():
+                        return
+
+        index = start
+        while stop is None or index < stop:
+            ok, frame = video.read()
+            if not ok:
+                break
+            yield index, index / fps, frame
+            index += 1
+    finally:
+        video.release()
+
+
+def frame_count(path):
+    """Gives the number of frames of a video, as told by its container.
+
+    The count of a compressed video can be a little off, which is why the
+    last chunk of a video reads until its end (see chunks()).
+    """
+    video = cv2.VideoCapture(path)
+    count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+
+    if count <= 0:
+        # The container doesn't tell, so count the frames
+        count = sum(1 for _ in iter_frames(path))
+    return count
+
+
+def chunks(count, chunk_size=CHUNK_SIZE):
+    """Splits the frames of a video into chunks.
+
+    Args:
+        count (int): Number of frames of the video
+        chunk_size (int): Number of frames per chunk
+
+    Returns:
+        list: The (start, stop) frame indices of each chunk, with no stop for
+            the last one, so that it reads until the end of the video
+    """
+    starts = list(range(0, count, chunk_size))
+    return [(start, stop) for start, stop in zip(starts, starts[1:] + [None])]
+
+
+def sample_row(sample):
+    """Gives the values of the columns of a frame, after its index and timestamp.
+
+    Args:
+        sample (GazeSample): The results of the frame
+    """
+    if not sample.pupils_located:
+        nan = float("nan")
+        return nan, nan, nan, nan, nan, nan, -1
+
+    left_x, left_y = sample.pupil_left
+    right_x, right_y = sample.pupil_right
+    blinking = -1 if sample.blinking is None else int(sample.blinking)
+    return left_x, left_y, right_x, right_y, sample.horizontal_ratio, sample.vertical_ratio, blinking
+
+
+def _init_worker(tracker_options):
+    """Creates the GazeTracking of a worker process"""
+    global _tracker
+    _tracker = GazeTracking(**tracker_options)
+
+
+def _analyze_chunk(path, start, stop, warmup=WARMUP_FRAMES):
+    """Analyzes a chunk of a video in a worker process.
+
+    The tracker starts a new session (calibration, face, history), warmed up
+    on the frames just before the chunk, so each chunk doesn't depend on the
+    previous ones.
+
+    Returns:
+        dict: One array per column
+    """
+    gaze = _tracker
+    gaze.reset()
+
+    rows = []
+    for index, timestamp, frame in iter_frames(path, max(start - warmup, 0), stop):
+        sample = gaze.refresh(frame, timestamp)
+        if index >= start:
+            rows.append((index, timestamp) + sample_row(sample))
+
+    return columns_from_rows(rows)
+
+
+def columns_from_rows(rows):
+    """Converts rows of results to one array per column"""
+    values = list(zip(*rows)) or [()] * len(COLUMNS)
+    return {name: np.asarray(column, dtype) for (name, dtype), column in zip(COLUMNS, values)}
+
+
+def submit_video(path, executor, chunk_size=CHUNK_SIZE):
+    """Submits the chunks of a video to the workers of the executor.
+
+    Args:
+        path (str): Path of the video
+        executor (concurrent.futures.Executor): The pool of workers
+        chunk_size (int): Number of frames per chunk
+
+    Returns:
+        list: The futures of the chunks, in the order of the video
+    """
+    return [executor.submit(_analyze_chunk, path, start, stop)
+            for start, stop in chunks(frame_count(path), chunk_size)]
+
+
+def collect_video(futures):
+    """Waits for the chunks of a video and puts their results together.
+
+    Args:
+        futures (list): The futures given by submit_video()
+
+    Returns:
+        dict: One array per column, for all the frames of the video
+    """
+    parts = [future.result() for future in futures]  # The chunks stay in the order of the video
+    if not parts:
+        return columns_from_rows([])
+    return {name: np.concatenate([part[name] for part in parts]) for name, _ in COLUMNS}
+
+
+def analyze_video(path, executor, chunk_size=CHUNK_SIZE):
+    """Analyzes all the frames of a video with the workers of the executor.
+
+    Args:
+        path (str): Path of the video
+        executor (concurrent.futures.Executor): The pool of workers
+        chunk_size (int): Number of frames per chunk
+
+    Returns:
+        dict: One array per column, for all the frames of the video
+    """
+    return collect_video(submit_video(path, executor, chunk_size))
+
+
+def save_results(results, path):
+    """Saves the columns of the results in a compressed .npz file"""
+    np.savez_compressed(path, **results)
+
+
+def load_results(path):
+    """Loads the columns saved by save_results()"""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def output_names(paths):
+    """Gives the name of the results file of each video.
+
+    The results are named after the videos, but videos with the same file
+    name in different folders (day1/session.mp4, day2/session.mp4) also get
+    a short hash of their path, so that they don't overwrite each other.
+
+    Args:
+        paths (list): Paths of the videos
+
+    Returns:
+        list: The file name of the results of each video
+
+    Raises:
+        ValueError: If a video is given twice
+    """
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    counts = collections.Counter(names)
+
+    outputs = []
+    for path, name in zip(paths, names):
+        if counts[name] > 1:
+            digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+            name = "{}-{}".format(name, digest)
+        outputs.append(name + ".npz")
+
+    if len(set(outputs)) < len(outputs):
+        raise ValueError("A video is given twice: {}".format(
+            sorted(path for path, output in zip(paths, outputs) if outputs.count(output) > 1)))
+    return outputs
+
+
+def analyze_videos(paths, output_dir, workers=None, chunk_size=CHUNK_SIZE, tracker_options=None):
+    """Analyzes several videos and saves one results file per video.
+
+    Args:
+        paths (list): Paths of the videos
+        output_dir (str): Folder where the results are saved
+        workers (int): Number of worker processes (default: number of cores)
+        chunk_size (int): Number of frames per chunk
+        tracker_options (dict): Arguments given to the GazeTracking of each worker (without
+            history by default, as the results are saved frame by frame)
+
+    Returns:
+        list: One report per video, with its output file, frames, and the seconds
+            from the start of the batch until its results were saved
+    """
+    names = output_names(paths)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    options = {"history_size": 0}  # Nobody reads the history of the workers
+    options.update(tracker_options or {})
+
+    # Forked workers inherit the models loaded here instead of each reading the file
+    if multiprocessing.get_start_method() == "fork":
+        models.preload(options.get("model_path", models.MODEL_PATH))
+
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(options,)) as executor:
+        # The chunks of all the videos are queued at once, so that no worker
+        # waits for the end of a video before starting on the next one
+        start = time.perf_counter()
+        submitted = [(path, submit_video(path, executor, chunk_size)) for path in paths]
+        for (path, futures), name in zip(submitted, names):
+            results = collect_video(futures)
+            elapsed = time.perf_counter() - start
+
+            output = os.path.join(output_dir, name)
+            save_results(results, output)
+
+            frames = len(results["frame"])
+            reports.append({
+                "video": path,
+                "output": output,
+                "frames": frames,
+                "seconds": elapsed,  # Since the start of the batch, as the videos are analyzed together
+            })
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze the gaze on recorded videos.")
+    parser.add_argument("videos", nargs="+", help="Video files to analyze")
+    parser.add_argument("-o", "--output", default="gaze_results", help="Folder for the results")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Frames per chunk")
+    parser.add_argument("--redetect-interval", type=int, default=1, help="Run the face detector every N frames")
+    parser.add_argument("--detection-scale", type=float, default=1.0, help="Scale of the frame for face detection")
+    parser.add_argument("--pupil-method", default="contours", choices=sorted(LOCATORS), help="Pupil localisation")
+    parser.add_argument("--pupil-denoise", default="bilateral", choices=sorted(DENOISERS), help="Eye frame filter")
+    args = parser.parse_args(argv)
+
+    tracker_options = {"redetect_interval": args.redetect_interval, "detection_scale": args.detection_scale,
+                       "pupil_method": args.pupil_method, "pupil_denoise": args.pupil_denoise}
+    reports = analyze_videos(args.videos, args.output, args.workers, args.chunk_size, tracker_options)
+
+    total_frames = sum(report["frames"] for report in reports)
+    total_seconds = max([report["seconds"] for report in reports] or [0])
+    for report in reports:
+        print("{video}: {frames} frames, done after {seconds:.1f} s -> {output}".format(**report))
+    if total_seconds:
+        print("Total: {} frames, {:.1f} fps".format(total_frames, total_frames / total_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,61 @@
 from __future__ import division  # Ensure division in Python 2 behaves like Python 3
 import cv2  # Import the OpenCV library for image processing
+import numpy as np  # Import NumPy for histogram computations
 from .pupil import Pupil  # Import the Pupil class from the current package
 
 class Calibration(object):
     """
     This class helps calibrate the pupil detection algorithm by finding the
-    best position of them on webcam
+    best position of them on webcam.
+
+    In adaptive mode, it keeps watching a coarse histogram of each eye after
+    the calibration. When the lighting changes and the histogram drifts away
+    from the one seen at calibration time, that eye is calibrated again on a
+    few frames, then the watch starts over.
     """
 
-    def __init__(self):
+    HISTOGRAM_BINS = 16  # Bins of the coarse histogram of the eye frames
+    SMOOTHING = 0.1  # Weight of a new frame in the running histogram
+    DRIFT_LIMIT = 0.3  # Distance between histograms (0 to 2) above which the lighting changed
+
+    def __init__(self, threshold_step=5, adaptive=False, recalibration_frames=10, denoise="bilateral"):
+        """
+        Args:
+            threshold_step (int): Distance between two candidate thresholds
+            adaptive (bool): Calibrate again when the lighting of an eye changes
+            recalibration_frames (int): Number of frames used to calibrate an eye again
+            denoise (str): Filter of the pupil detection, one of pupil.DENOISERS
+        """
         self.nb_frames = 20  # Number of frames needed to complete calibration
-        self.thresholds_left = []  # List to store threshold values for the left eye
-        self.thresholds_right = []  # List to store threshold values for the right eye
+        self.threshold_step = threshold_step  # Distance between two candidate thresholds
+        self.adaptive = adaptive  # Whether the lighting is watched after the calibration
+        self.recalibration_frames = recalibration_frames  # Frames used to calibrate an eye again
+        self.recalibrations = 0  # Number of times an eye was calibrated again
+        self.denoise = denoise  # Filter applied to the eye frames, like the pupil detection does
+        self.reset()
+
+    def reset(self):
+        """Forgets the calibration, so that it starts again on the next frames"""
+        # Running sums and counts of the thresholds found for the left and right eyes
+        self._sums = [0, 0]
+        self._counts = [0, 0]
+
+        # Running histogram of each eye, and the one seen when it was calibrated
+        self._histograms = [None, None]
+        self._baselines = [None, None]
+
+        # Sums and counts of the recalibration in progress for each eye, and the frames left
+        self._new_sums = [0, 0]
+        self._new_counts = [0, 0]
+        self._remaining = [0, 0]
 
     def is_complete(self):
         """Check if calibration is done by seeing if we've processed enough frames."""
-        return len(self.thresholds_left) >= self.nb_frames and len(self.thresholds_right) >= self.nb_frames
+        return self._counts[0] >= self.nb_frames and self._counts[1] >= self.nb_frames
+
+    def is_recalibrating(self, side):
+        """Checks if the given eye is being calibrated again after a change of lighting"""
+        return self._remaining[side] > 0
 
     def threshold(self, side):
         """Get the threshold value for the given eye (left or right).
@@ -23,12 +63,13 @@ class Calibration(object):
         Args:
             side: 0 for the left eye, 1 for the right eye
         """
-        if side == 0:
-            # Calculate the average threshold for the left eye
-            return int(sum(self.thresholds_left) / len(self.thresholds_left))
-        elif side == 1:
-            # Calculate the average threshold for the right eye
-            return int(sum(self.thresholds_right) / len(self.thresholds_right))
+        if side not in (0, 1):
+            return None
+        if self._remaining[side] and self._new_counts[side]:
+            # The old threshold doesn't fit the new lighting anymore
+            return int(self._new_sums[side] / self._new_counts[side])
+        # Calculate the average threshold for the eye
+        return int(self._sums[side] / self._counts[side])
 
     @staticmethod
     def iris_size(frame):
@@ -45,23 +86,48 @@ class Calibration(object):
         return nb_blacks / nb_pixels  # Percentage of the frame covered by the iris
 
     @staticmethod
-    def find_best_threshold(eye_frame):
+    def find_best_threshold(eye_frame, step=5, denoise="bilateral"):
         """Find the best threshold to binarize the eye image.
 
+        The frame is filtered and eroded only once. A histogram of the result
+        gives, through its cumulative counts, the iris size for every candidate
+        threshold at once, so a finer step costs nothing extra.
+
         Args:
             eye_frame (numpy.ndarray): The image of the eye to analyze
+            step (int): Distance between two candidate thresholds (5 to 95)
+            denoise (str): Filter applied before the erosion, one of pupil.DENOISERS
         """
         average_iris_size = 0.48  # Expected average size of the iris in the eye image
-        trials = {}  # Dictionary to store the iris size for different threshold values
+        thresholds = np.arange(5, 100, step)  # Candidate threshold values
 
-        # Try different threshold values from 5 to 95 in steps of 5
-        for threshold in range(5, 100, 5):
-            iris_frame = Pupil.image_processing(eye_frame, threshold)  # Process the image with the current threshold
-            trials[threshold] = Calibration.iris_size(iris_frame)  # Store the iris size for the current threshold
+        # Filter and erode once, then crop the borders like iris_size() does
+        new_frame = Pupil.denoise(eye_frame, denoise)[5:-5, 5:-5]
+        nb_pixels = new_frame.size  # Total number of pixels in the frame
+
+        # Pixels at or below a threshold become black once binarized
+        histogram = np.bincount(new_frame.ravel(), minlength=256)
+        nb_blacks = np.cumsum(histogram)[thresholds]
+        iris_sizes = nb_blacks / nb_pixels  # Iris size for every candidate threshold
 
         # Find the threshold that makes the iris size closest to the average iris size
-        best_threshold, iris_size = min(trials.items(), key=(lambda p: abs(p[1] - average_iris_size)))
-        return best_threshold
+        best_index = np.argmin(np.abs(iris_sizes - average_iris_size))
+        return int(thresholds[best_index])
+
+    def _track_histogram(self, eye_frame, side):
+        """Updates the running histogram of an eye, and gives it"""
+        pixels = eye_frame[eye_frame != 255]  # Without the white mask around the eye
+        histogram = np.bincount(pixels >> 4, minlength=self.HISTOGRAM_BINS)
+        total = histogram.sum()
+        if not total:
+            return self._histograms[side]
+
+        histogram = histogram / total
+        if self._histograms[side] is None:
+            self._histograms[side] = histogram
+        else:
+            self._histograms[side] += self.SMOOTHING * (histogram - self._histograms[side])
+        return self._histograms[side]
 
     def evaluate(self, eye_frame, side):
         """Improve calibration by using the given eye image.
@@ -70,9 +136,53 @@ class Calibration(object):
             eye_frame (numpy.ndarray): The image of the eye
             side: 0 for the left eye, 1 for the right eye
         """
-        threshold = self.find_best_threshold(eye_frame)  # Find the best threshold for the current eye image
+        if side not in (0, 1):
+            return
+
+        threshold = self.find_best_threshold(eye_frame, self.threshold_step, self.denoise)  # Find the best threshold for the current eye image
+        self._sums[side] += threshold  # Add the threshold to the eye's running sum
+        self._counts[side] += 1
+
+        if self.adaptive:
+            self._track_histogram(eye_frame, side)
+
+    def observe(self, eye_frame, side):
+        """Watches the lighting of an eye once calibrated, in adaptive mode.
+
+        This only updates a coarse histogram, unless the eye is being calibrated
+        again, which takes recalibration_frames frames.
+
+        Args:
+            eye_frame (numpy.ndarray): The image of the eye
+            side: 0 for the left eye, 1 for the right eye
+        """
+        if not self.adaptive or side not in (0, 1):
+            return
+
+        histogram = self._track_histogram(eye_frame, side)
+        if histogram is None:
+            return
+
+        if self._remaining[side]:
+            # Calibrate the eye again, one frame at a time
+            self._new_sums[side] += self.find_best_threshold(eye_frame, self.threshold_step, self.denoise)
+            self._new_counts[side] += 1
+            self._remaining[side] -= 1
+
+            if not self._remaining[side]:
+                # Replace the calibration of the eye, and watch the new lighting. The
+                # new mean weighs as much as the old one, so the count stays complete
+                count = max(self._counts[side], self.nb_frames)
+                self._sums[side] = self._new_sums[side] / self._new_counts[side] * count
+                self._counts[side] = count
+                self._baselines[side] = histogram.copy()
+
+        elif self._baselines[side] is None:
+            self._baselines[side] = histogram.copy()  # The lighting at calibration time
 
-        if side == 0:
-            self.thresholds_left.append(threshold)  # Add the threshold to the left eye's list
-        elif side == 1:
-            self.thresholds_right.append(threshold)  # Add the threshold to the right eye's list
+        elif np.abs(histogram - self._baselines[side]).sum() > self.DRIFT_LIMIT:
+            # The lighting changed: start calibrating the eye again, from the new lighting
+            self._histograms[side] = None
+            self._new_sums[side] = self._new_counts[side] = 0
+            self._remaining[side] = self.recalibration_frames
+            self.recalibrations += 1
@@ -1,8 +1,35 @@
-import math  # Import math library for mathematical functions
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
 import numpy as np  # Import NumPy for numerical operations
 import cv2  # Import OpenCV for image processing
+from .profiler import PROFILER  # Import the shared profiler from the current package
 from .pupil import Pupil  # Import the Pupil class from the current package
 
+
+class EyeBuffer(object):
+    """
+    This class keeps the memory used to mask an eye, so that it can be reused
+    from one frame to the next instead of being allocated again.
+    """
+
+    def __init__(self):
+        self._mask = np.empty(0, np.uint8)  # Flat storage for the polygon mask
+
+    def mask(self, height, width):
+        """Gives a contiguous (height, width) mask, filled with white.
+
+        Args:
+            height (int): Height of the eye crop
+            width (int): Width of the eye crop
+        """
+        size = height * width
+        if self._mask.size < size:
+            self._mask = np.empty(size, np.uint8)  # Only grows when a bigger eye shows up
+
+        mask = self._mask[:size].reshape(height, width)
+        mask.fill(255)
+        return mask
+
+
 class Eye(object):
     """
     This class handles creating a new frame to isolate the eye and
@@ -11,115 +38,189 @@ class Eye(object):
 
     LEFT_EYE_POINTS = [36, 37, 38, 39, 40, 41]  # Points representing the left eye landmarks
     RIGHT_EYE_POINTS = [42, 43, 44, 45, 46, 47]  # Points representing the right eye landmarks
+    EYES_POINTS = np.array([LEFT_EYE_POINTS, RIGHT_EYE_POINTS])  # Both eyes, indexed by side
+    MARGIN = 5  # Margin kept around the eye when cropping it
 
-    def __init__(self, original_frame, landmarks, side, calibration):
+    def __init__(self, original_frame, landmarks, side, calibration, buffer=None, blinking=None, pupil_options=None):
+        """
+        Args:
+            original_frame (numpy.ndarray): The grayscale frame
+            landmarks: The 68 facial landmarks, as dlib.full_object_detection or a (68, 2) array
+            side (int): 0 for the left eye, 1 for the right eye
+            calibration (calibration.Calibration): The calibration object to manage threshold values
+            buffer (EyeBuffer): Memory reused to mask the eye (optional)
+            blinking (float): The blinking ratio, if it was already computed (optional)
+            pupil_options (dict): Arguments given to Pupil, like the localisation method (optional)
+        """
         self.frame = None  # Will hold the isolated eye frame
         self.origin = None  # Will store the origin coordinates of the eye in the frame
         self.center = None  # Will store the center coordinates of the eye frame
         self.pupil = None  # Will hold the detected pupil information
         self.landmark_points = None  # Will store the eye's landmark points
+        self.blinking = blinking  # Will store the blinking ratio
+        self._pupil_options = pupil_options or {}  # Arguments of the pupil detection
 
         # Start analyzing the eye by isolating it and detecting the pupil
-        self._analyze(original_frame, landmarks, side, calibration)
+        self._analyze(original_frame, landmarks, side, calibration, buffer)
+
+    @staticmethod
+    def landmarks_to_array(landmarks):
+        """Converts the facial landmarks to a (68, 2) array of int32.
+
+        Args:
+            landmarks (dlib.full_object_detection): Facial landmarks for the face region
+        """
+        if isinstance(landmarks, np.ndarray):
+            return landmarks.astype(np.int32, copy=False)
+        return np.array([(p.x, p.y) for p in landmarks.parts()], dtype=np.int32)
 
     @staticmethod
-    def _middle_point(p1, p2):
-        """Get the middle point between two points.
+    def blinking_ratios(regions):
+        """Calculate, for several eyes at once, a ratio to determine if they are blinking.
+
+        This ratio is the width of the eye divided by its height.
+
+        Args:
+            regions (numpy.ndarray): Eye landmarks, as a (n, 6, 2) array
+
+        Returns:
+            list: The blinking ratio of each eye (None when the eye height is zero)
+        """
+        return [None if np.isnan(ratio) else float(ratio) for ratio in Eye.blinking_ratio_array(regions)]
+
+    @staticmethod
+    def blinking_ratio_array(regions):
+        """Calculate the blinking ratios of eyes as an array, for any number of
+        frames and eyes, like the recordings need.
+
+        Args:
+            regions (numpy.ndarray): Eye landmarks, as a (..., 6, 2) array
+
+        Returns:
+            numpy.ndarray: The blinking ratio of each eye, NaN when the eye height is zero
+        """
+        regions = np.asarray(regions, np.float64)
+        left, right = regions[..., 0, :], regions[..., 3, :]
+        top = np.trunc((regions[..., 1, :] + regions[..., 2, :]) / 2)  # Middle of the upper eyelid
+        bottom = np.trunc((regions[..., 5, :] + regions[..., 4, :]) / 2)  # Middle of the lower eyelid
+
+        eye_width = np.hypot(*np.moveaxis(left - right, -1, 0))  # Width of the eyes
+        eye_height = np.hypot(*np.moveaxis(top - bottom, -1, 0))  # Height of the eyes
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(eye_height == 0, np.nan, eye_width / eye_height)
+
+    @classmethod
+    def pair(cls, original_frame, landmarks, calibration, buffers=(None, None), pupil_options=None):
+        """Isolates both eyes, converting the landmarks and computing
+        the blinking ratios only once for the two of them.
 
         Args:
-            p1 (dlib.point): First point
-            p2 (dlib.point): Second point
+            original_frame (numpy.ndarray): The grayscale frame
+            landmarks (dlib.full_object_detection): Facial landmarks for the face region
+            calibration (calibration.Calibration): The calibration object to manage threshold values
+            buffers (tuple): One EyeBuffer per side (optional)
+            pupil_options (dict): Arguments given to Pupil, like the localisation method (optional)
+
+        Returns:
+            tuple: The left and the right Eye
         """
-        x = int((p1.x + p2.x) / 2)
-        y = int((p1.y + p2.y) / 2)
-        return (x, y)
+        points = cls.landmarks_to_array(landmarks)
+        ratios = cls.blinking_ratios(points[cls.EYES_POINTS])
 
-    def _isolate(self, frame, landmarks, points):
+        return tuple(cls(original_frame, points, side, calibration, buffers[side], ratios[side], pupil_options)
+                     for side in (0, 1))
+
+    def _isolate(self, frame, region, buffer):
         """Isolate the eye region from the rest of the face.
 
+        Only the crop around the eye is copied and masked, so the memory used
+        doesn't depend on the size of the frame.
+
         Args:
             frame (numpy.ndarray): The image frame containing the face
-            landmarks (dlib.full_object_detection): Facial landmarks for the face region
-            points (list): Points representing the eye landmarks
+            region (numpy.ndarray): Landmarks of the eye, as a (6, 2) array
+            buffer (EyeBuffer): Memory reused to mask the eye
         """
-        # Get the coordinates of the eye region
-        region = np.array([(landmarks.part(point).x, landmarks.part(point).y) for point in points])
-        region = region.astype(np.int32)
         self.landmark_points = region
 
-        # Create a mask to isolate the eye
-        height, width = frame.shape[:2]
-        black_frame = np.zeros((height, width), np.uint8)
-        mask = np.full((height, width), 255, np.uint8)
-        cv2.fillPoly(mask, [region], (0, 0, 0))
-        eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
+        # Get the crop of the eye region with a small margin
+        min_x, min_y = region.min(axis=0) - self.MARGIN
+        max_x, max_y = region.max(axis=0) + self.MARGIN
 
-        # Crop the frame to the eye region with a small margin
-        margin = 5
-        min_x = np.min(region[:, 0]) - margin
-        max_x = np.max(region[:, 0]) + margin
-        min_y = np.min(region[:, 1]) - margin
-        max_y = np.max(region[:, 1]) + margin
+        if min_x < 0 or min_y < 0:
+            # The crop leaves the frame: keep the exact behaviour of the full-frame masking
+            self._isolate_full_frame(frame, region, (min_x, min_y, max_x, max_y))
+            return
 
-        self.frame = eye[min_y:max_y, min_x:max_x]  # The isolated eye frame
+        crop = frame[min_y:max_y, min_x:max_x]
+        height, width = crop.shape[:2]
+
+        # Create a mask of the crop to isolate the eye, and whiten everything around it
+        mask = (buffer or EyeBuffer()).mask(height, width)
+        cv2.fillPoly(mask, [region - (min_x, min_y)], (0, 0, 0))
+
+        self.frame = np.maximum(crop, mask)  # The isolated eye frame
         self.origin = (min_x, min_y)  # The origin point of the eye in the frame
 
         # Calculate the center of the isolated eye frame
-        height, width = self.frame.shape[:2]
         self.center = (width / 2, height / 2)
 
-    def _blinking_ratio(self, landmarks, points):
-        """Calculate a ratio to determine if the eye is blinking.
-
-        This ratio is the width of the eye divided by its height.
+    def _isolate_full_frame(self, frame, region, box):
+        """Isolate the eye by masking the whole frame, for eyes at the border of the frame.
 
         Args:
-            landmarks (dlib.full_object_detection): Facial landmarks for the face region
-            points (list): Points representing the eye landmarks
-
-        Returns:
-            float: The blinking ratio
+            frame (numpy.ndarray): The image frame containing the face
+            region (numpy.ndarray): Landmarks of the eye, as a (6, 2) array
+            box (tuple): The crop of the eye, as (min_x, min_y, max_x, max_y)
         """
-        left = (landmarks.part(points[0]).x, landmarks.part(points[0]).y)
-        right = (landmarks.part(points[3]).x, landmarks.part(points[3]).y)
-        top = self._middle_point(landmarks.part(points[1]), landmarks.part(points[2]))
-        bottom = self._middle_point(landmarks.part(points[5]), landmarks.part(points[4]))
+        min_x, min_y, max_x, max_y = box
 
-        eye_width = math.hypot((left[0] - right[0]), (left[1] - right[1]))  # Width of the eye
-        eye_height = math.hypot((top[0] - bottom[0]), (top[1] - bottom[1]))  # Height of the eye
+        # Create a mask to isolate the eye
+        height, width = frame.shape[:2]
+        black_frame = np.zeros((height, width), np.uint8)
+        mask = np.full((height, width), 255, np.uint8)
+        cv2.fillPoly(mask, [region], (0, 0, 0))
+        eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
 
-        try:
-            ratio = eye_width / eye_height  # Blinking ratio
-        except ZeroDivisionError:
-            ratio = None  # In case of division by zero
+        self.frame = eye[min_y:max_y, min_x:max_x]  # The isolated eye frame
+        self.origin = (min_x, min_y)  # The origin point of the eye in the frame
 
-        return ratio
+        # Calculate the center of the isolated eye frame
+        height, width = self.frame.shape[:2]
+        self.center = (width / 2, height / 2)
 
-    def _analyze(self, original_frame, landmarks, side, calibration):
+    def _analyze(self, original_frame, landmarks, side, calibration, buffer):
         """Isolate the eye in a new frame, handle calibration, and detect the pupil.
 
         Args:
             original_frame (numpy.ndarray): The original frame from the webcam
-            landmarks (dlib.full_object_detection): Facial landmarks for the face region
+            landmarks: The 68 facial landmarks, as dlib.full_object_detection or a (68, 2) array
             side (int): 0 for the left eye, 1 for the right eye
             calibration (calibration.Calibration): The calibration object to manage threshold values
+            buffer (EyeBuffer): Memory reused to mask the eye
         """
-        if side == 0:
-            points = self.LEFT_EYE_POINTS  # Use left eye points
-        elif side == 1:
-            points = self.RIGHT_EYE_POINTS  # Use right eye points
-        else:
+        if side not in (0, 1):
             return
 
+        region = self.landmarks_to_array(landmarks)[self.EYES_POINTS[side]]
+
         # Calculate blinking ratio
-        self.blinking = self._blinking_ratio(landmarks, points)
+        if self.blinking is None:
+            self.blinking = self.blinking_ratios(region[np.newaxis])[0]
         # Isolate the eye in the frame
-        self._isolate(original_frame, landmarks, points)
+        with PROFILER.stage("eye_isolation"):
+            self._isolate(original_frame, region, buffer)
 
         # Evaluate calibration if not complete
         if not calibration.is_complete():
-            calibration.evaluate(self.frame, side)
+            with PROFILER.stage("calibration"):
+                calibration.evaluate(self.frame, side)
+        elif calibration.adaptive:
+            # Watch the lighting, and calibrate again if it changed
+            with PROFILER.stage("calibration"):
+                calibration.observe(self.frame, side)
 
         # Get the threshold value and detect the pupil
         threshold = calibration.threshold(side)
-        self.pupil = Pupil(self.frame, threshold)
+        self.pupil = Pupil(self.frame, threshold, **self._pupil_options)
@@ -0,0 +1,195 @@
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import cv2  # For resizing the frame before detection
+import numpy as np  # For numerical operations on landmarks
+from .eye import Eye  # Importing the Eye class, for its landmarks conversion
+from .profiler import PROFILER  # Importing the shared profiler from the same package
+
+
+class FaceTracker(object):
+    """
+    This class finds the face and its landmarks on each frame. Instead of
+    running the face detector on every frame, it can reuse the last face to
+    predict where the face is on the next frame, and only run the full-frame
+    detector every few frames or when the tracking becomes unreliable.
+    """
+
+    # The face is lost if its landmarks moved more than this fraction of the
+    # face width between two frames, or if their spread changed more than this
+    # fraction since the last detection
+    MAX_SHIFT = 0.25
+    MAX_SCALE_CHANGE = 0.25
+
+    def __init__(self, detector, predictor, redetect_interval=1, detection_scale=1.0):
+        """
+        Args:
+            detector: The dlib face detector
+            predictor: The dlib facial landmark predictor
+            redetect_interval (int): Run the detector at least every N frames (1 = every frame)
+            detection_scale (float): Scale of the frame given to the detector (1.0 = full resolution)
+        """
+        if redetect_interval < 1:
+            raise ValueError("redetect_interval must be at least 1")
+        if not 0 < detection_scale <= 1:
+            raise ValueError("detection_scale must be in (0, 1]")
+
+        self._detector = detector
+        self._predictor = predictor
+        self.redetect_interval = redetect_interval
+        self.detection_scale = detection_scale
+
+        self.face = None  # Box of the face on the last frame
+        self.landmarks = None  # Landmarks of the face on the last frame
+        self.points = None  # Landmarks of the last frame as a (68, 2) array
+        self._offset = None  # Offset between the box center and the landmarks centroid
+        self._spread = None  # Spread of the landmarks at the last detection
+        self._since_detection = 0  # Frames analyzed since the last detection
+
+        self.frames = 0  # Number of frames analyzed
+        self.detections = 0  # Number of times the full-frame detector ran
+
+    def detection_rate(self):
+        """Gives the fraction of frames on which the face detector ran"""
+        if self.frames:
+            return self.detections / self.frames
+
+    def reset(self, counts=False):
+        """Forgets the last face, so the next frame runs the detector.
+
+        Args:
+            counts (bool): Also start the frame and detection counts again, for a new session
+        """
+        self.face = None
+        self.landmarks = None
+        self.points = None
+        if counts:
+            self.frames = 0
+            self.detections = 0
+
+    def _detect(self, frame):
+        """Runs the face detector, possibly on a downscaled frame.
+
+        Args:
+            frame (numpy.ndarray): The grayscale frame
+
+        Returns:
+            dlib.rectangle: The box of the first face in full resolution, or None
+        """
+        self.detections += 1
+        self._since_detection = 0
+        scale = self.detection_scale
+
+        with PROFILER.stage("face_detection"):
+            if scale == 1:
+                faces = self._detector(frame)
+            else:
+                small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                faces = self._detector(small)
+        PROFILER.count("face_detections")
+
+        if len(faces) == 0:
+            return None
+
+        face = faces[0]
+        if scale == 1:
+            return face
+
+        # Map the box back to full resolution
+        import dlib  # Already loaded by the models, imported here to keep the package import cheap
+        return dlib.rectangle(int(face.left() / scale), int(face.top() / scale),
+                              int(face.right() / scale), int(face.bottom() / scale))
+
+    def _predict(self, frame):
+        """Predicts the face box from the landmarks of the last frame.
+
+        Returns:
+            dlib.rectangle: The predicted box, or None if it left the frame
+        """
+        height, width = frame.shape[:2]
+        center = self.points.mean(axis=0) + self._offset
+        half_width = self.face.width() / 2
+        half_height = self.face.height() / 2
+
+        left, top = int(center[0] - half_width), int(center[1] - half_height)
+        right, bottom = int(center[0] + half_width), int(center[1] + half_height)
+
+        if right <= 0 or bottom <= 0 or left >= width or top >= height:
+            return None
+
+        import dlib  # Already loaded by the models, imported here to keep the package import cheap
+        return dlib.rectangle(left, top, right, bottom)
+
+    def _is_reliable(self, points):
+        """Checks that the new landmarks are consistent with the last frame.
+
+        Args:
+            points (numpy.ndarray): The new landmarks as a (68, 2) array
+        """
+        face_width = self.face.width()
+        shift = np.hypot(*(points.mean(axis=0) - self.points.mean(axis=0)))
+        spread = points.std(axis=0).sum()
+
+        if shift > self.MAX_SHIFT * face_width:
+            return False
+        return abs(spread - self._spread) <= self.MAX_SCALE_CHANGE * self._spread
+
+    def _fit(self, frame, face):
+        """Runs the landmark predictor on the given box and remembers the face"""
+        self.face = face
+        with PROFILER.stage("landmarks"):
+            self.landmarks = self._predictor(frame, face)
+        self.points = Eye.landmarks_to_array(self.landmarks)
+        return self.landmarks
+
+    def refit(self, frame):
+        """Runs only the landmark predictor on the last face box, for frames
+        where the head didn't move. Falls back to track() if there is no face.
+
+        Args:
+            frame (numpy.ndarray): The grayscale frame
+
+        Returns:
+            dlib.full_object_detection: The landmarks of the face, or None if no face was found
+        """
+        if self.face is None:
+            return self.track(frame)
+
+        self.frames += 1
+        self._since_detection += 1
+        return self._fit(frame, self.face)
+
+    def track(self, frame):
+        """Finds the face landmarks on the new frame.
+
+        Args:
+            frame (numpy.ndarray): The grayscale frame
+
+        Returns:
+            dlib.full_object_detection: The landmarks of the face, or None if no face was found
+        """
+        self.frames += 1
+        self._since_detection += 1
+
+        # Try to follow the face from the last frame
+        if self.face is not None and self._since_detection < self.redetect_interval:
+            face = self._predict(frame)
+            if face is not None:
+                with PROFILER.stage("landmarks"):
+                    landmarks = self._predictor(frame, face)
+                new_points = Eye.landmarks_to_array(landmarks)
+
+                if self._is_reliable(new_points):
+                    self.face = face
+                    self.landmarks = landmarks
+                    self.points = new_points
+                    return landmarks
+
+        # Run the detector when there is no face, when it is time, or when the tracking was lost
+        face = self._detect(frame)
+        if face is None:
+            self.reset()
+            return None
+
+        self._fit(frame, face)
+        self._offset = np.array([face.center().x, face.center().y]) - self.points.mean(axis=0)
+        self._spread = self.points.std(axis=0).sum()
+        return self.landmarks
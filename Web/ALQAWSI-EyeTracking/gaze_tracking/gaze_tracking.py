@@ -1,8 +1,13 @@
-import os  # To handle file paths and operations
+import time  # For the timestamps of the samples
 import cv2  # For computer vision tasks
-import dlib  # For facial landmark detection
-from .eye import Eye  # Importing the Eye class from the same package
+from . import models  # Importing the shared dlib models from the same package
+from .eye import Eye, EyeBuffer  # Importing the Eye and EyeBuffer classes from the same package
 from .calibration import Calibration  # Importing the Calibration class from the same package
+from .face_tracker import FaceTracker  # Importing the FaceTracker class from the same package
+from .history import GazeHistory  # Importing the GazeHistory class from the same package
+from .profiler import PROFILER  # Importing the shared profiler from the same package
+from .scheduler import MotionScheduler  # Importing the MotionScheduler class from the same package
+from .sample import Direction, GazeSample  # Importing the per-frame results from the same package
 
 class GazeTracking(object):
     """
@@ -10,116 +15,201 @@ class GazeTracking(object):
     of your eyes and pupils, and whether your eyes are open or closed.
     """
 
-    def __init__(self):
+    def __init__(self, redetect_interval=1, detection_scale=1.0, history_size=9000, pupil_method="contours",
+                 subpixel=False, model_path=models.MODEL_PATH, adaptive_calibration=False, motion_threshold=None,
+                 latency_budget=None, pupil_denoise="bilateral"):
+        """
+        Args:
+            redetect_interval (int): Run the face detector at least every N frames and
+                follow the face from the last frame in between (1 = detect on every frame)
+            detection_scale (float): Scale of the frame given to the face detector
+            history_size (int): Number of samples kept in the history (0 to keep none)
+            pupil_method (str): Strategy locating the pupils, one of locators.LOCATORS
+            subpixel (bool): Give the pupil coordinates as floats instead of truncating them
+            model_path (str): Path of the dlib 68 landmarks model
+            adaptive_calibration (bool): Calibrate the pupil detection again when the lighting changes
+            motion_threshold (float): Skip or partially analyze the frames where the head moved less
+                than this mean gray level difference (None to analyze every frame fully)
+            latency_budget (float): Seconds an analysis should take at most, with motion_threshold
+            pupil_denoise (str): Filter of the eye frames before the pupil detection, one of pupil.DENOISERS
+        """
         self.frame = None  # This will store the frame captured from the webcam
         self.eye_left = None  # This will store the left eye object
         self.eye_right = None  # This will store the right eye object
-        self.calibration = Calibration()  # Initializes the calibration for pupil detection
+        self.sample = GazeSample()  # This will store the results of the last frame
+        self.history = GazeHistory(history_size) if history_size else None  # The last samples and session metrics
+        self.calibration = Calibration(adaptive=adaptive_calibration, denoise=pupil_denoise)  # Initializes the calibration for pupil detection
+        self._eye_buffers = (EyeBuffer(), EyeBuffer())  # Memory reused to isolate the eyes on each frame
+        self._pupil_options = {"method": pupil_method, "subpixel": subpixel, "denoise": pupil_denoise}  # How the pupils are located
+
+        # This detector will find faces in the frame (shared by all the trackers of the process)
+        self._face_detector = models.face_detector()
+
+        # This predictor will find the facial landmarks on the detected face (loaded once per process)
+        self._predictor = models.landmark_predictor(model_path)
+
+        # This tracker decides when the face detector has to run
+        self.face_tracker = FaceTracker(self._face_detector, self._predictor, redetect_interval, detection_scale)
 
-        # This detector will find faces in the frame
-        self._face_detector = dlib.get_frontal_face_detector()
+        # This scheduler decides how much of the analysis runs on each frame, if enabled
+        self.scheduler = None
+        if motion_threshold is not None:
+            self.scheduler = MotionScheduler(motion_threshold, latency_budget=latency_budget)
 
-        # This predictor will find the facial landmarks on the detected face
-        cwd = os.path.abspath(os.path.dirname(__file__))  # Get the current working directory
-        model_path = os.path.abspath(os.path.join(cwd, "trained_models/shape_predictor_68_face_landmarks.dat"))
-        self._predictor = dlib.shape_predictor(model_path)  # Load the facial landmark model
+        # This profiler times the stages of the analysis, once enabled with profiler.enable()
+        self.profiler = PROFILER
 
     @property
     def pupils_located(self):
         """Checks if the pupils have been found"""
-        try:
-            int(self.eye_left.pupil.x)  # Check if left pupil x-coordinate is valid
-            int(self.eye_left.pupil.y)  # Check if left pupil y-coordinate is valid
-            int(self.eye_right.pupil.x)  # Check if right pupil x-coordinate is valid
-            int(self.eye_right.pupil.y)  # Check if right pupil y-coordinate is valid
-            return True  # If all are valid, pupils are located
-        except Exception:
-            return False  # If any are not valid, pupils are not located
-
-    def _analyze(self):
-        """Detects the face and initializes Eye objects for left and right eyes"""
-        frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)  # Convert the frame to grayscale
-        faces = self._face_detector(frame)  # Detect faces in the frame
-
-        try:
-            landmarks = self._predictor(frame, faces[0])  # Get the facial landmarks for the first detected face
-            self.eye_left = Eye(frame, landmarks, 0, self.calibration)  # Initialize the left eye
-            self.eye_right = Eye(frame, landmarks, 1, self.calibration)  # Initialize the right eye
-
-        except IndexError:
+        return self.sample.pupils_located
+
+    def _analyze(self, partial=False):
+        """Finds the face and initializes Eye objects for left and right eyes
+
+        Args:
+            partial (bool): Keep the last face box, the head didn't move
+        """
+        with PROFILER.stage("grayscale"):
+            frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)  # Convert the frame to grayscale
+        if partial:
+            landmarks = self.face_tracker.refit(frame)  # Get the facial landmarks in the last face box
+        else:
+            landmarks = self.face_tracker.track(frame)  # Get the facial landmarks of the tracked face
+
+        if landmarks is not None:
+            # Initialize the left and right eyes from the landmarks array of the tracker
+            self.eye_left, self.eye_right = Eye.pair(frame, self.face_tracker.points, self.calibration,
+                                                     self._eye_buffers, self._pupil_options)
+        else:
             self.eye_left = None  # If no face is detected, set left eye to None
             self.eye_right = None  # If no face is detected, set right eye to None
 
-    def refresh(self, frame):
+    def reset(self, keep_calibration=False):
+        """Starts a new session with the same tracker: forgets the face, the
+        detection counts, the calibration, the history and the last results, but
+        keeps the loaded models.
+
+        Args:
+            keep_calibration (bool): Keep the calibration, for a new session of the same person
+        """
+        self.frame = None
+        self.eye_left = None
+        self.eye_right = None
+        self.sample = GazeSample()
+        if not keep_calibration:
+            self.calibration.reset()
+        self.face_tracker.reset(counts=True)
+        if self.history is not None:
+            self.history.clear()
+        if self.scheduler is not None:
+            self.scheduler.reset()
+
+    def detection_rate(self):
+        """Gives the fraction of analyzed frames on which the face detector ran"""
+        return self.face_tracker.detection_rate()
+
+    def analysis_rate(self):
+        """Gives the fraction of frames that were analyzed, when the motion scheduler is enabled"""
+        if self.scheduler is None:
+            return 1.0
+        return self.scheduler.analysis_rate()
+
+    def refresh(self, frame, timestamp=None):
         """Updates the frame and analyzes it.
 
         Args:
             frame (numpy.ndarray): The frame to analyze
+            timestamp (float): When the frame was captured (default: now, from time.monotonic)
+
+        Returns:
+            GazeSample: The results of the frame
         """
         self.frame = frame  # Update the frame
-        self._analyze()  # Analyze the new frame
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        mode = MotionScheduler.FULL if self.scheduler is None else self.scheduler.decide(frame)
+        start = time.perf_counter()
+
+        if mode == MotionScheduler.SKIP:
+            self.sample = self.sample.with_timestamp(timestamp)  # Nothing moved since the last analysis
+        else:
+            with PROFILER.stage("refresh"):
+                self._analyze(mode == MotionScheduler.PARTIAL)  # Analyze the new frame
+
+            # Compute the results once, the accessors below only read them
+            self.sample = GazeSample.from_eyes(self.eye_left, self.eye_right, timestamp)
+
+        if self.scheduler is not None:
+            self.scheduler.done(mode, frame, (self.eye_left, self.eye_right), time.perf_counter() - start)
+        PROFILER.end_frame()
+
+        if self.history is not None:
+            self.history.append(self.sample)
+        return self.sample
+
+    def refresh_many(self, frames, timestamps=None):
+        """Analyzes several frames in a row.
+
+        Args:
+            frames (iterable): The frames to analyze, in order
+            timestamps (iterable): When each frame was captured (optional)
+
+        Returns:
+            list: The GazeSample of each frame
+        """
+        if timestamps is None:
+            return [self.refresh(frame) for frame in frames]
+        return [self.refresh(frame, timestamp) for frame, timestamp in zip(frames, timestamps)]
 
     def pupil_left_coords(self):
         """Gives the coordinates of the left pupil"""
-        if self.pupils_located:  # Check if pupils are located
-            x = self.eye_left.origin[0] + self.eye_left.pupil.x  # Calculate x-coordinate
-            y = self.eye_left.origin[1] + self.eye_left.pupil.y  # Calculate y-coordinate
-            return (x, y)  # Return the coordinates
+        return self.sample.pupil_left
 
     def pupil_right_coords(self):
         """Gives the coordinates of the right pupil"""
-        if self.pupils_located:  # Check if pupils are located
-            x = self.eye_right.origin[0] + self.eye_right.pupil.x  # Calculate x-coordinate
-            y = self.eye_right.origin[1] + self.eye_right.pupil.y  # Calculate y-coordinate
-            return (x, y)  # Return the coordinates
+        return self.sample.pupil_right
 
     def horizontal_ratio(self):
         """Gives a number between 0.0 and 1.0 that shows the horizontal direction of the gaze.
         Looking far right is 0.0, center is 0.5, and far left is 1.0.
         """
-        if self.pupils_located:  # Check if pupils are located
-            pupil_left = self.eye_left.pupil.x / (self.eye_left.center[0] * 2 - 10)  # Calculate left pupil ratio
-            pupil_right = self.eye_right.pupil.x / (self.eye_right.center[0] * 2 - 10)  # Calculate right pupil ratio
-            return (pupil_left + pupil_right) / 2  # Average the ratios
+        return self.sample.horizontal_ratio
 
     def vertical_ratio(self):
         """Gives a number between 0.0 and 1.0 that shows the vertical direction of the gaze.
         Looking far up is 0.0, center is 0.5, and far down is 1.0.
         """
-        if self.pupils_located:  # Check if pupils are located
-            pupil_left = self.eye_left.pupil.y / (self.eye_left.center[1] * 2 - 10)  # Calculate left pupil ratio
-            pupil_right = self.eye_right.pupil.y / (self.eye_right.center[1] * 2 - 10)  # Calculate right pupil ratio
-            return (pupil_left + pupil_right) / 2  # Average the ratios
+        return self.sample.vertical_ratio
 
     def is_right(self):
         """Returns true if the user is looking to the right"""
-        if self.pupils_located:  # Check if pupils are located
-            return self.horizontal_ratio() <= 0.35  # Check if looking right
+        if self.sample.pupils_located:  # Check if pupils are located
+            return self.sample.direction is Direction.RIGHT
 
     def is_left(self):
         """Returns true if the user is looking to the left"""
-        if self.pupils_located:  # Check if pupils are located
-            return self.horizontal_ratio() >= 0.65  # Check if looking left
+        if self.sample.pupils_located:  # Check if pupils are located
+            return self.sample.direction is Direction.LEFT
 
     def is_center(self):
         """Returns true if the user is looking to the center"""
-        if self.pupils_located:  # Check if pupils are located
-            return not self.is_right() and not self.is_left()  # Check if not looking left or right
+        if self.sample.pupils_located:  # Check if pupils are located
+            return self.sample.direction is Direction.CENTER
 
     def is_blinking(self):
         """Returns true if the user is blinking"""
-        if self.pupils_located:  # Check if pupils are located
-            blinking_ratio = (self.eye_left.blinking + self.eye_right.blinking) / 2  # Calculate blinking ratio
-            return blinking_ratio > 3.8  # Check if blinking ratio indicates blinking
+        return self.sample.blinking
 
     def annotated_frame(self):
         """Returns the main frame with pupils highlighted"""
         frame = self.frame.copy()  # Make a copy of the frame
 
-        if self.pupils_located:  # Check if pupils are located
+        if self.sample.pupils_located:  # Check if pupils are located
             color = (0, 255, 0)  # Color for the annotation (green)
-            x_left, y_left = self.pupil_left_coords()  # Get left pupil coordinates
-            x_right, y_right = self.pupil_right_coords()  # Get right pupil coordinates
+            x_left, y_left = map(int, self.sample.pupil_left)  # Get left pupil coordinates
+            x_right, y_right = map(int, self.sample.pupil_right)  # Get right pupil coordinates
             cv2.line(frame, (x_left - 5, y_left), (x_left + 5, y_left), color)  # Draw cross on left pupil
             cv2.line(frame, (x_left, y_left - 5), (x_left, y_left + 5), color)
             cv2.line(frame, (x_right - 5, y_right), (x_right + 5, y_right), color)  # Draw cross on right pupil
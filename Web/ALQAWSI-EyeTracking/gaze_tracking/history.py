@@ -0,0 +1,205 @@
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import math  # For the decay of the distraction score
+import numpy as np  # For the arrays of the ring buffer
+from .sample import Direction  # Importing the gaze directions from the same package
+
+
+class GazeHistory(object):
+    """
+    This class keeps the last samples of a session in a fixed-size ring of
+    NumPy arrays, so its memory doesn't grow with the length of the session.
+    It also updates attention metrics for the whole session on each sample:
+    fixations and saccades, blinks, time spent looking away from the center,
+    and a rolling distraction score.
+    """
+
+    SACCADE_VELOCITY = 1.5  # Gaze ratio per second above which the eyes are moving between fixations
+    DISTRACTION_HALF_LIFE = 10.0  # Seconds after which a distraction counts half in the score
+
+    def __init__(self, capacity=9000):
+        """
+        Args:
+            capacity (int): Number of samples kept (9000 is 5 minutes at 30 frames per second)
+        """
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, np.float64)  # When each frame was captured
+        self.pupils = np.full((capacity, 4), np.nan, np.float32)  # Left x, left y, right x, right y
+        self.ratios = np.full((capacity, 2), np.nan, np.float32)  # Horizontal and vertical ratios
+        self.blinks = np.zeros(capacity, np.int8)  # 1 if blinking, 0 if not, -1 if unknown
+        self.directions = np.zeros(capacity, np.int8)  # Value of the Direction of the gaze
+        self._next = 0  # Index where the next sample goes
+        self.size = 0  # Number of samples kept
+
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        """Starts the session metrics from zero, keeping the stored samples"""
+        self.samples = 0  # Number of samples of the session
+        self.duration = 0.0  # Seconds covered by the session
+        self.fixations = 0  # Number of fixations
+        self.saccades = 0  # Number of saccades
+        self.fixation_time = 0.0  # Seconds spent in fixations
+        self.blink_count = 0  # Number of blinks
+        self.off_center_time = 0.0  # Seconds not looking at the center (or with the eyes not found)
+        self.distraction = 0.0  # Rolling distraction score, from 0.0 (focused) to 1.0 (distracted)
+
+        self._last_time = None
+        self._last_ratios = None
+        self._in_fixation = False
+        self._blinking = False
+
+    def clear(self):
+        """Forgets the stored samples and the session metrics, keeping the arrays"""
+        self._next = 0
+        self.size = 0
+        self.reset_metrics()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, sample):
+        """Stores a sample and updates the metrics.
+
+        Args:
+            sample (GazeSample): The results of the new frame
+        """
+        index = self._next
+        self.timestamps[index] = sample.timestamp
+        if sample.pupils_located:
+            self.pupils[index] = sample.pupil_left + sample.pupil_right
+            self.ratios[index] = (sample.horizontal_ratio, sample.vertical_ratio)
+        else:
+            self.pupils[index] = np.nan
+            self.ratios[index] = np.nan
+        self.blinks[index] = -1 if sample.blinking is None else int(sample.blinking)
+        self.directions[index] = sample.direction.value
+
+        self._next = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self._update_metrics(sample)
+
+    def _update_metrics(self, sample):
+        """Updates the session metrics with a new sample, in constant time"""
+        self.samples += 1
+        dt = 0.0 if self._last_time is None else max(sample.timestamp - self._last_time, 0.0)
+        self._last_time = sample.timestamp
+        self.duration += dt
+
+        # Blinks are counted when the eyes close
+        blinking = bool(sample.blinking)
+        if blinking and not self._blinking:
+            self.blink_count += 1
+        self._blinking = blinking
+
+        # Looking away, or eyes not found, counts as off-center
+        off_center = sample.direction is not Direction.CENTER
+        if off_center:
+            self.off_center_time += dt
+
+        # The score moves toward 1 while distracted and toward 0 while focused
+        if dt:
+            decay = math.exp(-dt * math.log(2) / self.DISTRACTION_HALF_LIFE)
+            self.distraction = decay * self.distraction + (1 - decay) * off_center
+
+        # Fixations and saccades are told apart by the speed of the gaze
+        ratios = (sample.horizontal_ratio, sample.vertical_ratio)
+        if None in ratios or blinking:
+            self._last_ratios = None
+            self._in_fixation = False
+            return
+
+        if self._last_ratios is not None and dt:
+            velocity = math.hypot(ratios[0] - self._last_ratios[0], ratios[1] - self._last_ratios[1]) / dt
+            if velocity > self.SACCADE_VELOCITY:
+                if self._in_fixation:
+                    self.saccades += 1
+                self._in_fixation = False
+            else:
+                if not self._in_fixation:
+                    self.fixations += 1
+                self._in_fixation = True
+                self.fixation_time += dt
+        self._last_ratios = ratios
+
+    def blink_rate(self):
+        """Gives the number of blinks per minute over the session"""
+        if self.duration:
+            return 60 * self.blink_count / self.duration
+
+    def off_center_fraction(self):
+        """Gives the fraction of the session spent not looking at the center"""
+        if self.duration:
+            return self.off_center_time / self.duration
+
+    def mean_fixation_duration(self):
+        """Gives the average duration of a fixation, in seconds"""
+        if self.fixations:
+            return self.fixation_time / self.fixations
+
+    def _segments(self, start):
+        """Gives the slices of the ring holding the samples from the start-th oldest one.
+
+        The samples may wrap around the end of the arrays, so there can be two
+        slices. They are views on the arrays, nothing is copied.
+        """
+        first = (self._next - self.size) % self.capacity  # Index of the oldest sample
+        begin = (first + start) % self.capacity
+        count = self.size - start
+        if count <= 0:
+            return []
+        if begin + count <= self.capacity:
+            return [slice(begin, begin + count)]
+        return [slice(begin, self.capacity), slice(0, begin + count - self.capacity)]
+
+    def _window_start(self, seconds):
+        """Gives the position, from the oldest sample, of the first sample of the last seconds"""
+        if not self.size:
+            return 0
+        newest = self.timestamps[(self._next - 1) % self.capacity]
+        start = 0
+        for part in self._segments(0):
+            found = np.searchsorted(self.timestamps[part], newest - seconds)
+            start += found
+            if found < part.stop - part.start:
+                break
+        return start
+
+    def window(self, seconds=None):
+        """Summarizes the last samples without copying them.
+
+        Args:
+            seconds (float): Duration of the window (None for all the stored samples)
+
+        Returns:
+            dict: The number of frames, the fraction with the pupils located, the mean
+            ratios, the number of blinks and the fraction of frames not looking at the center
+        """
+        start = 0 if seconds is None else self._window_start(seconds)
+        parts = self._segments(start)
+
+        frames = located = off_center = blinks = 0
+        sums = np.zeros(2)
+        previous_blink = 0
+        for part in parts:
+            ratios = self.ratios[part]
+            frames += len(ratios)
+            located += int(np.count_nonzero(~np.isnan(ratios[:, 0])))
+            sums += np.nansum(ratios, axis=0, dtype=np.float64)
+            off_center += int(np.count_nonzero(self.directions[part] != Direction.CENTER.value))
+
+            # Count the frames where the eyes close
+            closed = self.blinks[part] == 1
+            if len(closed):
+                blinks += int(closed[0] and not previous_blink)
+                blinks += int(np.count_nonzero(closed[1:] & ~closed[:-1]))
+                previous_blink = closed[-1]
+
+        means = sums / located if located else (None, None)
+        return {
+            "frames": frames,
+            "located": located / frames if frames else None,
+            "horizontal_ratio": None if not located else float(means[0]),
+            "vertical_ratio": None if not located else float(means[1]),
+            "blinks": blinks,
+            "off_center": off_center / frames if frames else None,
+        }
@@ -0,0 +1,69 @@
+"""
+Strategies to locate the pupil in a binarized eye frame.
+
+Every strategy has the same signature, locate(denoised, iris_frame, threshold,
+subpixel), and gives the (x, y) position of the pupil in the eye frame, or
+None if it can't be found. The iris is black (0) in iris_frame, and denoised
+is the eye frame before binarization.
+"""
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import cv2  # For contours and connected components
+import numpy as np  # For numerical operations
+from .profiler import PROFILER  # Importing the shared profiler from the same package
+
+
+def _position(x, y, subpixel):
+    """Gives the position as floats, or truncated to ints like the original detection"""
+    if subpixel:
+        return float(x), float(y)
+    return int(x), int(y)
+
+
+def contours(denoised, iris_frame, threshold, subpixel=False):
+    """The original strategy: the centroid of the second largest contour of
+    the contour tree, which is usually the border of the iris.
+    """
+    with PROFILER.stage("find_contours"):
+        found, _ = cv2.findContours(iris_frame, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
+    PROFILER.count("contours", len(found))
+    found = sorted(found, key=cv2.contourArea)  # Sort contours by area
+
+    try:
+        moments = cv2.moments(found[-2])
+        return _position(moments['m10'] / moments['m00'], moments['m01'] / moments['m00'], subpixel)
+    except (IndexError, ZeroDivisionError):
+        return None
+
+
+def connected_components(denoised, iris_frame, threshold, subpixel=False):
+    """The centroid of the largest dark blob, found in one pass of connected
+    component labelling, without building a contour hierarchy.
+    """
+    count, _, stats, centroids = cv2.connectedComponentsWithStats(cv2.bitwise_not(iris_frame), connectivity=8)
+    if count < 2:
+        return None  # Only the background
+
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))  # Label 0 is the background
+    x, y = centroids[largest]
+    return _position(x, y, subpixel)
+
+
+def weighted_centroid(denoised, iris_frame, threshold, subpixel=False):
+    """The centroid of the dark region, where each pixel weighs by how much
+    darker than the threshold it is, computed with NumPy moments.
+    """
+    weights = np.clip(threshold + 1 - denoised.astype(np.int16), 0, None)  # 0 above the threshold
+    m00 = weights.sum()
+    if not m00:
+        return None
+
+    m10 = np.dot(weights.sum(axis=0), np.arange(weights.shape[1]))
+    m01 = np.dot(weights.sum(axis=1), np.arange(weights.shape[0]))
+    return _position(m10 / m00, m01 / m00, subpixel)
+
+
+LOCATORS = {
+    "contours": contours,
+    "connected_components": connected_components,
+    "weighted_centroid": weighted_centroid,
+}
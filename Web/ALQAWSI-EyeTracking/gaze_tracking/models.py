@@ -0,0 +1,58 @@
+"""
+Process-wide registry of the dlib models.
+
+The face detector and the 68 landmarks predictor (about 100 MB) are loaded
+once per process, on first use, and shared by every GazeTracking. Calling
+preload() in a parent process before starting worker processes with fork
+lets the workers share the loaded model pages copy-on-write instead of
+reading the file again.
+"""
+import os  # To handle file paths
+import threading  # To load each model only once when trackers are created from several threads
+
+MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                          "trained_models/shape_predictor_68_face_landmarks.dat"))
+
+_lock = threading.Lock()
+_detector = None  # The shared face detector
+_predictors = {}  # The shared landmark predictors, by model path
+
+
+def face_detector():
+    """Gives the shared dlib frontal face detector, loading it on first use"""
+    global _detector
+    if _detector is None:
+        with _lock:
+            if _detector is None:
+                import dlib  # Imported here so that importing gaze_tracking doesn't load dlib
+                _detector = dlib.get_frontal_face_detector()
+    return _detector
+
+
+def landmark_predictor(model_path=MODEL_PATH):
+    """Gives the shared dlib landmark predictor of a model file, loading it on first use.
+
+    Args:
+        model_path (str): Path of the shape predictor model
+    """
+    predictor = _predictors.get(model_path)
+    if predictor is None:
+        with _lock:
+            predictor = _predictors.get(model_path)
+            if predictor is None:
+                import dlib  # Imported here so that importing gaze_tracking doesn't load dlib
+                predictor = _predictors[model_path] = dlib.shape_predictor(model_path)
+    return predictor
+
+
+def preload(model_path=MODEL_PATH):
+    """Loads the detector and the predictor now, typically in a parent process
+    before forking workers, so that they inherit the loaded models.
+    """
+    face_detector()
+    landmark_predictor(model_path)
+
+
+def is_loaded(model_path=MODEL_PATH):
+    """Checks if both models are already loaded in this process"""
+    return _detector is not None and model_path in _predictors
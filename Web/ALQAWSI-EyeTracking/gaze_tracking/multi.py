@@ -0,0 +1,174 @@
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import itertools  # For the subject ids
+import time  # For the timestamps of the samples
+from concurrent.futures import ThreadPoolExecutor  # To analyze the faces in parallel
+import cv2  # For computer vision tasks
+from . import models  # Importing the shared dlib models from the same package
+from .calibration import Calibration  # Importing the Calibration class from the same package
+from .eye import Eye, EyeBuffer  # Importing the Eye and EyeBuffer classes from the same package
+from .profiler import PROFILER  # Importing the shared profiler from the same package
+from .sample import GazeSample  # Importing the per-frame results from the same package
+
+
+def box_overlap(a, b):
+    """Gives the intersection over union of two boxes.
+
+    Args:
+        a (tuple): First box, as (left, top, right, bottom)
+        b (tuple): Second box, as (left, top, right, bottom)
+    """
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union
+
+
+class Subject(object):
+    """
+    This class holds one person seen by a shared camera: their face box,
+    their own calibration, and the results of their last frame.
+    """
+
+    def __init__(self, subject_id, box, calibration_options=None):
+        self.id = subject_id  # Stable identity across frames
+        self.box = box  # Face box on the last frame where the face was seen
+        self.calibration = Calibration(**(calibration_options or {}))  # Calibration of this person's eyes
+        self.eye_buffers = (EyeBuffer(), EyeBuffer())  # Memory reused to isolate the eyes
+        self.eye_left = None
+        self.eye_right = None
+        self.sample = GazeSample()  # Results of the last frame
+        self.missed = 0  # Frames since the face was last seen
+
+
+class MultiGazeTracking(object):
+    """
+    This class tracks the gaze of every face in the frame. The faces are
+    detected once per frame, then the landmarks, eyes and pupils of each face
+    are analyzed on a thread pool. Faces keep the same subject id from one
+    frame to the next by matching their boxes.
+    """
+
+    def __init__(self, threads=None, max_faces=None, min_overlap=0.3, max_missed=15, pupil_method="contours",
+                 subpixel=False, model_path=models.MODEL_PATH, adaptive_calibration=False, pupil_denoise="bilateral"):
+        """
+        Args:
+            threads (int): Threads analyzing the faces (None for the default of ThreadPoolExecutor, 1 for no pool)
+            max_faces (int): Analyze at most this many faces, the largest ones (None for all)
+            min_overlap (float): Intersection over union above which two boxes are the same face
+            max_missed (int): Frames a subject is kept after their face disappeared
+            pupil_method (str): Strategy locating the pupils, one of locators.LOCATORS
+            subpixel (bool): Give the pupil coordinates as floats instead of truncating them
+            model_path (str): Path of the dlib 68 landmarks model
+            adaptive_calibration (bool): Calibrate the pupil detection again when the lighting changes
+            pupil_denoise (str): Filter of the eye frames before the pupil detection, one of pupil.DENOISERS
+        """
+        self.frame = None  # The last analyzed frame
+        self.subjects = {}  # The tracked subjects, by id
+        self.max_faces = max_faces
+        self.min_overlap = min_overlap
+        self.max_missed = max_missed
+        self._pupil_options = {"method": pupil_method, "subpixel": subpixel, "denoise": pupil_denoise}
+        self._calibration_options = {"adaptive": adaptive_calibration, "denoise": pupil_denoise}
+        self._ids = itertools.count(1)
+
+        self._face_detector = models.face_detector()
+        self._predictor = models.landmark_predictor(model_path)
+        self._pool = ThreadPoolExecutor(threads) if threads != 1 else None
+
+    def close(self):
+        """Stops the thread pool"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _match(self, boxes):
+        """Gives the subject of each face box, creating subjects for new faces.
+
+        The pairs of box and subject are matched greedily, from the largest overlap.
+        """
+        pairs = sorted(((box_overlap(box, subject.box), index, subject_id)
+                        for index, box in enumerate(boxes)
+                        for subject_id, subject in self.subjects.items()), reverse=True)
+
+        matched = {}
+        used = set()
+        for overlap, index, subject_id in pairs:
+            if overlap < self.min_overlap:
+                break
+            if index in matched or subject_id in used:
+                continue
+            matched[index] = self.subjects[subject_id]
+            used.add(subject_id)
+
+        subjects = []
+        for index, box in enumerate(boxes):
+            subject = matched.get(index)
+            if subject is None:
+                subject = Subject(next(self._ids), box, self._calibration_options)
+                self.subjects[subject.id] = subject
+            subject.box = box
+            subject.missed = 0
+            subjects.append(subject)
+
+        # Forget the subjects that left
+        seen = set(subject.id for subject in subjects)
+        for subject_id, subject in list(self.subjects.items()):
+            if subject_id not in seen:
+                subject.missed += 1
+                subject.sample = GazeSample()
+                if subject.missed > self.max_missed:
+                    del self.subjects[subject_id]
+        return subjects
+
+    def _analyze_face(self, frame, face, subject, timestamp):
+        """Finds the landmarks, eyes and pupils of one face"""
+        with PROFILER.stage("landmarks"):
+            landmarks = self._predictor(frame, face)
+        subject.eye_left, subject.eye_right = Eye.pair(frame, Eye.landmarks_to_array(landmarks),
+                                                       subject.calibration, subject.eye_buffers,
+                                                       self._pupil_options)
+        subject.sample = GazeSample.from_eyes(subject.eye_left, subject.eye_right, timestamp)
+        return subject.sample
+
+    def refresh(self, frame, timestamp=None):
+        """Updates the frame and analyzes every face in it.
+
+        Args:
+            frame (numpy.ndarray): The frame to analyze
+            timestamp (float): When the frame was captured (default: now, from time.monotonic)
+
+        Returns:
+            dict: The GazeSample of each subject seen on the frame, by subject id
+        """
+        self.frame = frame
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with PROFILER.stage("grayscale"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with PROFILER.stage("face_detection"):
+            faces = list(self._face_detector(gray))
+        PROFILER.count("faces", len(faces))
+
+        if self.max_faces is not None:
+            faces = sorted(faces, key=lambda face: face.area(), reverse=True)[:self.max_faces]
+        subjects = self._match([(face.left(), face.top(), face.right(), face.bottom()) for face in faces])
+
+        if self._pool is None or len(faces) < 2:
+            samples = [self._analyze_face(gray, face, subject, timestamp) for face, subject in zip(faces, subjects)]
+        else:
+            futures = [self._pool.submit(self._analyze_face, gray, face, subject, timestamp)
+                       for face, subject in zip(faces, subjects)]
+            samples = [future.result() for future in futures]
+
+        PROFILER.end_frame()
+        return {subject.id: sample for subject, sample in zip(subjects, samples)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,310 @@
+"""
+Live analysis of one or several cameras, with capture and analysis decoupled.
+
+Each camera is read by its own capture process, which writes the frames
+directly into a ring of slots in shared memory. Analysis workers always take
+the newest frame of their camera and skip the stale ones, so a slow frame
+never delays the capture. A worker copies its frame out of the ring before
+analyzing it, so the capture can reuse the slot right away. The results come
+back over a queue, stamped with the time the frame was captured.
+
+Usage:
+    python -m gaze_tracking.pipeline 0 1 --seconds 30
+"""
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import argparse  # To read the command line arguments
+import collections  # For the result type and the latency history
+import multiprocessing  # For the capture and analysis processes
+import queue  # For the Empty exception of the result queue
+import time  # For the capture timestamps
+from multiprocessing import shared_memory  # For the ring of frames
+import cv2  # For reading the cameras
+import numpy as np  # For views on the shared memory
+from . import models  # Importing the shared dlib models from the same package
+from .batch import sample_row  # Importing the per-frame results from the same package
+from .gaze_tracking import GazeTracking  # Importing the GazeTracking class from the same package
+
+# Results of one frame: the camera, the frame sequence number, when it was
+# captured and analyzed (time.monotonic), then the columns of batch.sample_row()
+FrameResult = collections.namedtuple("FrameResult", [
+    "camera", "seq", "captured", "analyzed",
+    "left_x", "left_y", "right_x", "right_y", "horizontal", "vertical", "blinking",
+])
+
+
+class FrameRing(object):
+    """
+    This class is a fixed-size ring of frames in shared memory. The header
+    holds the sequence number of the newest frame, the last frame claimed by
+    a worker, and the sequence number and timestamp of each slot.
+    """
+
+    def __init__(self, shape, slots=4, name=None):
+        """
+        Args:
+            shape (tuple): Shape of a frame, like (480, 640, 3)
+            slots (int): Number of frames kept in the ring
+            name (str): Name of an existing ring to attach to (None to create one)
+        """
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_size = int(np.prod(self.shape))
+        header_size = 8 * (2 + 2 * slots)
+
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=header_size + slots * frame_size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+
+        buffer = self.memory.buf
+        self._counters = np.ndarray((2,), np.int64, buffer)  # Newest and last claimed frames
+        self._seqs = np.ndarray((slots,), np.int64, buffer, offset=16)  # Frame held by each slot
+        self._times = np.ndarray((slots,), np.float64, buffer, offset=16 + 8 * slots)  # Capture times
+        self._frames = np.ndarray((slots,) + self.shape, np.uint8, buffer, offset=header_size)
+
+        if name is None:
+            self._counters[:] = -1
+            self._seqs[:] = -1
+
+    def slot(self, seq):
+        """Gives the shared frame array where the frame seq is stored"""
+        return self._frames[seq % self.slots]
+
+    def begin_write(self, seq):
+        """Marks the slot of the frame seq as being written, and gives it"""
+        self._seqs[seq % self.slots] = -1
+        return self.slot(seq)
+
+    def end_write(self, seq, timestamp):
+        """Publishes the frame seq once it was written in its slot"""
+        index = seq % self.slots
+        self._times[index] = timestamp
+        self._seqs[index] = seq
+        self._counters[0] = seq
+
+    def claim_newest(self, lock):
+        """Claims the newest frame that no worker took yet.
+
+        Args:
+            lock (multiprocessing.Lock): Lock shared by the workers of the ring
+
+        Returns:
+            int: The sequence number of the frame, or None if there is no new frame
+        """
+        with lock:
+            newest = int(self._counters[0])
+            if newest <= self._counters[1]:
+                return None
+            self._counters[1] = newest
+            return newest
+
+    def is_valid(self, seq):
+        """Checks that the slot of the frame seq still holds it"""
+        return self._seqs[seq % self.slots] == seq
+
+    def read(self, seq, out):
+        """Copies the frame seq out of the ring.
+
+        The capture marks a slot before writing it, so if the slot still holds
+        the frame after the copy, the copy wasn't torn by a write.
+
+        Args:
+            seq (int): Sequence number of the frame
+            out (numpy.ndarray): Array of the shape of the frames, receiving the copy
+
+        Returns:
+            bool: True if the copy holds the frame, False if it was overwritten
+        """
+        if not self.is_valid(seq):
+            return False
+        np.copyto(out, self.slot(seq))
+        return self.is_valid(seq)
+
+    def timestamp(self, seq):
+        """Gives the capture time of the frame seq"""
+        return float(self._times[seq % self.slots])
+
+    def close(self, unlink=False):
+        """Detaches from the shared memory, and frees it if unlink is True"""
+        del self._counters, self._seqs, self._times, self._frames
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _capture_loop(source, ring_name, shape, slots, stop):
+    """Reads a camera into its ring until stop is set"""
+    ring = FrameRing(shape, slots, ring_name)
+    height, width = shape[:2]
+    camera = cv2.VideoCapture(source)
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    seq = 0
+    try:
+        while not stop.is_set():
+            target = ring.begin_write(seq)
+            ok, frame = camera.read(target)  # Decodes directly into the shared slot when the shape matches
+            if not ok:
+                break
+            if frame is not target:
+                target[...] = cv2.resize(frame, (width, height))  # The camera ignored the requested size
+            ring.end_write(seq, time.monotonic())
+            seq += 1
+    finally:
+        camera.release()
+        ring.close()
+
+
+def _analysis_loop(camera, ring_name, shape, slots, lock, results, stop, tracker_options):
+    """Analyzes the newest frames of a ring until stop is set"""
+    ring = FrameRing(shape, slots, ring_name)
+    gaze = GazeTracking(**tracker_options)
+    frame = np.empty(shape, np.uint8)  # The analyzed frame, copied out of the ring
+
+    try:
+        while not stop.is_set():
+            seq = ring.claim_newest(lock)
+            if seq is None:
+                time.sleep(0.001)
+                continue
+
+            if not ring.read(seq, frame):
+                continue  # The capture wrapped around the ring before the frame was copied
+            captured = ring.timestamp(seq)
+            if not ring.is_valid(seq):
+                continue
+
+            # The tracker only sees the copy, so a slow analysis can't be given a torn frame
+            sample = gaze.refresh(frame, captured)
+
+            results.put(FrameResult(camera, seq, captured, time.monotonic(), *sample_row(sample)))
+    finally:
+        ring.close()
+
+
+class GazePipeline(object):
+    """
+    This class runs the capture and analysis processes of several cameras,
+    and collects their results and end-to-end latencies.
+    """
+
+    def __init__(self, sources, workers_per_camera=1, shape=(480, 640, 3), slots=4, tracker_options=None,
+                 history=10000):
+        """
+        Args:
+            sources (list): Cameras to read, as indices or video paths/URLs
+            workers_per_camera (int): Number of analysis processes per camera
+            shape (tuple): Shape of the frames in the rings
+            slots (int): Number of frames in each ring
+            tracker_options (dict): Arguments given to each GazeTracking
+            history (int): Number of latencies kept for the percentiles
+        """
+        self.sources = list(sources)
+        self.workers_per_camera = workers_per_camera
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.tracker_options = tracker_options or {}
+
+        self.latencies = collections.deque(maxlen=history)  # Seconds from capture to result
+        self.received = 0  # Number of results received
+        self._rings = []
+        self._processes = []
+        self._results = None
+        self._stop = None
+
+    def start(self):
+        """Starts the capture and analysis processes"""
+        self._stop = multiprocessing.Event()
+        self._results = multiprocessing.Queue()
+
+        # Forked workers inherit the models loaded here instead of each reading the file
+        if multiprocessing.get_start_method() == "fork":
+            models.preload(self.tracker_options.get("model_path", models.MODEL_PATH))
+
+        for camera, source in enumerate(self.sources):
+            ring = FrameRing(self.shape, self.slots)
+            lock = multiprocessing.Lock()
+            self._rings.append(ring)
+
+            self._processes.append(multiprocessing.Process(
+                target=_capture_loop, args=(source, ring.name, self.shape, self.slots, self._stop), daemon=True))
+            for _ in range(self.workers_per_camera):
+                self._processes.append(multiprocessing.Process(
+                    target=_analysis_loop, daemon=True,
+                    args=(camera, ring.name, self.shape, self.slots, lock, self._results, self._stop,
+                          self.tracker_options)))
+
+        for process in self._processes:
+            process.start()
+
+    def results(self, timeout=None):
+        """Yields the results as they arrive.
+
+        Args:
+            timeout (float): Stop after this many seconds (None to run until stop())
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set() and (deadline is None or time.monotonic() < deadline):
+            try:
+                result = self._results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            self.latencies.append(time.monotonic() - result.captured)
+            self.received += 1
+            yield result
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        """Gives the end-to-end latency percentiles, in milliseconds"""
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.fromiter(self.latencies, np.float64), percentiles) * 1000
+        return dict(zip(percentiles, values))
+
+    def stop(self):
+        """Stops the processes and frees the shared memory"""
+        if self._stop is None:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._rings:
+            ring.close(unlink=True)
+        self._rings = []
+        self._processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze the gaze on live cameras.")
+    parser.add_argument("sources", nargs="*", default=["0"], help="Camera indices or video URLs")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Analysis processes per camera")
+    parser.add_argument("--width", type=int, default=640, help="Width of the frames")
+    parser.add_argument("--height", type=int, default=480, help="Height of the frames")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of the run")
+    args = parser.parse_args(argv)
+
+    sources = [int(source) if source.isdigit() else source for source in args.sources]
+    with GazePipeline(sources, args.workers, (args.height, args.width, 3)) as pipeline:
+        start = time.monotonic()
+        for _ in pipeline.results(timeout=args.seconds):
+            pass
+        elapsed = time.monotonic() - start
+
+        print("Results: {} ({:.1f} per second)".format(pipeline.received, pipeline.received / elapsed))
+        for percentile, latency in pipeline.latency_percentiles().items():
+            print("Latency p{}: {:.1f} ms".format(percentile, latency))
+
+
+if __name__ == "__main__":
+    main()
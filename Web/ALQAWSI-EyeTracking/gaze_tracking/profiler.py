@@ -0,0 +1,159 @@
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import collections  # For the bounded timing histories
+import json  # For the trace file
+import os  # For the process id in the trace
+import threading  # For the thread id in the trace
+import time  # For the timings
+import numpy as np  # For the percentiles
+
+
+class _NoStage(object):
+    """Context manager that does nothing, used while the profiler is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage(object):
+    """Context manager that times one stage of the pipeline"""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler(object):
+    """
+    This class records how long each stage of the gaze pipeline takes, and
+    counts events per frame. It is disabled by default, and then costs almost
+    nothing: stage() gives a shared context manager that does nothing.
+    """
+
+    def __init__(self, history=10000):
+        """
+        Args:
+            history (int): Number of timings kept per stage (and trace events in total)
+        """
+        self.enabled = False
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        """Forgets all the recorded timings and counters"""
+        self.timings = collections.defaultdict(lambda: collections.deque(maxlen=self.history))  # Seconds per stage
+        self.counters = collections.Counter()  # Totals of the counters
+        self.frames = 0  # Number of frames ended with end_frame()
+        self._events = collections.deque(maxlen=self.history)  # (name, start, end, thread) for the trace
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        """Starts recording"""
+        self.enabled = True
+
+    def disable(self):
+        """Stops recording, keeping what was recorded"""
+        self.enabled = False
+
+    def stage(self, name):
+        """Gives a context manager timing a stage of the pipeline.
+
+        Args:
+            name (str): Name of the stage, like "face_detection"
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, start, end):
+        """Records a timing measured by the caller, in time.perf_counter() seconds"""
+        if not self.enabled:
+            return
+        self.timings[name].append(end - start)
+        self._events.append((name, start, end, threading.get_ident()))
+
+    def count(self, name, value=1):
+        """Adds a value to a counter, like the number of contours found"""
+        if self.enabled:
+            self.counters[name] += value
+
+    def end_frame(self):
+        """Marks the end of a frame, to report the counters per frame"""
+        if self.enabled:
+            self.frames += 1
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Summarizes the timings of each stage and the counters.
+
+        Returns:
+            dict: Per stage the number of calls, the mean and the percentiles in milliseconds,
+            and per counter its total and its average per frame
+        """
+        stages = {}
+        for name, values in self.timings.items():
+            if not values:
+                continue
+            milliseconds = np.fromiter(values, np.float64) * 1000
+            stage = {"calls": len(milliseconds), "mean_ms": float(milliseconds.mean())}
+            for percentile, value in zip(percentiles, np.percentile(milliseconds, percentiles)):
+                stage["p{}_ms".format(percentile)] = float(value)
+            stages[name] = stage
+
+        counters = {name: {"total": total, "per_frame": total / self.frames if self.frames else None}
+                    for name, total in self.counters.items()}
+        return {"frames": self.frames, "stages": stages, "counters": counters}
+
+    def format_summary(self):
+        """Gives the summary as a text table"""
+        summary = self.summary()
+        lines = ["{:<20} {:>7} {:>9} {:>9} {:>9} {:>9}".format("stage", "calls", "mean ms", "p50 ms", "p90 ms",
+                                                                "p99 ms")]
+        for name, stage in sorted(summary["stages"].items()):
+            lines.append("{:<20} {:>7} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+                name, stage["calls"], stage["mean_ms"], stage["p50_ms"], stage["p90_ms"], stage["p99_ms"]))
+        for name, counter in sorted(summary["counters"].items()):
+            per_frame = counter["per_frame"]
+            lines.append("{:<20} {:>7} {}".format(
+                name, counter["total"], "" if per_frame is None else "({:.2f} per frame)".format(per_frame)))
+        return "\n".join(lines)
+
+    def export_summary(self, path):
+        """Saves the summary as a JSON file"""
+        with open(path, "w") as output:
+            json.dump(self.summary(), output, indent=2)
+
+    def export_trace(self, path):
+        """Saves the recorded stages as a trace file (Chrome trace event format),
+        which can be opened in chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        events = [{
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": pid,
+            "tid": thread,
+        } for name, start, end, thread in self._events]
+
+        with open(path, "w") as output:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, output)
+
+
+PROFILER = Profiler()  # The profiler shared by the whole gaze_tracking package
@@ -1,5 +1,39 @@
 import numpy as np  # For numerical operations
 import cv2  # For computer vision tasks
+from .locators import LOCATORS, _position  # Importing the pupil localisation strategies from the same package
+from .profiler import PROFILER  # Importing the shared profiler from the same package
+
+
+def _bilateral(frame):
+    """The original filter: it keeps the border of the iris sharp, but it is slow"""
+    return cv2.bilateralFilter(frame, 10, 15, 15)
+
+
+def _small_bilateral(frame):
+    """A bilateral filter over 5 pixels instead of 10, about 8 times cheaper"""
+    return cv2.bilateralFilter(frame, 5, 15, 15)
+
+
+def _gaussian(frame):
+    """A 5x5 Gaussian blur, the cheapest, which also softens the border of the iris"""
+    return cv2.GaussianBlur(frame, (5, 5), 0)
+
+
+# Filters applied before the erosion
+DENOISERS = {
+    "bilateral": _bilateral,
+    "small_bilateral": _small_bilateral,
+    "gaussian": _gaussian,
+}
+
+
+def _check_options(method, denoise):
+    """Raises a ValueError for an unknown localisation strategy or filter"""
+    if method not in LOCATORS:
+        raise ValueError("Unknown pupil method {!r}, expected one of {}".format(method, sorted(LOCATORS)))
+    if denoise not in DENOISERS:
+        raise ValueError("Unknown denoise filter {!r}, expected one of {}".format(denoise, sorted(DENOISERS)))
+
 
 class Pupil(object):
     """
@@ -7,58 +41,169 @@ class Pupil(object):
     the position of the pupil.
     """
 
-    def __init__(self, eye_frame, threshold):
+    KERNEL = np.ones((3, 3), np.uint8)  # Kernel for morphological operations
+    EROSIONS = 3  # Number of erosions by KERNEL
+    EROSION_KERNEL = np.ones((2 * EROSIONS + 1, 2 * EROSIONS + 1), np.uint8)  # The three erosions at once
+
+    def __init__(self, eye_frame, threshold, method="contours", subpixel=False, denoise="bilateral"):
+        """
+        Args:
+            eye_frame (numpy.ndarray): Frame that only contains the eye
+            threshold (int): Threshold value for binarizing the frame
+            method (str): Localisation strategy, one of locators.LOCATORS
+            subpixel (bool): Give the position as floats instead of truncating it
+            denoise (str): Filter applied before the erosion, one of DENOISERS
+        """
+        _check_options(method, denoise)
+
         self.iris_frame = None  # This will store the processed frame containing the iris
         self.threshold = threshold  # Threshold value for binarization
+        self.method = method  # Name of the localisation strategy
+        self.subpixel = subpixel  # Whether the position keeps its decimals
+        self.denoise_filter = denoise  # Name of the filter
         self.x = None  # X-coordinate of the pupil
         self.y = None  # Y-coordinate of the pupil
 
         self.detect_iris(eye_frame)  # Start the iris detection process
 
     @staticmethod
-    def image_processing(eye_frame, threshold):
+    def denoise(eye_frame, method="bilateral"):
+        """Filters and erodes the eye frame. This part of the processing does
+        not depend on the threshold, so it can be shared between thresholds.
+
+        Args:
+            eye_frame (numpy.ndarray): Frame that only contains the eye
+            method (str): Filter applied before the erosion, one of DENOISERS
+
+        Returns:
+            numpy.ndarray: The denoised (not yet binarized) frame
+        """
+        # Reduce the noise, by default with a bilateral filter that keeps edges sharp
+        with PROFILER.stage(method + "_filter"):
+            new_frame = DENOISERS[method](eye_frame)
+
+        # Erode the image to remove small white noise and detach connected objects
+        # (one erosion by a 7x7 square gives the same result as three by a 3x3 one)
+        with PROFILER.stage("erode"):
+            new_frame = cv2.erode(new_frame, Pupil.EROSION_KERNEL)
+
+        return new_frame  # Return the denoised frame
+
+    @staticmethod
+    def image_processing(eye_frame, threshold, denoise="bilateral"):
         """Processes the eye frame to isolate the iris.
 
         Args:
             eye_frame (numpy.ndarray): Frame that only contains the eye
             threshold (int): Threshold value for binarizing the frame
+            denoise (str): Filter applied before the erosion, one of DENOISERS
 
         Returns:
             numpy.ndarray: A frame where the iris is isolated
         """
-        # Create a kernel for morphological operations
-        kernel = np.ones((3, 3), np.uint8)
-        
-        # Apply bilateral filter to reduce noise and keep edges sharp
-        new_frame = cv2.bilateralFilter(eye_frame, 10, 15, 15)
-        
-        # Erode the image to remove small white noise and detach connected objects
-        new_frame = cv2.erode(new_frame, kernel, iterations=3)
-        
+        new_frame = Pupil.denoise(eye_frame, denoise)  # Filter and erode the frame
+
         # Binarize the frame using the given threshold
         new_frame = cv2.threshold(new_frame, threshold, 255, cv2.THRESH_BINARY)[1]
 
         return new_frame  # Return the processed frame
 
     def detect_iris(self, eye_frame):
-        """Detects the iris and estimates its position by calculating the centroid.
+        """Detects the iris and estimates its position with the chosen strategy.
 
         Args:
             eye_frame (numpy.ndarray): Frame that only contains the eye
         """
         # Process the frame to isolate the iris
-        self.iris_frame = self.image_processing(eye_frame, self.threshold)
-
-        # Find contours in the processed frame
-        contours, _ = cv2.findContours(self.iris_frame, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
-        contours = sorted(contours, key=cv2.contourArea)  # Sort contours by area
-
-        try:
-            # Get the moments of the largest contour
-            moments = cv2.moments(contours[-2])
-            
-            # Calculate the x and y coordinates of the centroid
-            self.x = int(moments['m10'] / moments['m00'])
-            self.y = int(moments['m01'] / moments['m00'])
-        except (IndexError, ZeroDivisionError):
-            pass  # Handle cases where moments can't be calculated
+        denoised = self.denoise(eye_frame, self.denoise_filter)
+        self.iris_frame = cv2.threshold(denoised, self.threshold, 255, cv2.THRESH_BINARY)[1]
+
+        # Locate the pupil in the processed frame (the contours strategy also
+        # records the find_contours stage and the contours counter)
+        with PROFILER.stage("pupil_" + self.method):
+            position = LOCATORS[self.method](denoised, self.iris_frame, self.threshold, self.subpixel)
+
+        if position is not None:
+            self.x, self.y = position
+
+
+class PupilBatch(object):
+    """
+    This class locates the pupils of many eye crops at once, like when the
+    crops of a recording are scored again offline. Each crop is filtered and
+    eroded on its own, so the positions are exactly those of Pupil. With the
+    weighted_centroid method, the denoised crops are stacked in one buffer,
+    and all the pupils are located with a single pass over it. The other
+    methods, and batches of a few crops like the two eyes of a frame, locate
+    the crops one by one, as fast as Pupil.
+    """
+
+    STACKED_MIN = 8  # Fewest crops for which stacking them saves more than it costs
+
+    def __init__(self, eye_frames, thresholds, method="contours", subpixel=False, denoise="bilateral"):
+        """
+        Args:
+            eye_frames (list): Frames that only contain an eye, of any sizes
+            thresholds: Threshold value of each frame, or one value for all of them
+            method (str): Localisation strategy, one of locators.LOCATORS
+            subpixel (bool): Give the positions as floats instead of truncating them
+            denoise (str): Filter applied before the erosion, one of DENOISERS
+        """
+        _check_options(method, denoise)
+
+        self.method = method  # Name of the localisation strategy
+        self.subpixel = subpixel  # Whether the positions keep their decimals
+        self.denoise_filter = denoise  # Name of the filter
+        if np.ndim(thresholds) == 0:
+            thresholds = [thresholds] * len(eye_frames)
+        self.thresholds = [int(threshold) for threshold in thresholds]  # Threshold value of each frame
+        self.positions = []  # Position (x, y) of each pupil in its frame, or None
+
+        if method == "weighted_centroid" and len(eye_frames) >= self.STACKED_MIN:
+            self.positions = self._weighted_centroids(eye_frames)
+            return
+
+        locate = LOCATORS[method]
+        for eye_frame, threshold in zip(eye_frames, self.thresholds):
+            denoised = Pupil.denoise(eye_frame, denoise)
+            iris_frame = cv2.threshold(denoised, threshold, 255, cv2.THRESH_BINARY)[1]
+            with PROFILER.stage("pupil_" + method):
+                self.positions.append(locate(denoised, iris_frame, threshold, subpixel))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _weighted_centroids(self, eye_frames):
+        """Locates the pupils like locators.weighted_centroid, with the moments
+        of all the crops computed on the denoised crops stacked in one buffer.
+
+        Args:
+            eye_frames (list): Frames that only contain an eye
+
+        Returns:
+            list: The position of each pupil, or None
+        """
+        heights = np.array([frame.shape[0] for frame in eye_frames])
+        widths = np.array([frame.shape[1] for frame in eye_frames])
+        offsets = np.concatenate(([0], np.cumsum(heights)[:-1]))  # First row of each crop in the buffer
+
+        # The columns right of a narrower crop stay white, so they weigh nothing
+        stacked = np.full((int(heights.sum()), int(widths.max())), 255, np.uint8)
+        for offset, eye_frame, height, width in zip(offsets, eye_frames, heights, widths):
+            stacked[offset:offset + height, :width] = Pupil.denoise(eye_frame, self.denoise_filter)
+
+        with PROFILER.stage("pupil_" + self.method):
+            row_thresholds = np.repeat(np.array(self.thresholds, np.int16), heights)[:, np.newaxis]
+            weights = np.clip(row_thresholds + 1 - stacked, 0, None)  # 0 above the threshold
+            if max(self.thresholds) >= 255:
+                # Even white weighs something, so the padding has to be left out
+                weights[np.arange(weights.shape[1]) >= np.repeat(widths, heights)[:, np.newaxis]] = 0
+
+            row_sums = weights.sum(axis=1)
+            rows = np.arange(len(row_sums)) - np.repeat(offsets, heights)  # Row of each line in its crop
+            m00 = np.add.reduceat(row_sums, offsets)
+            m10 = np.add.reduceat(weights.dot(np.arange(weights.shape[1])), offsets)
+            m01 = np.add.reduceat(row_sums * rows, offsets)
+
+        return [_position(x / total, y / total, self.subpixel) if total else None
+                for total, x, y in zip(m00.tolist(), m10.tolist(), m01.tolist())]
@@ -0,0 +1,302 @@
+"""
+Compact recording of the landmarks of a session, to score it again later.
+
+Finding the face and its 68 landmarks is by far the slowest part of the
+analysis. A recording keeps, for every frame, the landmarks (int16), the
+crops of both eyes with the pupil found in each of them, and the timestamp,
+as fixed-size records appended to a binary file (about 320 bytes a frame).
+
+A Replay memory-maps the file and computes the blinking ratios, the gaze
+ratios and the directions of all the frames at once with NumPy, so new
+thresholds can be tried on a whole session without decoding the video.
+
+Usage:
+    python -m gaze_tracking.recording record session.mp4 session.gazerec
+    python -m gaze_tracking.recording replay session.gazerec --blinking-limit 4.2
+"""
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import argparse  # To read the command line arguments
+import os  # To check the size of the files
+import numpy as np  # For the records and the vectorized metrics
+from .batch import iter_frames  # Importing the video reader from the same package
+from .eye import Eye  # Importing the Eye class from the same package
+from .gaze_tracking import GazeTracking  # Importing the GazeTracking class from the same package
+from .sample import Direction, GazeSample  # Importing the default thresholds from the same package
+
+MAGIC = b"GAZEREC1"  # First bytes of a recording
+VERSION = 1
+
+HEADER = np.dtype([("magic", "S8"), ("version", "<u2"), ("record_size", "<u2"), ("reserved", "<u4")])
+
+FACE_FOUND = 1  # Flag of the records where the eyes of a face were isolated
+LEFT_PUPIL = 2  # Flag of the records where the left pupil was located
+RIGHT_PUPIL = 4  # Flag of the records where the right pupil was located
+
+# One frame of the recording
+RECORD = np.dtype([
+    ("timestamp", "<f8"),  # When the frame was captured, in seconds
+    ("flags", "u1"),  # FACE_FOUND, LEFT_PUPIL and RIGHT_PUPIL
+    ("threshold", "u1", (2,)),  # Binarization threshold of each eye
+    ("landmarks", "<i2", (68, 2)),  # The 68 facial landmarks
+    ("origin", "<i2", (2, 2)),  # Top-left corner of the crop of each eye in the frame
+    ("size", "<i2", (2, 2)),  # Width and height of the crop of each eye
+    ("pupil", "<f4", (2, 2)),  # Position of each pupil in its crop (NaN if not located)
+])
+
+
+class LandmarkRecorder(object):
+    """
+    This class appends the landmarks and eyes of each analyzed frame to a
+    recording. The records are buffered and written in blocks.
+    """
+
+    def __init__(self, path, buffer_size=256):
+        """
+        Args:
+            path (str): File of the recording, created or continued
+            buffer_size (int): Records kept in memory before they are written
+        """
+        self.path = path
+        self._buffer = np.zeros(buffer_size, RECORD)
+        self._pending = 0  # Records waiting in the buffer
+
+        existing = os.path.getsize(path) if os.path.exists(path) else 0
+        self._file = open(path, "r+b" if existing else "wb")
+        if existing:
+            header = np.frombuffer(self._file.read(HEADER.itemsize), HEADER)[0]
+            if header["magic"] != MAGIC or header["record_size"] != RECORD.itemsize:
+                self._file.close()
+                raise ValueError("{} is not a recording of this version".format(path))
+
+            # Drop a record left incomplete by a crash, so the next ones stay aligned
+            records = (existing - HEADER.itemsize) // RECORD.itemsize
+            self._file.truncate(HEADER.itemsize + records * RECORD.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            header = np.array([(MAGIC, VERSION, RECORD.itemsize, 0)], HEADER)
+            self._file.write(header.tobytes())
+
+    def record(self, timestamp, landmarks=None, eye_left=None, eye_right=None):
+        """Appends a frame to the recording.
+
+        Args:
+            timestamp (float): When the frame was captured
+            landmarks (numpy.ndarray): The 68 landmarks as a (68, 2) array, or None if no face was found
+            eye_left (eye.Eye): The left eye, or None if no face was found
+            eye_right (eye.Eye): The right eye, or None if no face was found
+        """
+        record = self._buffer[self._pending]
+        record["timestamp"] = timestamp
+        record["pupil"] = np.nan
+        flags = 0
+
+        if landmarks is not None and eye_left is not None and eye_right is not None:
+            flags = FACE_FOUND
+            record["landmarks"] = landmarks
+            for side, (eye, flag) in enumerate(((eye_left, LEFT_PUPIL), (eye_right, RIGHT_PUPIL))):
+                height, width = eye.frame.shape[:2]
+                record["origin"][side] = eye.origin
+                record["size"][side] = (width, height)
+                if eye.pupil is not None:
+                    record["threshold"][side] = eye.pupil.threshold
+                    if eye.pupil.x is not None and eye.pupil.y is not None:
+                        record["pupil"][side] = (eye.pupil.x, eye.pupil.y)
+                        flags |= flag
+        else:
+            record["landmarks"] = 0
+            record["origin"] = 0
+            record["size"] = 0
+            record["threshold"] = 0
+        record["flags"] = flags
+
+        self._pending += 1
+        if self._pending == len(self._buffer):
+            self.flush()
+
+    def record_tracker(self, gaze):
+        """Appends the last frame analyzed by a GazeTracking"""
+        landmarks = gaze.face_tracker.points if gaze.sample.face_found else None
+        self.record(gaze.sample.timestamp, landmarks, gaze.eye_left, gaze.eye_right)
+
+    def flush(self):
+        """Writes the buffered records to the file"""
+        if self._pending:
+            self._file.write(self._buffer[:self._pending].tobytes())
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        """Writes the buffered records and closes the file"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replay(object):
+    """
+    This class reads a recording through a memory map and scores all its
+    frames at once, with the thresholds of GazeSample or new ones.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): File of the recording
+        """
+        header = np.fromfile(path, HEADER, count=1)
+        if not len(header) or header[0]["magic"] != MAGIC or header[0]["record_size"] != RECORD.itemsize:
+            raise ValueError("{} is not a recording of this version".format(path))
+
+        count = (os.path.getsize(path) - HEADER.itemsize) // RECORD.itemsize
+        if count:
+            self.records = np.memmap(path, RECORD, mode="r", offset=HEADER.itemsize, shape=(count,))
+        else:
+            self.records = np.zeros(0, RECORD)  # An empty file can't be mapped
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records["timestamp"]
+
+    def blinking_ratios(self):
+        """Gives the blinking ratio of each eye of each frame, like Eye.blinking_ratios.
+
+        Returns:
+            numpy.ndarray: A (n, 2) array, NaN when the eye height is zero or there is no face
+        """
+        ratios = Eye.blinking_ratio_array(self.records["landmarks"][:, Eye.EYES_POINTS])  # (n, 2)
+        ratios[(self.records["flags"] & FACE_FOUND) == 0] = np.nan
+        return ratios
+
+    def gaze_ratios(self):
+        """Gives the horizontal and vertical ratio of each frame, like GazeSample.
+
+        Returns:
+            numpy.ndarray: A (n, 2) array, NaN when the pupils were not located
+        """
+        located = (self.records["flags"] & (LEFT_PUPIL | RIGHT_PUPIL)) == (LEFT_PUPIL | RIGHT_PUPIL)
+        span = self.records["size"].astype(np.float64) - 10  # (center * 2 - 10), per eye and axis
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = self.records["pupil"] / span  # (n, 2 eyes, 2 axes)
+        ratios[span == 0] = np.nan
+        ratios = ratios.mean(axis=1)
+        ratios[~located] = np.nan
+        return ratios
+
+    def score(self, right_limit=GazeSample.RIGHT_LIMIT, left_limit=GazeSample.LEFT_LIMIT,
+              blinking_limit=GazeSample.BLINKING_LIMIT):
+        """Scores every frame of the recording.
+
+        Args:
+            right_limit (float): Horizontal ratio at or below which the user looks right
+            left_limit (float): Horizontal ratio at or above which the user looks left
+            blinking_limit (float): Blinking ratio above which the eyes are closed
+
+        Returns:
+            dict: One array per column: timestamp, horizontal, vertical, blinking_ratio,
+            blinking (1, 0, or -1 if unknown) and direction (values of Direction)
+        """
+        ratios = self.gaze_ratios()
+        horizontal, vertical = ratios[:, 0], ratios[:, 1]
+        blinking_ratio = self.blinking_ratios().mean(axis=1)
+
+        # Like GazeSample.from_eyes, blinking is only known when the pupils were located
+        known = ~np.isnan(horizontal) & ~np.isnan(blinking_ratio)
+        blinking = np.full(len(self), -1, np.int8)
+        blinking[known] = blinking_ratio[known] > blinking_limit
+
+        direction = np.full(len(self), Direction.UNKNOWN.value, np.int8)
+        located = ~np.isnan(horizontal)
+        direction[located] = Direction.CENTER.value
+        direction[located & (horizontal <= right_limit)] = Direction.RIGHT.value
+        direction[located & (horizontal >= left_limit)] = Direction.LEFT.value
+
+        return {
+            "timestamp": np.asarray(self.timestamps),
+            "horizontal": horizontal,
+            "vertical": vertical,
+            "blinking_ratio": blinking_ratio,
+            "blinking": blinking,
+            "direction": direction,
+        }
+
+    @staticmethod
+    def summary(scores):
+        """Summarizes the scores of a session.
+
+        Args:
+            scores (dict): The result of score()
+
+        Returns:
+            dict: The duration, the number of blinks and the blinks per minute, and
+            the fraction of the frames with each direction
+        """
+        timestamps = scores["timestamp"]
+        duration = float(timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0.0
+        closed = scores["blinking"] == 1
+        blinks = int(np.count_nonzero(closed[1:] & ~closed[:-1]) + (closed[0] if len(closed) else 0))
+
+        directions = np.bincount(scores["direction"], minlength=len(Direction)) / max(len(timestamps), 1)
+        summary = {"frames": len(timestamps), "duration": duration, "blinks": blinks,
+                   "blinks_per_minute": blinks * 60 / duration if duration else None}
+        for direction in Direction:
+            summary[direction.name.lower()] = float(directions[direction.value])
+        return summary
+
+
+def record_video(path, output, tracker_options=None):
+    """Analyzes a video and records its landmarks.
+
+    Args:
+        path (str): Path of the video
+        output (str): File of the recording
+        tracker_options (dict): Arguments of GazeTracking
+
+    Returns:
+        int: The number of recorded frames
+    """
+    gaze = GazeTracking(history_size=0, **(tracker_options or {}))
+    count = 0
+    with LandmarkRecorder(output) as recorder:
+        for _, timestamp, frame in iter_frames(path):
+            gaze.refresh(frame, timestamp)
+            recorder.record_tracker(gaze)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the landmarks of a video, or score a recording.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    record = commands.add_parser("record", help="Analyze a video and record its landmarks")
+    record.add_argument("video", help="Video to analyze")
+    record.add_argument("output", help="File of the recording")
+
+    replay = commands.add_parser("replay", help="Score a recording")
+    replay.add_argument("recording", help="File of the recording")
+    replay.add_argument("--right-limit", type=float, default=GazeSample.RIGHT_LIMIT)
+    replay.add_argument("--left-limit", type=float, default=GazeSample.LEFT_LIMIT)
+    replay.add_argument("--blinking-limit", type=float, default=GazeSample.BLINKING_LIMIT)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        print("{} frames recorded".format(record_video(args.video, args.output)))
+        return
+
+    scores = Replay(args.recording).score(args.right_limit, args.left_limit, args.blinking_limit)
+    for name, value in Replay.summary(scores).items():
+        print("{:<18} {}".format(name, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import enum  # For the gaze directions
+
+
+class Direction(enum.Enum):
+    """Horizontal direction of the gaze"""
+    UNKNOWN = 0  # The pupils were not located
+    RIGHT = 1
+    CENTER = 2
+    LEFT = 3
+
+
+class GazeSample(object):
+    """
+    This class holds the results of one analyzed frame. Everything is computed
+    once when the sample is created, and the sample can't be modified after.
+    """
+
+    RIGHT_LIMIT = 0.35  # Horizontal ratio at or below which the user looks right
+    LEFT_LIMIT = 0.65  # Horizontal ratio at or above which the user looks left
+    BLINKING_LIMIT = 3.8  # Blinking ratio above which the eyes are closed
+
+    __slots__ = (
+        "timestamp",  # When the frame was analyzed or captured, in seconds
+        "face_found",  # True if the eyes of a face were isolated
+        "pupils_located",  # True if both pupils were found
+        "pupil_left",  # Coordinates of the left pupil in the frame, or None
+        "pupil_right",  # Coordinates of the right pupil in the frame, or None
+        "horizontal_ratio",  # 0.0 (far right) to 1.0 (far left), or None
+        "vertical_ratio",  # 0.0 (far up) to 1.0 (far down), or None
+        "blinking_ratio",  # Average width / height of the eyes, or None
+        "blinking",  # True if the eyes are closed, None if the pupils were not located
+        "direction",  # The Direction of the gaze
+    )
+
+    def __init__(self, timestamp=None, face_found=False, pupils_located=False, pupil_left=None, pupil_right=None,
+                 horizontal_ratio=None, vertical_ratio=None, blinking_ratio=None, blinking=None,
+                 direction=Direction.UNKNOWN):
+        values = (timestamp, face_found, pupils_located, pupil_left, pupil_right,
+                  horizontal_ratio, vertical_ratio, blinking_ratio, blinking, direction)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GazeSample is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("GazeSample is immutable")
+
+    def __repr__(self):
+        fields = ", ".join("{}={!r}".format(name, getattr(self, name)) for name in self.__slots__)
+        return "GazeSample({})".format(fields)
+
+    def __reduce__(self):
+        return GazeSample, tuple(getattr(self, name) for name in self.__slots__)
+
+    def with_timestamp(self, timestamp):
+        """Gives a copy of the sample for another frame, when the frame is not analyzed"""
+        return GazeSample(timestamp, *(getattr(self, name) for name in self.__slots__[1:]))
+
+    @staticmethod
+    def _coords(eye):
+        """Gives the coordinates of the pupil of an eye in the frame"""
+        x, y = eye.origin[0] + eye.pupil.x, eye.origin[1] + eye.pupil.y
+        if isinstance(eye.pupil.x, float):
+            return float(x), float(y)  # Sub-pixel coordinates
+        return int(x), int(y)
+
+    @staticmethod
+    def _ratio(eye_left, eye_right, axis):
+        """Averages the position of both pupils in their eye frame along an axis"""
+        try:
+            pupil_left = (eye_left.pupil.x, eye_left.pupil.y)[axis] / (eye_left.center[axis] * 2 - 10)
+            pupil_right = (eye_right.pupil.x, eye_right.pupil.y)[axis] / (eye_right.center[axis] * 2 - 10)
+        except ZeroDivisionError:
+            return None
+        return (pupil_left + pupil_right) / 2
+
+    @classmethod
+    def direction_of(cls, horizontal_ratio):
+        """Gives the Direction matching a horizontal ratio"""
+        if horizontal_ratio is None:
+            return Direction.UNKNOWN
+        if horizontal_ratio <= cls.RIGHT_LIMIT:
+            return Direction.RIGHT
+        if horizontal_ratio >= cls.LEFT_LIMIT:
+            return Direction.LEFT
+        return Direction.CENTER
+
+    @classmethod
+    def from_eyes(cls, eye_left, eye_right, timestamp=None):
+        """Computes the sample of a frame from its two eyes.
+
+        Args:
+            eye_left (eye.Eye): The left eye, or None if no face was found
+            eye_right (eye.Eye): The right eye, or None if no face was found
+            timestamp (float): When the frame was analyzed or captured
+        """
+        if eye_left is None or eye_right is None:
+            return cls(timestamp)
+
+        pupils = (eye_left.pupil, eye_right.pupil)
+        if any(pupil is None or pupil.x is None or pupil.y is None for pupil in pupils):
+            return cls(timestamp, face_found=True)
+
+        pupil_left = cls._coords(eye_left)
+        pupil_right = cls._coords(eye_right)
+        horizontal_ratio = cls._ratio(eye_left, eye_right, 0)
+        vertical_ratio = cls._ratio(eye_left, eye_right, 1)
+
+        blinking_ratio = blinking = None
+        if eye_left.blinking is not None and eye_right.blinking is not None:
+            blinking_ratio = (eye_left.blinking + eye_right.blinking) / 2
+            blinking = blinking_ratio > cls.BLINKING_LIMIT
+
+        return cls(timestamp, True, True, pupil_left, pupil_right, horizontal_ratio, vertical_ratio,
+                   blinking_ratio, blinking, cls.direction_of(horizontal_ratio))
@@ -0,0 +1,159 @@
+from __future__ import division  # Ensure division in Python 2 behaves like Python 3
+import cv2  # For the thumbnails
+import numpy as np  # For the differences between frames
+
+
+class MotionScheduler(object):
+    """
+    This class decides, before each frame is analyzed, how much of the
+    pipeline has to run. It compares a tiny thumbnail of the frame, and the
+    crops of the eyes, with the last analyzed frame:
+
+    - FULL: the head moved (or there is no face yet), run everything
+    - PARTIAL: only the eyes changed (a blink, a glance), keep the face box
+      and only run the landmarks, eyes and pupils
+    - SKIP: nothing moved, reuse the last sample
+
+    With a latency budget, a full analysis whose recent cost is over the
+    budget is replaced by a partial one, and a partial analysis whose recent
+    cost is over the budget is skipped, except every max_skip frames.
+    """
+
+    FULL = "full"
+    PARTIAL = "partial"
+    SKIP = "skip"
+
+    THUMBNAIL_SIZE = (32, 24)  # Size of the thumbnails compared for head motion
+    COST_SMOOTHING = 0.2  # Weight of a new timing in the running cost of each mode
+
+    def __init__(self, motion_threshold=3.0, eye_threshold=6.0, max_skip=10, latency_budget=None):
+        """
+        Args:
+            motion_threshold (float): Mean gray level difference of the thumbnails above which the head moved
+            eye_threshold (float): Mean gray level difference of the eye crops above which the eyes changed
+            max_skip (int): Analyze at least every N frames, and run a full analysis at least every N frames
+                when the latency budget is exceeded
+            latency_budget (float): Seconds an analysis should take at most (None for no budget)
+        """
+        self.motion_threshold = motion_threshold
+        self.eye_threshold = eye_threshold
+        self.max_skip = max_skip
+        self.latency_budget = latency_budget
+        self.reset()
+
+    def reset(self):
+        """Forgets the last analyzed frame and the recorded costs"""
+        self.counts = {self.FULL: 0, self.PARTIAL: 0, self.SKIP: 0}  # Frames handled by each mode
+        self.costs = {self.FULL: None, self.PARTIAL: None, self.SKIP: None}  # Running seconds per mode
+
+        self._thumbnail = None  # Thumbnail of the last analyzed frame
+        self._pending_thumbnail = None  # Thumbnail of the frame being analyzed
+        self._eye_crops = None  # Grayscale eye crops of the last analyzed frame, with their boxes
+        self._since_analysis = 0  # Frames since the last analysis
+        self._since_full = 0  # Frames since the last full analysis
+
+    @classmethod
+    def _make_thumbnail(cls, frame):
+        """Shrinks the frame to a tiny grayscale thumbnail"""
+        small = cv2.resize(frame, cls.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    @staticmethod
+    def _crop(frame, box):
+        """Gives the grayscale crop of a box of the frame"""
+        min_x, min_y, max_x, max_y = box
+        crop = frame[max(min_y, 0):max_y, max(min_x, 0):max_x]
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return crop.astype(np.int16)
+
+    @staticmethod
+    def _eye_boxes(eyes):
+        """Gives the boxes of the eyes of the last analysis, or None if there was no face"""
+        boxes = []
+        for eye in eyes:
+            if eye is None or eye.frame is None:
+                return None
+            height, width = eye.frame.shape[:2]
+            boxes.append((int(eye.origin[0]), int(eye.origin[1]), int(eye.origin[0]) + width,
+                          int(eye.origin[1]) + height))
+        return boxes
+
+    def _eye_motion(self, frame):
+        """Gives the largest mean difference between the eye crops and the last analyzed ones"""
+        motion = 0.0
+        for box, reference in self._eye_crops:
+            crop = self._crop(frame, box)
+            if crop.shape != reference.shape or not crop.size:
+                return float("inf")
+            motion = max(motion, float(np.abs(crop - reference).mean()))
+        return motion
+
+    def _over_budget(self, mode):
+        """Checks if the recent analyses of a mode took longer than the latency budget"""
+        cost = self.costs[mode]
+        return cost is not None and cost > self.latency_budget
+
+    def decide(self, frame):
+        """Chooses how much of the pipeline runs on the new frame.
+
+        Args:
+            frame (numpy.ndarray): The new frame
+
+        Returns:
+            str: FULL, PARTIAL or SKIP
+        """
+        self._since_analysis += 1
+        self._since_full += 1
+        thumbnail = self._make_thumbnail(frame)
+
+        if self._thumbnail is None or self._eye_crops is None:
+            mode = self.FULL  # No face on the last analyzed frame
+        elif np.abs(thumbnail - self._thumbnail).mean() > self.motion_threshold:
+            mode = self.FULL
+        elif self._eye_motion(frame) > self.eye_threshold or self._since_analysis >= self.max_skip:
+            mode = self.PARTIAL
+        else:
+            mode = self.SKIP
+
+        # Stay within the latency budget while the face is known: a partial
+        # analysis instead of a full one, then no analysis at all
+        if self.latency_budget is not None and self._eye_crops is not None:
+            if mode == self.FULL and self._over_budget(self.FULL) and self._since_full < self.max_skip:
+                mode = self.PARTIAL
+            if mode == self.PARTIAL and self._over_budget(self.PARTIAL) and self._since_analysis < self.max_skip:
+                mode = self.SKIP
+
+        self._pending_thumbnail = thumbnail
+        self.counts[mode] += 1
+        return mode
+
+    def done(self, mode, frame, eyes, seconds):
+        """Records the analysis of the frame, as reference for the next frames.
+
+        Args:
+            mode (str): The mode given by decide()
+            frame (numpy.ndarray): The analyzed frame
+            eyes (tuple): The left and right Eye found on the frame (None if no face)
+            seconds (float): Duration of the analysis
+        """
+        cost = self.costs[mode]
+        self.costs[mode] = seconds if cost is None else cost + self.COST_SMOOTHING * (seconds - cost)
+        if mode == self.SKIP:
+            return
+
+        self._since_analysis = 0
+        if mode == self.FULL:
+            self._since_full = 0
+
+        self._thumbnail = self._pending_thumbnail
+        boxes = self._eye_boxes(eyes)
+        self._eye_crops = None if boxes is None else [(box, self._crop(frame, box)) for box in boxes]
+
+    def analysis_rate(self):
+        """Gives the fraction of frames that were analyzed (fully or partially)"""
+        frames = sum(self.counts.values())
+        if frames:
+            return (self.counts[self.FULL] + self.counts[self.PARTIAL]) / frames
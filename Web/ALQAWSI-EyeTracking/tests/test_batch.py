@@ -0,0 +1,27 @@
+"""
+Checks the names of the results files of the offline analysis.
+"""
+import os  # To handle file paths
+import sys  # To import the package from the repository
+import pytest  # To check the errors
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.batch import output_names  # noqa: E402
+
+
+def test_results_named_after_the_videos():
+    assert output_names(["day1/session.mp4", "day1/interview.avi"]) == ["session.npz", "interview.npz"]
+
+
+def test_same_name_in_different_folders():
+    names = output_names(["day1/session.mp4", "day2/session.mp4", "day2/interview.mp4"])
+    assert len(set(names)) == 3
+    assert names[0].startswith("session-") and names[1].startswith("session-")
+    assert names[2] == "interview.npz"
+    assert output_names(["day2/session.mp4", "day1/session.mp4"]) == names[1::-1]  # Whatever the order
+
+
+def test_video_given_twice():
+    with pytest.raises(ValueError):
+        output_names(["day1/session.mp4", "day1/../day1/session.mp4"])
@@ -0,0 +1,97 @@
+"""
+Checks that Calibration.find_best_threshold picks the same threshold as the
+original implementation, which processed the eye frame once per candidate.
+"""
+import os  # To handle file paths
+import sys  # To import the package from the repository
+import cv2  # For the original image processing
+import numpy as np  # For the random eye crops
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from calibration_benchmark import synthetic_eye_crops  # noqa: E402
+from gaze_tracking.calibration import Calibration  # noqa: E402
+
+
+def original_best_threshold(eye_frame):
+    """The original implementation, kept here as it was before any optimization"""
+    kernel = np.ones((3, 3), np.uint8)
+    trials = {}
+    for threshold in range(5, 100, 5):
+        new_frame = cv2.bilateralFilter(eye_frame, 10, 15, 15)
+        new_frame = cv2.erode(new_frame, kernel, iterations=3)
+        iris_frame = cv2.threshold(new_frame, threshold, 255, cv2.THRESH_BINARY)[1]
+
+        iris_frame = iris_frame[5:-5, 5:-5]
+        height, width = iris_frame.shape[:2]
+        nb_pixels = height * width
+        trials[threshold] = (nb_pixels - cv2.countNonZero(iris_frame)) / nb_pixels
+    return min(trials.items(), key=(lambda p: abs(p[1] - 0.48)))[0]
+
+
+def eye_crops(count, seed=0):
+    """Eye crops and pure noise crops, without their pupil centers"""
+    return [crop for crop, _ in synthetic_eye_crops(count, seed, noise_only=0.25)]
+
+
+def test_same_threshold_as_the_original():
+    for crop in eye_crops(400):
+        assert Calibration.find_best_threshold(crop) == original_best_threshold(crop), crop.shape
+
+
+def test_finer_step_is_at_least_as_close():
+    kernel = np.ones((3, 3), np.uint8)
+    for crop in eye_crops(100, seed=1):
+        eroded = cv2.erode(cv2.bilateralFilter(crop, 10, 15, 15), kernel, iterations=3)[5:-5, 5:-5]
+
+        def distance(threshold):
+            return abs(np.count_nonzero(eroded <= threshold) / eroded.size - 0.48)
+
+        coarse = Calibration.find_best_threshold(crop, step=5)
+        fine = Calibration.find_best_threshold(crop, step=1)
+        assert distance(fine) <= distance(coarse)
+
+
+def test_recalibration_stays_complete():
+    calls = []
+    original = Calibration.find_best_threshold
+
+    def counted(eye_frame, step=5, denoise="bilateral"):
+        calls.append(1)
+        return original(eye_frame, step, denoise)
+
+    calibration = Calibration(adaptive=True, recalibration_frames=10)
+    calibration.find_best_threshold = counted
+    dark, bright = eye_crops(2, seed=2)[1], None
+    bright = np.clip(dark.astype(np.int16) + 90, 0, 255).astype(np.uint8)
+
+    def analyze(frame):
+        """Like Eye._analyze, for both eyes"""
+        for side in (0, 1):
+            if not calibration.is_complete():
+                calibration.evaluate(frame, side)
+            else:
+                calibration.observe(frame, side)
+
+    for _ in range(calibration.nb_frames):
+        analyze(dark)
+    assert calibration.is_complete() and len(calls) == 2 * calibration.nb_frames
+
+    del calls[:]
+    for _ in range(100):
+        analyze(bright)
+    assert calibration.is_complete()
+    assert calibration.recalibrations == 2
+    assert len(calls) == 2 * calibration.recalibration_frames
+    assert calibration.threshold(0) == original(bright)
+
+
+def test_histogram_keeps_the_bright_sclera():
+    calibration = Calibration(adaptive=True)
+    eye = np.full((20, 40), 255, np.uint8)  # The white mask around the eye
+    eye[5:15, 5:35] = 245  # A bright sclera
+    eye[5:15, 15:25] = 30  # The iris
+    histogram = calibration._track_histogram(eye, 0)
+    assert histogram[245 >> 4] == 2 / 3 and histogram[30 >> 4] == 1 / 3
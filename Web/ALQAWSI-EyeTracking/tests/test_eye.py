@@ -0,0 +1,61 @@
+"""
+Checks that Eye isolates the eye from its crop exactly like the original
+implementation, which masked the whole frame before cropping it.
+"""
+import os  # To handle file paths
+import sys  # To import the package from the repository
+import cv2  # For the original masking
+import numpy as np  # For the random frames and landmarks
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking.eye import Eye, EyeBuffer  # noqa: E402
+
+
+def original_isolate(frame, region):
+    """The original implementation, kept here as it was before any optimization"""
+    height, width = frame.shape[:2]
+    black_frame = np.zeros((height, width), np.uint8)
+    mask = np.full((height, width), 255, np.uint8)
+    cv2.fillPoly(mask, [region], (0, 0, 0))
+    eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
+
+    margin = 5
+    min_x = np.min(region[:, 0]) - margin
+    max_x = np.max(region[:, 0]) + margin
+    min_y = np.min(region[:, 1]) - margin
+    max_y = np.max(region[:, 1]) + margin
+
+    cropped = eye[min_y:max_y, min_x:max_x]
+    height, width = cropped.shape[:2]
+    return cropped, (min_x, min_y), (width / 2, height / 2)
+
+
+def eye_region(rng, width, height):
+    """Draws the 6 landmarks of an eye, anywhere in the frame, even against its borders"""
+    center = np.array([rng.randint(0, width), rng.randint(0, height)])
+    eye_width, eye_height = rng.randint(10, 60), rng.randint(0, 20)
+    offsets = np.array([(-eye_width / 2, 0), (-eye_width / 6, -eye_height / 2), (eye_width / 6, -eye_height / 2),
+                        (eye_width / 2, 0), (eye_width / 6, eye_height / 2), (-eye_width / 6, eye_height / 2)])
+    jitter = rng.randint(-3, 4, (6, 2))
+    return (center + offsets + jitter).astype(np.int32)
+
+
+def test_same_eye_as_the_original():
+    rng = np.random.RandomState(0)
+    buffer = EyeBuffer()
+    at_border = 0
+    for _ in range(500):
+        height, width = rng.randint(16, 120), rng.randint(40, 160)  # Small frames, where the eye crosses them
+        frame = rng.randint(0, 256, (height, width)).astype(np.uint8)
+        region = eye_region(rng, width, height)
+        expected_frame, expected_origin, expected_center = original_isolate(frame, region)
+
+        eye = Eye.__new__(Eye)  # Without the pupil detection
+        eye._isolate(frame, region, buffer)
+
+        at_border += bool((region.min(axis=0) - Eye.MARGIN < 0).any())
+        assert eye.origin == expected_origin
+        assert eye.center == expected_center
+        assert np.array_equal(eye.frame, expected_frame), region
+    assert at_border > 50  # The negative-margin fallback was checked too
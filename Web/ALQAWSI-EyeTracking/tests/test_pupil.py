@@ -0,0 +1,47 @@
+"""
+Checks that PupilBatch locates the same pupils as Pupil, one crop at a time.
+"""
+import os  # To handle file paths
+import sys  # To import the package from the repository
+import numpy as np  # For the blank crops
+import pytest  # For the parametrized methods
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from calibration_benchmark import synthetic_eye_crops  # noqa: E402
+from gaze_tracking.locators import LOCATORS  # noqa: E402
+from gaze_tracking.pupil import DENOISERS, Pupil, PupilBatch  # noqa: E402
+
+
+def single_positions(crops, thresholds, method, subpixel, denoise):
+    positions = []
+    for crop, threshold in zip(crops, thresholds):
+        pupil = Pupil(crop, threshold, method, subpixel, denoise)
+        positions.append(None if pupil.x is None else (pupil.x, pupil.y))
+    return positions
+
+
+@pytest.mark.parametrize("method", sorted(LOCATORS))
+@pytest.mark.parametrize("denoise", sorted(DENOISERS))
+def test_same_pupils_as_one_at_a_time(method, denoise):
+    crops = [crop for crop, _ in synthetic_eye_crops(60, seed=1, noise_only=0.2)]
+    crops.append(np.full((12, 30), 255, np.uint8))  # No pupil at all
+    thresholds = np.random.RandomState(1).randint(5, 100, len(crops))
+    thresholds[:3] = 255  # Even the white is dark enough
+
+    for subpixel in (False, True):
+        expected = single_positions(crops, thresholds, method, subpixel, denoise)
+        assert PupilBatch(crops, thresholds, method, subpixel, denoise).positions == expected
+        assert [PupilBatch(crops[index:index + 2], thresholds[index:index + 2], method, subpixel,
+                           denoise).positions for index in range(0, len(crops), 2)] == [
+            expected[index:index + 2] for index in range(0, len(crops), 2)]  # Two eyes at a time
+
+
+def test_one_threshold_for_all():
+    crops = [crop for crop, _ in synthetic_eye_crops(10)]
+    batch = PupilBatch(crops, 40, "weighted_centroid")
+    assert len(batch) == 10
+    assert batch.positions == PupilBatch(crops, [40] * 10, "weighted_centroid").positions
+    assert len(PupilBatch([], 40, "weighted_centroid")) == 0
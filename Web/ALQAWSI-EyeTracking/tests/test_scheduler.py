@@ -0,0 +1,184 @@
+"""
+Checks that the motion scheduler doesn't miss blink and gaze direction events,
+and that it keeps to its latency budget.
+
+A synthetic session (a face with two eyes whose pupils move, blink, and a
+head that moves from time to time) is analyzed by a real GazeTracking, on
+every frame and with the motion scheduler, like benchmarks/
+scheduler_benchmark.py does on recorded videos. Only the dlib models are
+replaced, by stubs that find the face and the eye landmarks on the drawing,
+so the check runs without dlib and its model file.
+"""
+import os  # To handle file paths
+import sys  # To import the package from the repository
+import types  # For the stub points and eyes
+import numpy as np  # For the synthetic frames
+import pytest  # For the stubbed models
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from gaze_tracking import models  # noqa: E402
+from gaze_tracking.gaze_tracking import GazeTracking  # noqa: E402
+from gaze_tracking.sample import Direction  # noqa: E402
+from gaze_tracking.scheduler import MotionScheduler  # noqa: E402
+
+FACE_SIZE = (240, 200)  # Height and width of the face
+EYE_BOXES = ((80, 40), (80, 110))  # Top left corner (y, x) of each eye in the face
+EYE_SIZE = (24, 50)  # Height and width of an eye
+PUPIL_X = {Direction.RIGHT: 8, Direction.CENTER: 25, Direction.LEFT: 42}  # Pupil column in the eye
+SKIN, SCLERA, PUPIL, BACKGROUND = 180, 230, 20, 40
+STUB_MODEL = "stub"  # Model path of the stub predictor
+
+
+def session(count=900, seed=0):
+    """Draws the frames of a synthetic session: glances, blinks and head moves at random times.
+
+    Returns:
+        tuple: The frames, and the blink onsets and direction changes as (frame, kind) pairs
+    """
+    rng = np.random.RandomState(seed)
+    height, width = FACE_SIZE
+    eye_height, eye_width = EYE_SIZE
+    rows, columns = np.ogrid[:eye_height, :eye_width]
+    gaze, blink, face = Direction.CENTER, 0, [120, 220]
+    noises = rng.normal(0, 2, (8, 480, 640))  # Sensor noise, drawn once
+    frames, truth = [], []
+    for index in range(count):
+        if not blink and rng.rand() < 1 / 60:
+            glance = list(PUPIL_X)[rng.randint(len(PUPIL_X))]
+            if glance is not gaze:
+                gaze = glance
+                truth.append((index, gaze))
+        if not blink and rng.rand() < 1 / 90:
+            blink = rng.randint(3, 7)
+            truth.append((index, "blink"))
+        if rng.rand() < 1 / 120:
+            face[1] = int(np.clip(face[1] + rng.choice((-40, 40)), 20, 420))
+
+        frame = noises[index % len(noises)] + BACKGROUND
+        top, left = face
+        frame[top:top + height, left:left + width] = SKIN
+        for eye_top, eye_left in EYE_BOXES:
+            eye = frame[top + eye_top:top + eye_top + eye_height, left + eye_left:left + eye_left + eye_width]
+            if blink:
+                eye[eye_height // 2 - 2:eye_height // 2 + 2] = PUPIL  # The lashes of the closed eyelids
+                continue
+            eye[:] = SCLERA
+            eye[(rows - eye_height // 2) ** 2 + (columns - PUPIL_X[gaze]) ** 2 <= 36] = PUPIL
+        blink = max(blink - 1, 0)
+
+        gray = np.clip(frame, 0, 255).astype(np.uint8)
+        frames.append(np.dstack((gray, gray, gray)))
+    return frames, truth
+
+
+class Box(object):
+    """A face box, with the methods of dlib.rectangle used by the tracker"""
+
+    def __init__(self, left, top, right, bottom):
+        self._box = left, top, right, bottom
+
+    def left(self):
+        return self._box[0]
+
+    def top(self):
+        return self._box[1]
+
+    def right(self):
+        return self._box[2]
+
+    def bottom(self):
+        return self._box[3]
+
+    def width(self):
+        return self._box[2] - self._box[0]
+
+    def height(self):
+        return self._box[3] - self._box[1]
+
+    def center(self):
+        return types.SimpleNamespace(x=(self._box[0] + self._box[2]) // 2, y=(self._box[1] + self._box[3]) // 2)
+
+
+def detect_face(frame):
+    """Stub face detector: the box of the skin on the drawing"""
+    rows, columns = np.nonzero(frame > 100)
+    if not len(rows):
+        return []
+    return [Box(columns.min(), rows.min(), columns.max() + 1, rows.max() + 1)]
+
+
+def predict_landmarks(frame, face):
+    """Stub landmark predictor: the 68 points, with the eyes outlined open or
+    closed from the drawing, and the other points at the center of the face"""
+    center = face.center()
+    points = [(center.x, center.y)] * 68
+    eye_height, eye_width = EYE_SIZE
+    for side, (eye_top, eye_left) in enumerate(EYE_BOXES):
+        x, y = face.left() + eye_left, face.top() + eye_top
+        middle = y + eye_height // 2
+        opened = (frame[y:y + eye_height, x:x + eye_width] > 200).any()  # The sclera shows
+        lid = eye_height // 2 - 1 if opened else 1
+        outline = [(x, middle), (x + eye_width // 3, middle - lid), (x + 2 * eye_width // 3, middle - lid),
+                   (x + eye_width - 1, middle), (x + 2 * eye_width // 3, middle + lid),
+                   (x + eye_width // 3, middle + lid)]
+        points[36 + 6 * side:42 + 6 * side] = outline
+    parts = [types.SimpleNamespace(x=int(px), y=int(py)) for px, py in points]
+    return types.SimpleNamespace(parts=lambda: parts)
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Puts the stubs in the registry of the dlib models, as if they were loaded"""
+    monkeypatch.setattr(models, "_detector", detect_face)
+    monkeypatch.setitem(models._predictors, STUB_MODEL, predict_landmarks)
+
+
+def missed(truth, samples, tolerance=2):
+    """Lists the events of the drawing that no sample shows within tolerance frames"""
+    found = []
+    for index, kind in truth:
+        window = samples[index:index + tolerance + 1]
+        if kind == "blink":
+            found.append(any(sample.blinking for sample in window))
+        else:
+            found.append(any(sample.direction is kind for sample in window))
+    return [event for event, ok in zip(truth, found) if not ok]
+
+
+def test_scheduler_keeps_the_events(stub_models):
+    frames, truth = session()
+    kinds = {kind for _, kind in truth}
+    assert "blink" in kinds and len(kinds) == 4, truth  # The session has blinks and glances everywhere
+
+    reference = GazeTracking(model_path=STUB_MODEL, history_size=0)
+    samples = [reference.refresh(frame, index / 30) for index, frame in enumerate(frames)]
+    assert missed(truth, samples) == []  # The drawing can be read on every frame
+
+    gaze = GazeTracking(model_path=STUB_MODEL, history_size=0, motion_threshold=3.0)
+    samples = [gaze.refresh(frame, index / 30) for index, frame in enumerate(frames)]
+    assert missed(truth, samples) == []
+    assert gaze.analysis_rate() < 0.5  # Most of the still frames are skipped
+
+
+def test_latency_budget_skips_partial_analyses():
+    scheduler = MotionScheduler(latency_budget=0.01, max_skip=5)
+    frame = np.full((120, 160), 100, np.uint8)
+    eyes = [types.SimpleNamespace(frame=np.zeros((10, 20), np.uint8), origin=(20 + 60 * side, 40))
+            for side in (0, 1)]
+
+    assert scheduler.decide(frame) == MotionScheduler.FULL
+    scheduler.done(MotionScheduler.FULL, frame, eyes, 0.05)
+
+    modes = []
+    for index in range(20):
+        frame = frame.copy()
+        frame[40:50, 20:40] = 0 if index % 2 else 255  # Only the left eye changes
+        mode = scheduler.decide(frame)
+        scheduler.done(mode, frame, eyes, 0.05 if mode != MotionScheduler.SKIP else 0.0)
+        modes.append(mode)
+
+    # The first partial analysis is over budget, so the next ones only run every max_skip frames
+    assert modes[0] == MotionScheduler.PARTIAL
+    analyzed = [index for index, mode in enumerate(modes) if mode != MotionScheduler.SKIP]
+    assert analyzed == [0, 5, 10, 15]
@@ -1,21 +1,182 @@
-from flask import Flask
+import json
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, request, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_restful import Resource, Api, reqparse, fields, marshal_with, abort
+from flask_restful import Resource, Api, reqparse, fields, marshal, marshal_with, abort
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+
+from gaze_sessions import SessionManager  # Also puts the eye tracking package on the import path
+from gaze_tracking.sample import Direction
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
 db= SQLAlchemy(app)
 api= Api(app)
 
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+     # WAL lets the statistics be read while a batch of gaze events is written,
+     # and synchronous=NORMAL only syncs the disk at checkpoints instead of every commit
+     if isinstance(dbapi_connection, sqlite3.Connection):
+          cursor = dbapi_connection.cursor()
+          cursor.execute("PRAGMA journal_mode=WAL")
+          cursor.execute("PRAGMA synchronous=NORMAL")
+          cursor.close()
+
 class UserModel(db.Model):
     
      id = db.Column(db.Integer, primary_key=True)
-     name = db.Column(db.String(80), unique=True, nullable=False)
-     email = db.Column(db.String(80), unique=True, nullable=False)
+     name = db.Column(db.String(80), unique=True, index=True, nullable=False)
+     email = db.Column(db.String(80), unique=True, index=True, nullable=False)
 
 def __repr__ (self):
       return f"User(name = {self.name}, email = {self.name})"
 
+# Gaze samples sent by the eye tracker, usually one per second of study
+class GazeEventModel(db.Model):
+     __tablename__ = 'gaze_event'
+     id = db.Column(db.Integer, primary_key=True)
+     user_id = db.Column(db.Integer, db.ForeignKey('user_model.id'), nullable=False)
+     timestamp = db.Column(db.Float, nullable=False)
+     duration = db.Column(db.Float, nullable=False)
+     direction = db.Column(db.SmallInteger, nullable=False)
+     blinking = db.Column(db.Boolean)
+     distraction = db.Column(db.Float, nullable=False)
+     __table_args__ = (db.Index('ix_gaze_event_user_timestamp', 'user_id', 'timestamp'),)
+
+# Totals of the gaze events of each user and day, updated when the events are ingested
+class DailyStatsModel(db.Model):
+     __tablename__ = 'daily_stats'
+     user_id = db.Column(db.Integer, db.ForeignKey('user_model.id'), primary_key=True)
+     day = db.Column(db.Date, primary_key=True)
+     samples = db.Column(db.Integer, nullable=False, default=0)
+     study_seconds = db.Column(db.Float, nullable=False, default=0.0)
+     away_seconds = db.Column(db.Float, nullable=False, default=0.0)
+     blinking_seconds = db.Column(db.Float, nullable=False, default=0.0)
+     distraction_sum = db.Column(db.Float, nullable=False, default=0.0)
+     low_distraction_seconds = db.Column(db.Float, nullable=False, default=0.0)
+     medium_distraction_seconds = db.Column(db.Float, nullable=False, default=0.0)
+     high_distraction_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+ROLLUP_COLUMNS = ('samples', 'study_seconds', 'away_seconds', 'blinking_seconds', 'distraction_sum',
+                  'low_distraction_seconds', 'medium_distraction_seconds', 'high_distraction_seconds')
+DISTRACTION_LEVELS = (1 / 3, 2 / 3)  # Distraction scores where medium and high distraction start
+MAX_BATCH = 5000  # Gaze events accepted per request
+
+rollup_upsert = sqlite_insert(DailyStatsModel)
+rollup_upsert = rollup_upsert.on_conflict_do_update(
+     index_elements=['user_id', 'day'],
+     set_={name: getattr(DailyStatsModel, name) + getattr(rollup_upsert.excluded, name) for name in ROLLUP_COLUMNS})
+
+def ingest_gaze_events(user_id, events):
+     """Stores a batch of gaze events and adds them to the daily totals, in one transaction.
+
+     The events are added to the totals of their UTC day, so that the days
+     don't depend on the time zone of the server.
+
+     Args:
+          user_id (int): Whose events they are
+          events (list): Dicts with t (timestamp in seconds), dir (Direction value), distraction
+               (0.0 to 1.0), and optionally blink (eyes closed: true, false or null) and duration
+               (seconds covered, default 1.0)
+
+     Returns:
+          int: The number of stored events
+
+     Raises:
+          ValueError: An event is missing a value, or has a value out of range
+     """
+     rows = []
+     rollups = {}
+     for item in events:
+          if not isinstance(item, dict):
+               raise ValueError("An event must be an object")
+          timestamp = float(item['t'])
+          duration = float(item.get('duration', 1.0))
+          direction = Direction(int(item['dir'])).value
+          distraction = float(item['distraction'])
+          if not all(math.isfinite(value) for value in (timestamp, duration, distraction)) or duration < 0:
+               raise ValueError("The values of an event must be finite, and its duration not negative")
+          distraction = min(max(distraction, 0.0), 1.0)
+          blinking = item.get('blink')
+          if blinking is not None and not isinstance(blinking, bool):
+               raise ValueError("The blink of an event must be true, false or null")
+          rows.append({'user_id': user_id, 'timestamp': timestamp, 'duration': duration,
+                       'direction': direction, 'blinking': blinking, 'distraction': distraction})
+
+          day = datetime.fromtimestamp(timestamp, timezone.utc).date()
+          rollup = rollups.get(day)
+          if rollup is None:
+               rollup = rollups[day] = dict.fromkeys(ROLLUP_COLUMNS, 0.0)
+               rollup.update(user_id=user_id, day=day, samples=0)
+          rollup['samples'] += 1
+          rollup['study_seconds'] += duration
+          if direction != Direction.CENTER.value:
+               rollup['away_seconds'] += duration
+          if blinking:
+               rollup['blinking_seconds'] += duration
+          rollup['distraction_sum'] += distraction * duration
+          if distraction < DISTRACTION_LEVELS[0]:
+               rollup['low_distraction_seconds'] += duration
+          elif distraction < DISTRACTION_LEVELS[1]:
+               rollup['medium_distraction_seconds'] += duration
+          else:
+               rollup['high_distraction_seconds'] += duration
+
+     if not rows:
+          return 0
+     try:
+          # One Core executemany for the whole batch, without the ORM bulk insert bookkeeping
+          db.session.execute(insert(GazeEventModel.__table__), rows)
+          db.session.execute(rollup_upsert, list(rollups.values()))
+          db.session.commit()
+     except Exception:
+          db.session.rollback()
+          raise
+     return len(rows)
+
+def daily_statistics(user_id, days=7, today=None):
+     """Gives the study time and distraction of the last days, from the daily totals.
+
+     Args:
+          user_id (int): Whose statistics they are
+          days (int): Number of days, ending today
+          today (date): Last day (default: today, in UTC like the daily totals)
+     """
+     end = today or datetime.now(timezone.utc).date()
+     start = end - timedelta(days=days - 1)
+     rows = DailyStatsModel.query.filter(DailyStatsModel.user_id == user_id, DailyStatsModel.day >= start,
+                                         DailyStatsModel.day <= end).order_by(DailyStatsModel.day).all()
+
+     distraction = {'low': 0.0, 'medium': 0.0, 'high': 0.0}
+     daily = []
+     for row in rows:
+          daily.append({
+               'day': row.day.isoformat(),
+               'study_hours': round(row.study_seconds / 3600, 3),
+               'away_fraction': round(row.away_seconds / row.study_seconds, 3) if row.study_seconds else None,
+               'distraction': round(row.distraction_sum / row.study_seconds, 3) if row.study_seconds else None,
+          })
+          distraction['low'] += row.low_distraction_seconds
+          distraction['medium'] += row.medium_distraction_seconds
+          distraction['high'] += row.high_distraction_seconds
+
+     total = sum(distraction.values())
+     return {
+          'user_id': user_id,
+          'days': daily,
+          'study_hours': round(total / 3600, 3),
+          'distraction_levels': {level: round(seconds / total, 3) if total else None
+                                 for level, seconds in distraction.items()},
+     }
+
 user_args = reqparse.RequestParser()
 user_args.add_argument('name', type=str, required=True, help="Name cannot be blank")
 user_args.add_argument('email', type=str, required=True, help="Email cannot be blank")
@@ -26,26 +187,189 @@ userFields = {
      'email':fields.String,
 }
 
+PAGE_SIZE = 50  # Users per page by default
+MAX_PAGE_SIZE = 500  # Users per page at most
+EXPORT_CHUNK = 1000  # Users read per query while exporting
+MAX_BULK = 1000  # Users created per bulk request
+
+page_args = reqparse.RequestParser()
+page_args.add_argument('after', type=int, default=0, location='args', help="The cursor must be a user id")
+page_args.add_argument('limit', type=int, default=PAGE_SIZE, location='args', help="The limit must be a number")
+page_args.add_argument('email', type=str, location='args')
+
+def users_after(after, limit):
+     """Gives the users whose id is above the cursor, in id order, with one indexed range query"""
+     return UserModel.query.filter(UserModel.id > after).order_by(UserModel.id).limit(limit).all()
+
 class Users(Resource):
      @marshal_with(userFields)
      def get(self):
-          Users = UserModel.query.all()
-          return Users
+          args = page_args.parse_args()
+          if args['email'] is not None:
+               return UserModel.query.filter_by(email=args['email']).all()
+          if not 1 <= args['limit'] <= MAX_PAGE_SIZE:
+               abort(400, message="The limit must be between 1 and {}".format(MAX_PAGE_SIZE))
+          users = users_after(args['after'], args['limit'])
+          headers = {}
+          if len(users) == args['limit']:
+               # The next page starts after the last user of this one
+               headers['Link'] = '<{}?after={}&limit={}>; rel="next"'.format(
+                    request.base_url, users[-1].id, args['limit'])
+          return users, 200, headers
      @marshal_with(userFields)
      def post(self):
           args = user_args.parse_args()
           user = UserModel(name=args["name"],email=args["email"])
           db.session.add(user)
-          db.session.commit()
-          users = UserModel.query.all()
-          return Users, 201
+          try:
+               db.session.commit()
+          except IntegrityError:
+               db.session.rollback()
+               abort(409, message="This name or email is already used")
+          return user, 201
+
+class UsersExport(Resource):
+     def get(self):
+          def generate():
+               # Chunks read with the same keyset cursor, so the export never holds the whole table
+               yield '['
+               after = 0
+               first = True
+               while True:
+                    users = users_after(after, EXPORT_CHUNK)
+                    for user in users:
+                         yield ('' if first else ',') + json.dumps(marshal(user, userFields))
+                         first = False
+                    if len(users) < EXPORT_CHUNK:
+                         break
+                    after = users[-1].id
+                    db.session.expunge_all()
+               yield ']'
+          return Response(stream_with_context(generate()), mimetype='application/json')
+
+class UsersBulk(Resource):
+     def post(self):
+          body = request.get_json(silent=True)
+          users = body.get('users') if isinstance(body, dict) else None
+          if not isinstance(users, list) or not users:
+               abort(400, message="The body must be a JSON object with a list of users")
+          if len(users) > MAX_BULK:
+               abort(413, message="At most {} users per request".format(MAX_BULK))
+          rows = []
+          for user in users:
+               if not isinstance(user, dict) or not user.get('name') or not user.get('email'):
+                    abort(400, message="Each user needs a name and an email")
+               rows.append({'name': str(user['name']), 'email': str(user['email'])})
+          try:
+               # All the users in one transaction: either all of them are created or none
+               ids = db.session.scalars(insert(UserModel).returning(UserModel.id), rows).all()
+               db.session.commit()
+          except IntegrityError:
+               db.session.rollback()
+               abort(409, message="A name or email is already used")
+          return {'created': len(ids), 'ids': ids}, 201
 
 api.add_resource(Users, '/api/users/')
+api.add_resource(UsersExport, '/api/users/export')
+api.add_resource(UsersBulk, '/api/users/bulk')
+
+# Gaze tracking of the study sessions: the front end streams JPEG frames,
+# analyzed in the background by a bounded pool of trackers
+gaze_sessions = None
+gaze_sessions_lock = threading.Lock()
+
+def session_manager():
+     """Gives the manager of the gaze sessions, starting it on first use.
+
+     It isn't started on import, so that create_db.py and the benchmarks don't
+     start its threads or load OpenCV. The server starts it before serving, so
+     that the trackers are warmed up before the first session.
+     """
+     global gaze_sessions
+     with gaze_sessions_lock:
+          if gaze_sessions is None:
+               gaze_sessions = SessionManager(pool_size=4, queue_size=2, idle_timeout=60.0)
+          return gaze_sessions
+
+session_args = reqparse.RequestParser()
+session_args.add_argument('user_id', type=int, required=False, location='values', help="User id must be a number")
+
+class GazeSessions(Resource):
+     def post(self):
+          args = session_args.parse_args()
+          session = session_manager().open(args["user_id"])
+          if session is None:
+               abort(503, message="All the gaze trackers are busy, try again later")
+          return {'session': session.id}, 201
+
+class GazeSession(Resource):
+     def get(self, session_id):
+          session = session_manager().get(session_id)
+          if session is None:
+               abort(404, message="Session not found")
+          return session.status()
+     def delete(self, session_id):
+          status = session_manager().close(session_id)
+          if status is None:
+               abort(404, message="Session not found")
+          return status
+
+class GazeFrames(Resource):
+     def post(self, session_id):
+          session = session_manager().get(session_id)
+          if session is None:
+               abort(404, message="Session not found")
+          data = request.get_data(cache=False)
+          if not data:
+               abort(400, message="The body must be a JPEG image")
+          timestamp = request.headers.get('X-Frame-Timestamp', type=float)
+          number = session.submit(data, timestamp)
+          if number is None:
+               abort(410, message="The analysis of the session stopped: {}".format(session.error))
+          # The results of this frame come with the next responses, this one has the latest ones
+          return {'n': number, 'dropped': session.dropped, 'gaze': session.result}, 202
+
+class GazeEvents(Resource):
+     def post(self, user_id):
+          body = request.get_json(silent=True)
+          events = body.get('events') if isinstance(body, dict) else None
+          if not isinstance(events, list):
+               abort(400, message="The body must be a JSON object with a list of events")
+          if len(events) > MAX_BATCH:
+               abort(413, message="At most {} events per request".format(MAX_BATCH))
+          if db.session.get(UserModel, user_id) is None:
+               abort(404, message="User not found")
+          try:
+               inserted = ingest_gaze_events(user_id, events)
+          except (KeyError, TypeError, ValueError, OverflowError, OSError):
+               abort(400, message="Each event needs finite t, dir and distraction numbers, no negative duration, "
+                                  "and a true, false or null blink")
+          return {'inserted': inserted}, 201
+
+statistics_args = reqparse.RequestParser()
+statistics_args.add_argument('days', type=int, default=7, location='args', help="Days must be a number")
+
+class Statistics(Resource):
+     def get(self, user_id):
+          args = statistics_args.parse_args()
+          if not 1 <= args['days'] <= 366:
+               abort(400, message="Days must be between 1 and 366")
+          if db.session.get(UserModel, user_id) is None:
+               abort(404, message="User not found")
+          return daily_statistics(user_id, args['days'])
+
+api.add_resource(GazeEvents, '/api/users/<int:user_id>/gaze-events')
+api.add_resource(Statistics, '/api/users/<int:user_id>/statistics')
+api.add_resource(GazeSessions, '/api/gaze/sessions/')
+api.add_resource(GazeSession, '/api/gaze/sessions/<string:session_id>')
+api.add_resource(GazeFrames, '/api/gaze/sessions/<string:session_id>/frames')
 
 
 @app.route('/')
 def home():
     return '<h1>Flask REST API</h1>'
 if __name__ == '__main__':
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        session_manager()  # In the serving process only, not in the reloader watching the files
     app.run(debug=True)
 
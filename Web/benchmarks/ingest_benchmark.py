@@ -0,0 +1,129 @@
+"""
+Benchmark of the gaze event ingestion and of the statistics query.
+
+It fills a temporary SQLite database with synthetic gaze events, in batches
+like the eye tracker sends them, and at growing sizes of the raw table it
+reports the sustained ingest rate and the latency of the statistics query,
+which reads the daily totals. With --compare-raw it also times the same
+statistics computed by scanning the raw events.
+
+Usage:
+    python benchmarks/ingest_benchmark.py --rows 20000000 --users 2000
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import shutil  # To remove the temporary database
+import sys  # To import the API
+import tempfile  # For the temporary database
+import time  # For the timings
+import numpy as np  # For the percentiles
+from sqlalchemy import text  # For the statistics computed from the raw events
+
+WEB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DAY = 24 * 3600
+RAW_STATISTICS = text(
+    "SELECT date(timestamp, 'unixepoch') AS day, COUNT(*), SUM(duration), "
+    "SUM(CASE WHEN direction != 2 THEN duration ELSE 0 END), SUM(distraction * duration) "
+    "FROM gaze_event WHERE user_id = :user_id AND timestamp >= :start GROUP BY day ORDER BY day")
+
+
+def checkpoints(total):
+    """Gives the table sizes at which the statistics are measured: 100k, 300k, 1M, 3M..."""
+    sizes = []
+    size = 100000
+    while size < total:
+        sizes.append(size)
+        size = size * 3 if str(size)[0] == "1" else size * 10 // 3
+    return sizes + [total]
+
+
+def make_batch(rng, now, count):
+    """Gives the events of a study session of count seconds, on one of the last 30 days"""
+    start = now - rng.randint(0, 30) * DAY - rng.randint(count, DAY)
+    directions = rng.choice([1, 2, 2, 2, 2, 3], count)
+    distractions = rng.random_sample(count)
+    blinks = rng.random_sample(count) < 0.1
+    return [{"t": start + index, "dir": int(directions[index]), "distraction": float(distractions[index]),
+             "blink": bool(blinks[index])} for index in range(count)]
+
+
+def time_queries(user_ids, query):
+    """Runs the query for each user and gives the p50 and p99 latencies in milliseconds"""
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        query(user_id)
+        timings.append(time.perf_counter() - start)
+    return np.percentile(np.array(timings) * 1000, (50, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gaze event ingestion and the statistics.")
+    parser.add_argument("--rows", type=int, default=10000000, help="Gaze events inserted in total")
+    parser.add_argument("--users", type=int, default=2000, help="Users sending events")
+    parser.add_argument("--batch", type=int, default=1000, help="Gaze events per batch")
+    parser.add_argument("--queries", type=int, default=500, help="Statistics queries at each checkpoint")
+    parser.add_argument("--compare-raw", action="store_true",
+                        help="Also time the statistics computed from the raw events")
+    parser.add_argument("--database", help="SQLite file to fill (default: a temporary one)")
+    args = parser.parse_args()
+
+    directory = None
+    if args.database is None:
+        directory = tempfile.mkdtemp()
+        args.database = os.path.join(directory, "benchmark.db")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(args.database)
+    sys.path.insert(0, WEB_PATH)
+    import api  # Imported here so the API opens the database chosen above
+
+    rng = np.random.RandomState(0)
+    now = time.time()
+    today = api.datetime.fromtimestamp(now, api.timezone.utc).date()
+
+    with api.app.app_context():
+        api.db.create_all()
+        print("database: " + args.database)
+        print("{:>11} {:>12} {:>14} {:>14} {:>14} {:>14}".format(
+            "rows", "ingest rows/s", "batch p99 ms", "stats p50 ms", "stats p99 ms",
+            "raw p99 ms" if args.compare_raw else ""))
+
+        inserted = 0
+        user_id = 0
+        batch_timings = []
+        interval_rows = 0
+        interval_time = 0.0
+        for checkpoint in checkpoints(args.rows):
+            while inserted < checkpoint:
+                count = min(args.batch, checkpoint - inserted)
+                user_id = user_id % args.users + 1
+                events = make_batch(rng, now, count)
+
+                start = time.perf_counter()
+                api.ingest_gaze_events(user_id, events)
+                elapsed = time.perf_counter() - start
+                batch_timings.append(elapsed)
+                interval_time += elapsed
+                interval_rows += count
+                inserted += count
+
+            users = [int(user) for user in rng.randint(1, args.users + 1, args.queries)]
+            stats = time_queries(users, lambda user: api.daily_statistics(user, 7, today))
+            raw = ""
+            if args.compare_raw:
+                week = time.mktime((today - api.timedelta(days=6)).timetuple())
+                raw = "{:>14.3f}".format(time_queries(users, lambda user: api.db.session.execute(
+                    RAW_STATISTICS, {"user_id": user, "start": week}).fetchall())[1])
+
+            print("{:>11} {:>12.0f} {:>14.3f} {:>14.3f} {:>14.3f} {}".format(
+                inserted, interval_rows / interval_time, np.percentile(batch_timings, 99) * 1000,
+                stats[0], stats[1], raw))
+            batch_timings = []
+            interval_rows = 0
+            interval_time = 0.0
+
+    if directory is not None:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Load benchmark of the Flask API under a production WSGI server.
+
+It starts api.py under waitress, in a separate process, against a temporary
+SQLite file, seeds it with users, then runs concurrent readers and writers
+(and optionally gaze streaming sessions) for a fixed duration. It reports
+the throughput and the latency percentiles of each request, and from inside
+the server the time spent in each kind of SQL statement and the "database is
+locked" errors, which show the contention on the SQLite write lock. With
+--profile, the server samples its Python stacks and writes them as collapsed
+stacks (for flamegraph.pl or speedscope).
+
+Usage:
+    python benchmarks/load_benchmark.py --readers 16 --writers 4 --duration 30
+    python benchmarks/load_benchmark.py --threads 8 --write-mix create=1,events=1 --profile server.folded
+"""
+import argparse  # To read the command line arguments
+import collections  # For the counters
+import http.client  # For persistent connections to the server
+import json  # For the requests and the server statistics
+import logging  # To count the requests queued by waitress
+import os  # To handle file paths
+import random  # For the mix of requests
+import shutil  # To remove the temporary database
+import signal  # To stop the server cleanly
+import socket  # To find a free port and wait for the server
+import subprocess  # To run the server in its own process
+import sys  # To start the server with the same Python
+import tempfile  # For the temporary database
+import threading  # For the concurrent clients and the sampler
+import time  # For the timings
+import numpy as np  # For the percentiles
+
+WEB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IDLE_FUNCTIONS = {"wait", "select", "poll", "accept", "_sample"}  # Stacks of threads waiting for work
+
+
+class DatabaseStats(object):
+    """Times the SQL statements run by the server, by kind (SELECT, INSERT...)"""
+
+    def __init__(self):
+        self.timings = collections.defaultdict(list)
+        self.locked = 0  # Statements that failed with "database is locked"
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        from sqlalchemy import event
+
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._error)
+
+    def _before(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info["statement_start"] = time.perf_counter()
+
+    def _after(self, connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info.pop("statement_start")
+        with self._lock:
+            self.timings[statement.split(None, 1)[0].upper()].append(elapsed)
+
+    def _error(self, context):
+        context.connection.info.pop("statement_start", None)
+        if "database is locked" in str(context.original_exception):
+            with self._lock:
+                self.locked += 1
+
+    def summary(self):
+        with self._lock:
+            kinds = {kind: summarize(timings) for kind, timings in self.timings.items()}
+            return {"statements": kinds, "locked": self.locked}
+
+
+class QueueStats(logging.Handler):
+    """Counts the "Task queue depth" warnings of waitress: requests waiting for a free thread"""
+
+    def __init__(self):
+        super(QueueStats, self).__init__()
+        self.warnings = 0
+        self.depth = 0  # Deepest queue seen
+
+    def emit(self, record):
+        self.warnings += 1
+        self.depth = max(self.depth, int(record.getMessage().rsplit(None, 1)[-1]))
+
+
+class Sampler(object):
+    """Samples the Python stacks of the other threads at a fixed interval"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()  # Count of each collapsed stack
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename),
+                                                     code.co_firstlineno))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self, path):
+        """Stops sampling and writes the collapsed stacks"""
+        self._stop.set()
+        self._thread.join()
+        with open(path, "w") as output:
+            for stack, count in self.stacks.most_common():
+                output.write("{} {}\n".format(stack, count))
+
+
+def summarize(timings):
+    """Gives the count and the latency percentiles of a list of seconds, in milliseconds"""
+    if not timings:
+        return {"count": 0}
+    milliseconds = np.array(timings) * 1000
+    p50, p90, p99 = np.percentile(milliseconds, (50, 90, 99))
+    return {"count": len(timings), "p50": p50, "p90": p90, "p99": p99, "max": float(milliseconds.max())}
+
+
+def serve(args):
+    """Runs the API under waitress until SIGINT or SIGTERM, then saves the statistics"""
+    import waitress
+
+    sys.path.insert(0, WEB_PATH)
+    import api
+
+    with api.app.app_context():
+        api.db.create_all()
+        database = DatabaseStats()
+        database.attach(api.db.engine)
+    if args.sessions:
+        api.session_manager()  # Warms the trackers up before the load, like the server does
+    queue = QueueStats()
+    logger = logging.getLogger("waitress.queue")
+    logger.addHandler(queue)
+    logger.propagate = False
+
+    sampler = None
+    if args.profile:
+        sampler = Sampler(args.profile_interval)
+        sampler.start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        waitress.serve(api.app, host="127.0.0.1", port=args.port, threads=args.threads, _quiet=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with open(args.stats, "w") as output:
+            json.dump(dict(database.summary(), queued=queue.warnings, queue_depth=queue.depth), output)
+        if sampler is not None:
+            sampler.stop(args.profile)
+
+
+class Client(object):
+    """A persistent HTTP connection to the server"""
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        """Sends a request and gives its status (0 on a connection error)"""
+        headers = {}
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        elif body is not None:
+            headers["Content-Type"] = "image/jpeg"
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            self.last_body = response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection = None
+            return 0
+
+
+class Workload(object):
+    """The requests of the readers and the writers, on the seeded users"""
+
+    def __init__(self, users, seed):
+        self.users = users
+        self.random = random.Random(seed)
+        self.count = 0
+
+    def page(self, client):
+        return client.request("GET", "/api/users/?after={}&limit=50".format(self.random.randint(0, self.users)))
+
+    def lookup(self, client):
+        return client.request("GET", "/api/users/?email=user{}@example.com".format(self.random.randint(1, self.users)))
+
+    def statistics(self, client):
+        return client.request("GET", "/api/users/{}/statistics?days=7".format(self.random.randint(1, self.users)))
+
+    def create(self, client):
+        self.count += 1
+        name = "load{}-{}-{}".format(id(self), self.count, self.random.random())
+        return client.request("POST", "/api/users/", {"name": name, "email": name + "@example.com"})
+
+    def events(self, client):
+        now = time.time()
+        events = [{"t": now - 60 + second, "dir": self.random.choice((1, 2, 2, 2, 3)),
+                   "distraction": self.random.random(), "blink": self.random.random() < 0.1}
+                  for second in range(60)]  # A minute of study
+        return client.request("POST", "/api/users/{}/gaze-events".format(self.random.randint(1, self.users)),
+                              {"events": events})
+
+
+def parse_mix(text):
+    """Reads a mix like "page=3,lookup=1" as names and weights"""
+    names, weights = [], []
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        names.append(name.strip())
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def worker(port, users, mix, deadline, seed, results):
+    """Sends requests of the mix until the deadline"""
+    client = Client(port)
+    workload = Workload(users, seed)
+    names, weights = mix
+    while time.perf_counter() < deadline:
+        name = workload.random.choices(names, weights)[0]
+        start = time.perf_counter()
+        status = getattr(workload, name)(client)
+        results.append((name, time.perf_counter() - start, status))
+
+
+def session_worker(port, frames, fps, deadline, results):
+    """Streams JPEG frames to a gaze session until the deadline"""
+    client = Client(port)
+    start = time.perf_counter()
+    status = client.request("POST", "/api/gaze/sessions/")
+    results.append(("session_open", time.perf_counter() - start, status))
+    if status != 201:
+        return
+    session = json.loads(client.last_body)["session"]
+
+    index = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status = client.request("POST", "/api/gaze/sessions/{}/frames".format(session), frames[index % len(frames)])
+        results.append(("session_frame", time.perf_counter() - start, status))
+        index += 1
+        time.sleep(max(0.0, 1 / fps - (time.perf_counter() - start)))
+    client.request("DELETE", "/api/gaze/sessions/{}".format(session))
+
+
+def synthetic_jpegs(count):
+    """Encodes gray noise frames as JPEG, for the session endpoints"""
+    import cv2
+
+    rng = np.random.RandomState(0)
+    return [cv2.imencode(".jpg", rng.randint(0, 255, (480, 640, 3), np.uint8))[1].tobytes() for _ in range(count)]
+
+
+def free_port():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+def wait_for(port, timeout=30.0):
+    """Waits until the server accepts connections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("The server didn't start")
+
+
+def seed(port, users):
+    """Creates the users, and a few minutes of gaze events for some of them"""
+    client = Client(port)
+    for first in range(1, users + 1, 1000):
+        batch = [{"name": "user{}".format(number), "email": "user{}@example.com".format(number)}
+                 for number in range(first, min(first + 1000, users + 1))]
+        if client.request("POST", "/api/users/bulk", {"users": batch}) != 201:
+            raise RuntimeError("Seeding the users failed")
+    workload = Workload(users, 0)
+    for _ in range(min(users, 200)):
+        workload.events(client)
+
+
+def print_report(results, duration, database):
+    by_name = collections.defaultdict(list)
+    errors = collections.defaultdict(collections.Counter)
+    for name, seconds, status in results:
+        by_name[name].append(seconds)
+        if not 200 <= status < 300:
+            errors[name][status] += 1
+
+    print("\n{:<15} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}  {}".format(
+        "request", "count", "req/s", "p50 ms", "p90 ms", "p99 ms", "max ms", "errors"))
+    for name, timings in sorted(by_name.items()):
+        summary = summarize(timings)
+        print("{:<15} {:>8} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}  {}".format(
+            name, summary["count"], summary["count"] / duration, summary["p50"], summary["p90"], summary["p99"],
+            summary["max"], dict(errors[name]) or ""))
+    total = sum(len(timings) for timings in by_name.values())
+    print("{:<15} {:>8} {:>9.1f}".format("total", total, total / duration))
+
+    print("\n{:<15} {:>8} {:>9} {:>9} {:>9} {:>9}".format("SQL statement", "count", "p50 ms", "p90 ms", "p99 ms",
+                                                         "max ms"))
+    for kind, summary in sorted(database["statements"].items()):
+        print("{:<15} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+            kind, summary["count"], summary["p50"], summary["p90"], summary["p99"], summary["max"]))
+    print("'database is locked' errors: {}".format(database["locked"]))
+    print("requests queued for a server thread: {} times, {} at most".format(database["queued"],
+                                                                           database["queue_depth"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark of the Flask API under waitress.")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent clients sending reads")
+    parser.add_argument("--writers", type=int, default=2, help="Concurrent clients sending writes")
+    parser.add_argument("--sessions", type=int, default=0, help="Concurrent gaze sessions streaming frames (needs dlib)")
+    parser.add_argument("--session-fps", type=float, default=10.0, help="Frames per second of each session")
+    parser.add_argument("--read-mix", default="page=3,lookup=2,statistics=2", help="Reads and their weights")
+    parser.add_argument("--write-mix", default="create=1,events=3", help="Writes and their weights")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--users", type=int, default=5000, help="Users created before the load")
+    parser.add_argument("--threads", type=int, default=4, help="Threads of the waitress server")
+    parser.add_argument("--profile", help="Sample the server stacks into this collapsed stacks file")
+    parser.add_argument("--profile-interval", type=float, default=0.005, help="Seconds between two samples")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--stats", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    directory = tempfile.mkdtemp()
+    port = free_port()
+    stats = os.path.join(directory, "stats.json")
+    environment = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(directory, "load.db"))
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--stats", stats,
+               "--threads", str(args.threads), "--sessions", str(args.sessions)]
+    if args.profile:
+        command += ["--profile", os.path.abspath(args.profile), "--profile-interval", str(args.profile_interval)]
+
+    server = subprocess.Popen(command, env=environment, cwd=WEB_PATH)
+    try:
+        wait_for(port)
+        print("server pid {} on port {}, {} threads, database {}".format(server.pid, port, args.threads, directory))
+        seed(port, args.users)
+
+        results = []
+        deadline = time.perf_counter() + args.duration
+        read_mix, write_mix = parse_mix(args.read_mix), parse_mix(args.write_mix)
+        threads = [threading.Thread(target=worker, args=(port, args.users, read_mix, deadline, index, results))
+                   for index in range(args.readers)]
+        threads += [threading.Thread(target=worker, args=(port, args.users, write_mix, deadline, 1000 + index,
+                                                          results))
+                    for index in range(args.writers)]
+        if args.sessions:
+            frames = synthetic_jpegs(30)
+            threads += [threading.Thread(target=session_worker, args=(port, frames, args.session_fps, deadline,
+                                                                      results))
+                        for _ in range(args.sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait(30)
+
+    with open(stats) as saved:
+        database = json.load(saved)
+    print_report(results, args.duration, database)
+    if args.profile:
+        print("\nserver profile written to " + args.profile)
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
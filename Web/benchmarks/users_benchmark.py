@@ -0,0 +1,111 @@
+"""
+Benchmark of the Users API as the table grows.
+
+It fills a temporary SQLite database with users and, at each table size,
+times the requests of the Users API through the Flask test client: first
+the reads (the first page and a page deep in the table, a lookup by email,
+the streamed export), then the writes (a single and a bulk creation), which
+grow the table. For comparison it also times the old behavior of
+GET /api/users/, which marshaled every row.
+
+Usage:
+    python benchmarks/users_benchmark.py --sizes 1000 10000 100000 1000000
+"""
+import argparse  # To read the command line arguments
+import os  # To handle file paths
+import shutil  # To remove the temporary database
+import sys  # To import the API
+import tempfile  # For the temporary database
+import time  # For the timings
+import numpy as np  # For the percentiles
+from flask_restful import marshal  # For the old full listing
+
+WEB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentiles(request, count):
+    """Runs request(index) count times and gives the p50 and p99 latencies in milliseconds"""
+    timings = []
+    for index in range(count):
+        start = time.perf_counter()
+        response = request(index)
+        timings.append(time.perf_counter() - start)
+        if response is not None and response.status_code >= 400:
+            raise RuntimeError("Request failed with {}".format(response.status_code))
+    return np.percentile(np.array(timings) * 1000, (50, 99))
+
+
+def fill(api, start, stop):
+    """Inserts the users numbered from start to stop"""
+    for first in range(start, stop, 10000):
+        rows = [{"name": "user{}".format(number), "email": "user{}@example.com".format(number)}
+                for number in range(first, min(first + 10000, stop))]
+        api.db.session.execute(api.insert(api.UserModel.__table__), rows)
+        api.db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Users API against the size of the table.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="Table sizes")
+    parser.add_argument("--requests", type=int, default=200, help="Requests timed per measure")
+    parser.add_argument("--legacy-limit", type=int, default=100000, help="Largest table for the old full listing")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "benchmark.db")
+    sys.path.insert(0, WEB_PATH)
+    import api  # Imported here so the API opens the temporary database
+
+    client = api.app.test_client()
+    rows = []
+    with api.app.app_context():
+        api.db.create_all()
+        filled = 0  # Users inserted by fill(), the creation requests add the others
+        for target in sorted(args.sizes):
+            missing = target - api.UserModel.query.count()
+            fill(api, filled, filled + missing)
+            filled += missing
+            middle = target // 2
+            results = {
+                "first page": percentiles(lambda index: client.get("/api/users/?limit=50"), args.requests),
+                "deep page": percentiles(lambda index: client.get(
+                    "/api/users/?after={}&limit=50".format(middle + index)), args.requests),
+                "email lookup": percentiles(lambda index: client.get(
+                    "/api/users/?email=user{}@example.com".format(index * 7919 % filled)), args.requests),
+            }
+
+            if target <= args.legacy_limit:
+                results["old full list"] = percentiles(
+                    lambda index: marshal(api.UserModel.query.all(), api.userFields) and None, 5)
+
+            start = time.perf_counter()
+            response = client.get("/api/users/export")
+            exported = response.data.count(b'"id"')
+            export_seconds = time.perf_counter() - start
+
+            def create(index):
+                number = "new{}-{}".format(target, index)
+                return client.post("/api/users/", json={"name": number, "email": number + "@example.com"})
+            results["create"] = percentiles(create, args.requests)
+
+            def bulk(index):
+                users = [{"name": "bulk{}-{}-{}".format(target, index, number),
+                          "email": "bulk{}-{}-{}@example.com".format(target, index, number)} for number in range(500)]
+                return client.post("/api/users/bulk", json={"users": users})
+            results["bulk 500"] = percentiles(bulk, 10)
+
+            for name, (p50, p99) in results.items():
+                rows.append((target, name, p50, p99))
+            rows.append((target, "export", export_seconds * 1000, exported / export_seconds))
+
+    print("{:>9} {:<14} {:>10} {:>10}".format("users", "request", "p50 ms", "p99 ms"))
+    for target, name, first, second in rows:
+        if name == "export":
+            print("{:>9} {:<14} {:>10.1f} {:>10} ({:.0f} users/s)".format(target, name, first, "", second))
+        else:
+            print("{:>9} {:<14} {:>10.3f} {:>10.3f}".format(target, name, first, second))
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
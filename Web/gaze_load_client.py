@@ -0,0 +1,133 @@
+"""
+Synthetic load client of the gaze streaming endpoints of api.py.
+
+Every simulated student opens a session and sends the frames of a recorded
+video (or folder of images) as JPEG images at a fixed rate, like the web
+front end would. At the end it reports the request latencies, the frames
+dropped by the server and the frames it analyzed.
+
+Usage:
+    python api.py
+    python gaze_load_client.py session.mp4 --sessions 4 --fps 15 --duration 30
+"""
+import argparse  # To read the command line arguments
+import json  # For the responses
+import os  # To handle file paths
+import threading  # One thread per simulated student
+import time  # To pace the frames
+import urllib.error  # For the refused sessions
+import urllib.request  # To send the requests without extra dependencies
+import cv2  # To read and encode the frames
+import numpy as np  # For the percentiles
+
+
+def load_jpegs(source, limit, quality):
+    """Reads the frames of a video or a folder of images, encoded as JPEG"""
+    if os.path.isdir(source):
+        frames = (cv2.imread(os.path.join(source, name)) for name in sorted(os.listdir(source))[:limit])
+    else:
+        def read_video():
+            video = cv2.VideoCapture(source)
+            for _ in range(limit):
+                ok, frame = video.read()
+                if not ok:
+                    break
+                yield frame
+            video.release()
+        frames = read_video()
+
+    jpegs = []
+    for frame in frames:
+        if frame is not None:
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                jpegs.append(encoded.tobytes())
+    return jpegs
+
+
+def call(url, method="GET", data=None, headers=None):
+    """Sends a request and gives the decoded JSON response"""
+    request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def student(base_url, jpegs, fps, duration, user_id, results):
+    """Streams the frames of one session and records what happened"""
+    record = {"latencies": [], "errors": 0, "refused": False, "status": None}
+    results.append(record)
+    try:
+        session = call("{}/api/gaze/sessions/?user_id={}".format(base_url, user_id), "POST")["session"]
+    except urllib.error.HTTPError as error:
+        record["refused"] = error.code == 503
+        return
+
+    frames_url = "{}/api/gaze/sessions/{}/frames".format(base_url, session)
+    start = time.perf_counter()
+    index = 0
+    while time.perf_counter() - start < duration:
+        due = start + index / fps
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        sent = time.perf_counter()
+        try:
+            call(frames_url, "POST", jpegs[index % len(jpegs)],
+                 {"Content-Type": "image/jpeg", "X-Frame-Timestamp": "{:.6f}".format(sent - start)})
+            record["latencies"].append(time.perf_counter() - sent)
+        except (urllib.error.URLError, OSError):
+            record["errors"] += 1
+        index += 1
+
+    time.sleep(0.5)  # Let the last frames be analyzed
+    record["status"] = call("{}/api/gaze/sessions/{}".format(base_url, session), "DELETE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the gaze streaming endpoints.")
+    parser.add_argument("frames", help="Recorded video or folder of images to send")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Address of the API")
+    parser.add_argument("--sessions", type=int, default=4, help="Simulated students streaming at the same time")
+    parser.add_argument("--fps", type=float, default=15.0, help="Frames sent per second by each student")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of streaming")
+    parser.add_argument("--count", type=int, default=300, help="Frames read from the recording")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality")
+    args = parser.parse_args()
+
+    jpegs = load_jpegs(args.frames, args.count, args.quality)
+    if not jpegs:
+        parser.error("No frames could be read from " + args.frames)
+    print("{} frames, {:.1f} KB per JPEG".format(len(jpegs), np.mean([len(jpeg) for jpeg in jpegs]) / 1024))
+
+    results = []
+    threads = [threading.Thread(target=student, args=(args.url.rstrip("/"), jpegs, args.fps, args.duration,
+                                                     user_id, results))
+               for user_id in range(1, args.sessions + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    refused = sum(record["refused"] for record in results)
+    statuses = [record["status"] for record in results if record["status"]]
+    latencies = np.array([latency for record in results for latency in record["latencies"]]) * 1000
+    received = sum(status["received"] for status in statuses)
+    analyzed = sum(status["analyzed"] for status in statuses)
+    dropped = sum(status["dropped"] for status in statuses)
+
+    print("sessions: {} streamed, {} refused".format(len(statuses), refused))
+    print("requests: {} sent, {} errors".format(len(latencies), sum(record["errors"] for record in results)))
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+        print("request latency: p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms".format(p50, p90, p99))
+    if received:
+        print("frames: {} received, {} analyzed ({:.1f} fps per session), {} dropped ({:.0%})".format(
+            received, analyzed, analyzed / len(statuses) / args.duration, dropped, dropped / received))
+        lags = [status["lag_ms"] for status in statuses if status["lag_ms"] is not None]
+        if lags:
+            print("analysis lag: {:.1f} ms on average".format(np.mean(lags)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Gaze tracking of the study sessions streamed by the web front end.
+
+Each session sends its webcam frames as JPEG images. The request thread only
+queues the bytes: a worker thread per session decodes them and runs the
+session's GazeTracking. The trackers come from a bounded pool, created and
+warmed up in the background when the manager starts, so a session doesn't
+pay for loading the dlib models. When a session sends frames faster than
+they are analyzed, its oldest waiting frames are dropped, so the results
+stay close to real time. A frame whose analysis fails is counted and
+skipped; a session whose analysis keeps failing stops, and its tracker is
+replaced.
+"""
+import collections  # For the queues of waiting frames
+import os  # To find the eye tracking package
+import sys  # To import the eye tracking package
+import threading  # For the analysis threads
+import time  # For the timestamps and the idle sessions
+import uuid  # For the session ids
+
+# The eye tracking package is next to the API, not installed
+EYE_TRACKING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ALQAWSI-EyeTracking")
+if EYE_TRACKING_PATH not in sys.path:
+    sys.path.insert(0, EYE_TRACKING_PATH)
+
+
+def compact_result(sample, frame_number):
+    """Gives the results of a frame as a small dict for the JSON responses.
+
+    Keys: n (frame number), t (timestamp), face (face found), dir (0 unknown,
+    1 right, 2 center, 3 left), h and v (gaze ratios), blink (eyes closed).
+    """
+    return {
+        "n": frame_number,
+        "t": sample.timestamp,
+        "face": sample.face_found,
+        "dir": sample.direction.value,
+        "h": None if sample.horizontal_ratio is None else round(sample.horizontal_ratio, 3),
+        "v": None if sample.vertical_ratio is None else round(sample.vertical_ratio, 3),
+        "blink": sample.blinking,
+    }
+
+
+class TrackerPool(object):
+    """
+    This class holds a bounded number of GazeTracking instances, created and
+    warmed up once. A tracker given back keeps its calibration, and goes
+    preferably to the next session of the same user; otherwise it is reset.
+    While warm_up() runs, the sessions opened wait for its trackers.
+    """
+
+    WARM_UP_SIZE = (640, 480)  # Size of the blank frame analyzed by each new tracker
+
+    def __init__(self, size=4, tracker_options=None):
+        """
+        Args:
+            size (int): Maximum number of trackers, so of sessions analyzed at the same time
+            tracker_options (dict): Arguments of GazeTracking
+        """
+        self.size = size
+        self.tracker_options = tracker_options or {}
+        self._idle = []  # Free trackers, as (last user, tracker), the most recently used last
+        self._created = 0  # Trackers created or being created
+        self._warming = 0  # Trackers being created by warm_up()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)  # Notified when warm_up() created a tracker
+
+    def _create(self):
+        """Creates a tracker and runs it once, so the first real frame is not slower"""
+        import numpy as np  # For the blank frame, imported here so the API starts without NumPy
+        from gaze_tracking import GazeTracking  # Imported here so the API starts without dlib
+
+        tracker = GazeTracking(**self.tracker_options)
+        width, height = self.WARM_UP_SIZE
+        tracker.refresh(np.zeros((height, width, 3), np.uint8))
+        tracker.reset()
+        return tracker
+
+    def warm_up(self):
+        """Creates all the trackers now, instead of on the first sessions"""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+                self._warming += 1
+
+            tracker = None
+            try:
+                tracker = self._create()
+            finally:
+                with self._lock:
+                    self._warming -= 1
+                    if tracker is None:
+                        self._created -= 1  # acquire() will try again
+                    else:
+                        self._idle.insert(0, (None, tracker))
+                    self._ready.notify_all()
+
+    def acquire(self, user=None):
+        """Gives a free tracker, or None if all of them are in use.
+
+        Args:
+            user: Who the session is for, to reuse the calibration of their last session
+        """
+        with self._lock:
+            while True:
+                for index in range(len(self._idle) - 1, -1, -1):
+                    if user is not None and self._idle[index][0] == user:
+                        tracker = self._idle.pop(index)[1]
+                        tracker.reset(keep_calibration=True)  # Still calibrated for this user
+                        return tracker
+                if self._idle:
+                    tracker = self._idle.pop(0)[1]  # The least recently used one
+                    tracker.reset()
+                    return tracker
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                if not self._warming:
+                    return None
+                self._ready.wait()  # A tracker being warmed up will be free soon
+
+        try:
+            return self._create()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, tracker, user=None):
+        """Gives a tracker back to the pool"""
+        with self._lock:
+            self._idle.append((user, tracker))
+
+    def discard(self, tracker):
+        """Forgets a tracker that failed, so that a new one is created in its place"""
+        with self._lock:
+            self._created -= 1
+
+    def available(self):
+        """Gives the number of sessions that can still be opened"""
+        with self._lock:
+            return len(self._idle) + self.size - self._created
+
+
+class GazeStream(object):
+    """
+    This class is one study session streaming frames. Its thread decodes and
+    analyzes the waiting frames in order, keeping at most queue_size of them:
+    a new frame arriving on a full queue drops the oldest one. After
+    MAX_ERRORS analyses failed in a row, the thread stops and the session is
+    no longer alive.
+    """
+
+    MAX_ERRORS = 10  # Analyses failing in a row after which the session stops
+
+    def __init__(self, session_id, tracker, user=None, queue_size=2):
+        self.id = session_id
+        self.user = user
+        self.tracker = tracker
+        self.received = 0  # Frames received
+        self.analyzed = 0  # Frames analyzed
+        self.dropped = 0  # Frames dropped because the analysis was behind
+        self.failed = 0  # Frames that couldn't be decoded or analyzed
+        self.error = None  # The last analysis error, as text
+        self.alive = True  # False once the analysis stopped after too many errors
+        self.lag = None  # Running seconds between receiving a frame and its results
+        self.result = None  # Compact results of the last analyzed frame
+        self.last_seen = time.monotonic()  # When the last frame was received
+
+        self._frames = collections.deque(maxlen=queue_size)  # Waiting (number, JPEG bytes, timestamp, received)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="gaze-" + session_id, daemon=True)
+        self._thread.start()
+
+    def submit(self, data, timestamp=None):
+        """Queues a JPEG frame for analysis.
+
+        Args:
+            data (bytes): The JPEG image
+            timestamp (float): When the frame was captured, in seconds (default: when it was received)
+
+        Returns:
+            int: The number of the frame in the session, or None if the session is no longer alive
+        """
+        received = time.monotonic()
+        with self._condition:
+            if not self.alive:
+                return None
+            self.received += 1
+            self.last_seen = received
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1  # The deque drops the oldest frame
+            self._frames.append((self.received, data, received if timestamp is None else timestamp, received))
+            self._condition.notify()
+            return self.received
+
+    def _run(self):
+        """Analyzes the waiting frames until the session is closed"""
+        import cv2  # To decode the JPEG frames, imported here so the API starts without OpenCV
+        import numpy as np  # To wrap the JPEG bytes
+
+        errors = 0  # Analyses failed in a row
+        while True:
+            with self._condition:
+                while not self._frames and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                number, data, timestamp, received = self._frames.popleft()
+
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                self.failed += 1
+                continue
+
+            try:
+                sample = self.tracker.refresh(frame, timestamp)
+            except Exception as exception:
+                self.failed += 1
+                self.error = "{}: {}".format(type(exception).__name__, exception)
+                errors += 1
+                if errors >= self.MAX_ERRORS:
+                    with self._condition:
+                        self.alive = False
+                        self._frames.clear()
+                    return
+                continue
+            errors = 0
+
+            lag = time.monotonic() - received
+            self.lag = lag if self.lag is None else self.lag + 0.1 * (lag - self.lag)
+            self.analyzed += 1
+            self.result = compact_result(sample, number)
+
+    def close(self):
+        """Stops the analysis, waiting for the frame being analyzed"""
+        with self._condition:
+            self._closed = True
+            self._frames.clear()
+            self._condition.notify()
+        self._thread.join()
+
+    def status(self):
+        """Gives the counters of the session and its last results"""
+        history = self.tracker.history
+        status = {
+            "session": self.id,
+            "received": self.received,
+            "analyzed": self.analyzed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "alive": self.alive,
+            "error": self.error,
+            "lag_ms": None if self.lag is None else round(self.lag * 1000, 1),
+            "gaze": self.result,
+        }
+        if history is not None and history.samples:
+            status["blink_rate"] = history.blink_rate()
+            status["off_center"] = history.off_center_fraction()
+            status["distraction"] = history.distraction
+        return status
+
+
+class SessionManager(object):
+    """
+    This class opens and closes the streaming sessions. Its trackers are
+    warmed up by a background thread as soon as it starts. Sessions that didn't
+    send a frame for idle_timeout seconds are closed, giving their tracker back,
+    when another session is opened or looked up, and by a background thread
+    checking every idle_timeout / 2 seconds.
+    """
+
+    def __init__(self, pool_size=4, queue_size=2, idle_timeout=60.0, tracker_options=None):
+        """
+        Args:
+            pool_size (int): Maximum number of sessions analyzed at the same time
+            queue_size (int): Frames waiting per session before the oldest ones are dropped
+            idle_timeout (float): Seconds without frames after which a session is closed
+            tracker_options (dict): Arguments of GazeTracking
+        """
+        self.pool = TrackerPool(pool_size, tracker_options)
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._warm_up = threading.Thread(target=self.pool.warm_up, name="gaze-sessions-warm-up", daemon=True)
+        self._warm_up.start()
+        self._reaper = threading.Thread(target=self._expire_loop, name="gaze-sessions-expiry", daemon=True)
+        self._reaper.start()
+
+    def _expire_loop(self):
+        """Closes the idle sessions regularly, even when no request comes"""
+        while not self._stop.wait(self.idle_timeout / 2):
+            self.expire()
+
+    def shutdown(self):
+        """Stops the expiry thread and closes every session"""
+        self._stop.set()
+        with self._lock:
+            session_ids = list(self._sessions)
+        for session_id in session_ids:
+            self.close(session_id)
+
+    def open(self, user=None):
+        """Starts a session, or gives None if all the trackers are in use"""
+        self.expire()
+        tracker = self.pool.acquire(user)
+        if tracker is None:
+            return None
+
+        session = GazeStream(uuid.uuid4().hex, tracker, user, self.queue_size)
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        """Gives an open session, or None"""
+        self.expire()
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        """Ends a session and gives its final status, or None if it is not open"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+
+        session.close()
+        status = session.status()
+        if session.alive:
+            self.pool.release(session.tracker, session.user)
+        else:
+            self.pool.discard(session.tracker)  # Its state may be broken
+        return status
+
+    def expire(self):
+        """Closes the sessions that stopped sending frames"""
+        limit = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items() if session.last_seen < limit]
+        for session_id in idle:
+            self.close(session_id)
@@ -0,0 +1,32 @@
+"""
+Fixtures of the API tests: the Flask test client, on an empty SQLite database.
+"""
+import os  # To choose the database and import the API
+import sys  # To import the API from the repository
+import tempfile  # For the database file
+import pytest  # For the fixtures
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DATABASE  # Read when the API is imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import api  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """Gives a test client on empty tables"""
+    with api.app.app_context():
+        api.db.create_all()
+    yield api.app.test_client()
+    with api.app.app_context():
+        api.db.session.remove()
+        api.db.drop_all()
+
+
+@pytest.fixture
+def user_id(client):
+    """Creates a user and gives their id"""
+    response = client.post("/api/users/", json={"name": "ada", "email": "ada@example.com"})
+    assert response.status_code == 201
+    return response.get_json()["id"]
@@ -0,0 +1,97 @@
+"""
+Checks the ingestion of gaze events and the daily statistics rollups.
+"""
+from datetime import datetime, timedelta, timezone  # For the day boundaries
+import pytest  # For the parametrized payloads
+
+import api
+
+EASTERN = timezone(timedelta(hours=-5))  # A time zone where the UTC day changes in the evening
+
+
+def event(t, direction=2, distraction=0.0, **extra):
+    """Builds one gaze event of a request"""
+    return dict(t=t, dir=direction, distraction=distraction, **extra)
+
+
+def post_events(client, user_id, events):
+    return client.post("/api/users/{}/gaze-events".format(user_id), json={"events": events})
+
+
+@pytest.mark.parametrize("events", [
+    [event(1e9, blink="false")],  # A string is not a JSON boolean, even "false"
+    [event(1e9, blink=0)],
+    [event(1e9, direction=9)],  # Not a Direction
+    [event(float("nan"))],
+    [event(1e9, distraction=float("inf"))],
+    [event(1e9, duration=-1.0)],
+    [event("soon")],
+    [{"dir": 2, "distraction": 0.0}],  # No timestamp
+    ["not an event"],
+])
+def test_bad_events_are_refused(client, user_id, events):
+    response = post_events(client, user_id, [event(1e9)] + events)
+    assert response.status_code == 400
+    with api.app.app_context():
+        assert api.GazeEventModel.query.count() == 0  # Nothing of the batch is stored
+        assert api.DailyStatsModel.query.count() == 0
+
+
+@pytest.mark.parametrize("body", [None, {"events": "all of them"}, {"events": {"t": 1}}])
+def test_bad_body_is_refused(client, user_id, body):
+    assert client.post("/api/users/{}/gaze-events".format(user_id), json=body).status_code == 400
+
+
+def test_unknown_user(client):
+    assert post_events(client, 999, [event(1e9)]).status_code == 404
+    assert client.get("/api/users/999/statistics").status_code == 404
+
+
+def test_days_are_utc_days(client, user_id):
+    # In New York, both events are on the same evening, but 23:30 is already the next day in UTC
+    today = datetime.now(timezone.utc).date()
+    evening = datetime(today.year, today.month, today.day, tzinfo=EASTERN) - timedelta(days=1)
+    early, late = evening + timedelta(hours=18, minutes=30), evening + timedelta(hours=23, minutes=30)
+    assert early.astimezone(timezone.utc).date() == today - timedelta(days=1)
+    assert late.astimezone(timezone.utc).date() == today
+
+    response = post_events(client, user_id, [event(early.timestamp(), duration=60.0),
+                                             event(late.timestamp(), duration=120.0)])
+    assert response.status_code == 201
+
+    days = client.get("/api/users/{}/statistics".format(user_id)).get_json()["days"]
+    assert [day["day"] for day in days] == [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+    assert [day["study_hours"] for day in days] == [round(60 / 3600, 3), round(120 / 3600, 3)]
+
+
+def test_rollups_add_up_the_events(client, user_id):
+    day = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+    start = day.timestamp()
+    events = [
+        event(start, direction=2, distraction=0.1, duration=600.0, blink=False),  # Low distraction
+        event(start + 600, direction=3, distraction=0.5, duration=300.0, blink=True),  # Medium, away
+        event(start + 900, direction=1, distraction=0.9, duration=100.0, blink=None),  # High, away
+        event(start + 1000, direction=2, distraction=1.5, duration=200.0),  # Clamped to 1.0
+    ]
+    # Sent in two requests, so that the second one adds to the rollup of the first
+    assert post_events(client, user_id, events[:2]).get_json() == {"inserted": 2}
+    assert post_events(client, user_id, events[2:]).get_json() == {"inserted": 2}
+
+    with api.app.app_context():
+        rollup = api.db.session.get(api.DailyStatsModel, (user_id, day.date()))
+        assert rollup.samples == 4
+        assert rollup.study_seconds == 1200.0
+        assert rollup.away_seconds == 400.0
+        assert rollup.blinking_seconds == 300.0
+        assert rollup.distraction_sum == pytest.approx(0.1 * 600 + 0.5 * 300 + 0.9 * 100 + 1.0 * 200)
+        assert (rollup.low_distraction_seconds, rollup.medium_distraction_seconds,
+                rollup.high_distraction_seconds) == (600.0, 300.0, 300.0)
+        blinks = [row.blinking for row in api.GazeEventModel.query.order_by(api.GazeEventModel.timestamp)]
+        assert blinks == [False, True, None, None]
+
+    statistics = client.get("/api/users/{}/statistics?days=1".format(user_id)).get_json()
+    assert statistics["study_hours"] == round(1200 / 3600, 3)
+    assert statistics["days"] == [{"day": day.date().isoformat(), "study_hours": round(1200 / 3600, 3),
+                                   "away_fraction": round(400 / 1200, 3),
+                                   "distraction": round(500 / 1200, 3)}]
+    assert statistics["distraction_levels"] == {"low": 0.5, "medium": 0.25, "high": 0.25}
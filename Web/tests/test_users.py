@@ -0,0 +1,87 @@
+"""
+Checks the pagination, lookup, export and bulk creation of the Users API.
+"""
+import pytest  # For the parametrized limits
+
+import api
+
+
+def create_users(client, count, first=1):
+    users = [{"name": "user{}".format(number), "email": "user{}@example.com".format(number)}
+             for number in range(first, first + count)]
+    response = client.post("/api/users/bulk", json={"users": users})
+    assert response.status_code == 201
+    return response.get_json()["ids"]
+
+
+def all_pages(client, limit):
+    """Follows the Link headers from the first page, and gives the ids of each page"""
+    pages = []
+    url = "/api/users/?limit={}".format(limit)
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([user["id"] for user in response.get_json()])
+        link = response.headers.get("Link")
+        url = None if link is None else link[link.index("/api/"):link.index(">")]
+    return pages
+
+
+def test_pages_follow_the_ids(client):
+    ids = create_users(client, 5)
+    assert all_pages(client, 2) == [ids[0:2], ids[2:4], ids[4:5]]
+    assert all_pages(client, 5) == [ids, []]  # A full last page still links to the next, empty one
+    assert all_pages(client, 6) == [ids]
+
+
+def test_page_after_a_cursor(client):
+    ids = create_users(client, 5)
+    response = client.get("/api/users/?after={}&limit=2".format(ids[1]))
+    assert [user["id"] for user in response.get_json()] == ids[2:4]
+    assert 'after={}&limit=2>; rel="next"'.format(ids[3]) in response.headers["Link"]
+    assert client.get("/api/users/?after={}".format(ids[-1])).get_json() == []
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=-1", "limit={}".format(api.MAX_PAGE_SIZE + 1), "limit=ten",
+                                   "after=first"])
+def test_bad_page_arguments(client, query):
+    create_users(client, 3)
+    assert client.get("/api/users/?" + query).status_code == 400
+
+
+def test_lookup_by_email(client):
+    ids = create_users(client, 3)
+    assert client.get("/api/users/?email=user2@example.com").get_json() == [
+        {"id": ids[1], "name": "user2", "email": "user2@example.com"}]
+    assert client.get("/api/users/?email=nobody@example.com").get_json() == []
+
+
+def test_bulk_with_a_used_email_creates_nobody(client):
+    create_users(client, 2)
+    used = {"users": [{"name": "new1", "email": "new1@example.com"}, {"name": "new2", "email": "user1@example.com"}]}
+    twice = {"users": [{"name": "new3", "email": "same@example.com"}, {"name": "new4", "email": "same@example.com"}]}
+    assert client.post("/api/users/bulk", json=used).status_code == 409
+    assert client.post("/api/users/bulk", json=twice).status_code == 409
+    with api.app.app_context():
+        assert api.UserModel.query.count() == 2
+
+
+@pytest.mark.parametrize("body", [None, {"users": []}, {"users": [{"name": "no email"}]}, {"users": ["ada"]}])
+def test_bad_bulk_body(client, body):
+    assert client.post("/api/users/bulk", json=body).status_code == 400
+
+
+@pytest.mark.parametrize("count", [6, 7])  # The last chunk full, or not
+def test_export_matches_the_table(client, monkeypatch, count):
+    monkeypatch.setattr(api, "EXPORT_CHUNK", 3)
+    create_users(client, count)
+    exported = client.get("/api/users/export").get_json()
+    with api.app.app_context():
+        table = [{"id": user.id, "name": user.name, "email": user.email}
+                 for user in api.UserModel.query.order_by(api.UserModel.id)]
+    assert len(table) == count
+    assert exported == table
+
+
+def test_export_of_no_users(client):
+    assert client.get("/api/users/export").get_json() == []
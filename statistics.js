@@ -37,4 +37,30 @@ document.addEventListener('DOMContentLoaded', function () {
             }
         }
     });
+
+    // Show the statistics of the signed-in user, computed from their gaze tracking sessions
+    var userId = new URLSearchParams(window.location.search).get('user');
+    if (userId) {
+        fetch('/api/users/' + encodeURIComponent(userId) + '/statistics?days=7')
+            .then(function (response) { return response.ok ? response.json() : null; })
+            .then(function (statistics) {
+                if (!statistics || !statistics.days.length) {
+                    return;
+                }
+                var levels = statistics.distraction_levels;
+                donutChart.data.datasets[0].data = [levels.low, levels.high, levels.medium].map(function (level) {
+                    return Math.round(level * 100);
+                });
+                donutChart.update();
+
+                barChart.data.labels = statistics.days.map(function (day) {
+                    return new Date(day.day + 'T00:00:00').toLocaleDateString('ar', { weekday: 'long' });
+                });
+                barChart.data.datasets[0].data = statistics.days.map(function (day) {
+                    return Math.round(day.study_hours * 10) / 10;
+                });
+                barChart.update();
+            })
+            .catch(function () {});
+    }
 });